@@ -12,9 +12,157 @@ class Settings(BaseModel):
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     openai_temperature: float = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
 
+    # Chat session history: "memory" (per process) or "sqlite" (shared by workers)
+    session_backend: str = os.getenv("SESSION_BACKEND", "memory")
+    session_db_path: str = os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite3")
+    session_ttl_seconds: float = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    session_max_sessions: int = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    session_max_messages: int = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+
+    # Prompt budgeting: max prompt tokens per request (default + per-model overrides
+    # like "gpt-4o=12000,gpt-4o-mini=6000"); share of it RAG context may use
+    prompt_token_budget: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+    prompt_token_budgets: str = os.getenv("PROMPT_TOKEN_BUDGETS", "")
+    prompt_context_share: float = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.5"))
+    # History that no longer fits is summarized in the background
+    summary_model: str | None = os.getenv("SUMMARY_MODEL")
+    summary_max_tokens: int = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+    # Shared async HTTP pools
+    openai_timeout: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    openai_max_connections: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    qdrant_max_connections: int = int(os.getenv("QDRANT_MAX_CONNECTIONS", "50"))
+
+    # Client-side scheduler for OpenAI calls: token buckets (0 = learn the
+    # limits from x-ratelimit-* headers), adaptive concurrency, retries on 429/5xx
+    openai_rpm_limit: int = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+    openai_tpm_limit: int = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+    openai_max_concurrency: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    openai_max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+    openai_retry_base_delay: float = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.25"))
+    openai_retry_max_delay: float = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8"))
+    # How long a call may wait for capacity before failing
+    openai_queue_timeout: float = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
+    # Reply-size guess used for TPM accounting when max_tokens is not set
+    openai_reply_token_estimate: int = int(os.getenv("OPENAI_REPLY_TOKEN_ESTIMATE", "256"))
+
+    # URL fetch tool: pooled client (optional HTTP/2), streamed reads capped at
+    # fetch_max_bytes, per-URL cache honoring Cache-Control / ETag / Last-Modified
+    fetch_timeout: float = float(os.getenv("FETCH_TIMEOUT", "10"))
+    fetch_max_connections: int = int(os.getenv("FETCH_MAX_CONNECTIONS", "20"))
+    fetch_http2: bool = os.getenv("FETCH_HTTP2", "false").lower() == "true"
+    fetch_max_bytes: int = int(os.getenv("FETCH_MAX_BYTES", "262144"))
+    fetch_snippet_chars: int = int(os.getenv("FETCH_SNIPPET_CHARS", "2000"))
+    fetch_cache_max_entries: int = int(os.getenv("FETCH_CACHE_MAX_ENTRIES", "256"))
+    # fetch_url only reaches public addresses (every redirect hop is checked);
+    # FETCH_ALLOWED_HOSTS, comma separated (subdomains included), narrows it further
+    fetch_allowed_hosts: tuple[str, ...] = tuple(
+        h.strip().lower() for h in os.getenv("FETCH_ALLOWED_HOSTS", "").split(",") if h.strip()
+    )
+    fetch_max_redirects: int = int(os.getenv("FETCH_MAX_REDIRECTS", "5"))
+
+    # Coalesce concurrent identical embedding/search calls into one upstream call;
+    # identical temperature=0 completions too when single_flight_completions is set
+    single_flight_enabled: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    single_flight_completions: bool = os.getenv("SINGLE_FLIGHT_COMPLETIONS", "false").lower() == "true"
+
+    # Agent loop (ChatRequest.use_tools): model turns, wall-clock budget,
+    # per-tool timeout and how much of each tool result goes back to the model
+    agent_max_steps: int = int(os.getenv("AGENT_MAX_STEPS", "5"))
+    agent_max_seconds: float = float(os.getenv("AGENT_MAX_SECONDS", "30"))
+    tool_timeout: float = float(os.getenv("TOOL_TIMEOUT", "10"))
+    tool_result_max_chars: int = int(os.getenv("TOOL_RESULT_MAX_CHARS", "4000"))
+
+    # Default /chat deadline in seconds (0 = none); requests may set a shorter one
+    chat_timeout_seconds: float = float(os.getenv("CHAT_TIMEOUT_SECONDS", "0"))
+
+    # Max in-flight /chat requests per worker process
+    chat_max_concurrency: int = int(os.getenv("CHAT_MAX_CONCURRENCY", "64"))
+
     # Qdrant / RAG settings
-    qdrant_url: str = "http://localhost:6333"
-    qdrant_collection: str = "ai-agent-lab-docs"
+    qdrant_url: str = os.getenv("QDRANT_URL", "http://localhost:6333")
+    qdrant_api_key: str | None = os.getenv("QDRANT_API_KEY")
+    # gRPC transport for Qdrant (faster for large batches); HTTP otherwise
+    qdrant_prefer_grpc: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    qdrant_grpc_port: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    # The one collection holding document chunks (both backends)
+    qdrant_collection: str = os.getenv("QDRANT_COLLECTION", "ai_agent_docs")
     openai_embedding_model: str = "text-embedding-3-small"
+    # Shortened embeddings (text-embedding-3 "dimensions"); unset = model default (1536)
+    embedding_dimensions: int | None = (
+        int(os.getenv("EMBEDDING_DIMENSIONS")) if os.getenv("EMBEDDING_DIMENSIONS") else None
+    )
+    # Vector quantization for new collections: "none" | "int8" | "binary".
+    # Quantized searches rescore limit * oversampling candidates at full precision.
+    vector_quantization: str = os.getenv("VECTOR_QUANTIZATION", "none")
+    quantization_oversampling: float = float(os.getenv("QUANTIZATION_OVERSAMPLING", "3.0"))
+    # One deployment, many customers: every document and search/chat request
+    # must name a tenant, and new Qdrant collections are partitioned by tenant
+    # (per-tenant HNSW graphs, no global graph)
+    multitenant: bool = os.getenv("MULTITENANT", "false").lower() == "true"
+
+    # Retrieval: "vector" (score = cosine similarity) or opt-in "hybrid" (BM25 +
+    # vectors fused with RRF, score = RRF value ~0.03; documents indexed before the
+    # BM25 index existed need re-indexing to be found lexically)
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "vector")
+    # BM25 index over chunk text (SQLite FTS5; "" = in-memory)
+    lexical_index_path: str = os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical.sqlite3")
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    # Candidates pulled from each retriever before fusion/diversification, as a multiple of top_k
+    retrieval_candidates_factor: int = int(os.getenv("RETRIEVAL_CANDIDATES_FACTOR", "4"))
+    # Skip the embedding call when a short identifier-like query has a clear
+    # BM25 winner (top score >= margin x runner-up); margin <= 0 disables
+    lexical_fast_path_max_terms: int = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "4"))
+    lexical_fast_path_margin: float = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+    # Vector hits below this cosine similarity are dropped (0 = keep all)
+    retrieval_min_score: float = float(os.getenv("RETRIEVAL_MIN_SCORE", "0"))
+    # Post-retrieval diversification: MMR over candidate vectors, near-duplicate
+    # suppression, and merging of adjacent chunks of the same document
+    retrieval_diversify: bool = os.getenv("RETRIEVAL_DIVERSIFY", "false").lower() == "true"
+    mmr_lambda: float = float(os.getenv("MMR_LAMBDA", "0.7"))
+    retrieval_dedup_threshold: float = float(os.getenv("RETRIEVAL_DEDUP_THRESHOLD", "0.95"))
+    retrieval_merge_max_chunks: int = int(os.getenv("RETRIEVAL_MERGE_MAX_CHUNKS", "3"))
+
+    # Semantic response cache for /chat (opt-in)
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    semantic_cache_ttl_seconds: float = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+    # Vector store backend: "qdrant" (server) or "local" (in-process NumPy index)
+    vector_backend: str = os.getenv("VECTOR_BACKEND", "qdrant")
+    # Directory for the local backend's memory-mapped files ("" = memory only)
+    local_index_dir: str = os.getenv("LOCAL_INDEX_DIR", ".cache/vector_index")
+
+    # POST /docs/upload: max request body (0 = unlimited), decoded text pieces
+    # buffered per file ahead of the chunker, and uploads processed at once
+    upload_max_bytes: int = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 ** 3)))
+    upload_buffer_pieces: int = int(os.getenv("UPLOAD_BUFFER_PIECES", "8"))
+    upload_max_concurrency: int = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+
+    # Ingestion pipeline
+    chunk_tokens: int = int(os.getenv("CHUNK_TOKENS", "300"))
+    chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+    embed_batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    embed_batch_max_chars: int = int(os.getenv("EMBED_BATCH_MAX_CHARS", "100000"))
+    embed_concurrency: int = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    upsert_page_size: int = int(os.getenv("UPSERT_PAGE_SIZE", "128"))
+    # Per-document chunk manifest for incremental re-indexing ("" = in-memory)
+    manifest_path: str = os.getenv("MANIFEST_PATH", ".cache/manifest.sqlite3")
+    # Where chunk text lives: "payload" stores it in the vector payload; "local"
+    # keeps it in a per-host SQLite docstore keyed by point id (slim payloads),
+    # only for single-host setups: other hosts querying the collection lack it
+    chunk_text_store: str = os.getenv("CHUNK_TEXT_STORE", "payload")
+    chunk_store_path: str = os.getenv("CHUNK_STORE_PATH", ".cache/chunks.sqlite3")
+
+    # Background ingestion queue (/docs/index/batch; queue size 0 = unbounded)
+    ingest_queue_size: int = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", "2"))
+    ingest_job_retention: int = int(os.getenv("INGEST_JOB_RETENTION", "1000"))
+
+    # Embedding cache (in-memory LRU + SQLite tier; empty path disables disk)
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    embedding_cache_max_items: int = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "10000"))
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
 
 settings = Settings()
\ No newline at end of file
@@ -1,17 +1,49 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.logging import configure_logging
 from app.core.settings import settings
-from app.routers import health, chat, tools, docs
+from app.routers import health, chat, tools, docs, metrics as metrics_router
+from app.services import (
+    ingest_jobs,
+    metrics,
+    openai_client,
+    rag_service,
+    tools as tool_service,
+    vector_store,
+)
 
 configure_logging()
+log = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start ingest workers; clients are created lazily and their
+    # pooled connections are released on shutdown
+    ingest_jobs.start()
+    # Verify the document collection once; the result is cached by the store
+    try:
+        await rag_service.ensure_collection()
+    except Exception:
+        log.warning("Vector store not reachable at startup; retrying on first use", exc_info=True)
+    yield
+    await ingest_jobs.stop()
+    await openai_client.aclose()
+    await tool_service.aclose()
+    await vector_store.close_all()
+
+
 app = FastAPI(title=settings.app_name, 
               version=settings.version,
-              description="Backend API for building intelligent AI agents.")
+              description="Backend API for building intelligent AI agents.",
+              lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -25,8 +57,12 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# Stage timings -> Server-Timing header + request latency histogram
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Register routers
 app.include_router(health.router)
 app.include_router(chat.router)
 app.include_router(tools.router)
-app.include_router(docs.router) 
+app.include_router(docs.router)
+app.include_router(metrics_router.router)
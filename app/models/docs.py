@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+from app.models.schemas import SearchFilter
 
 
 class DocIn(BaseModel):
@@ -6,7 +11,38 @@ class DocIn(BaseModel):
     text: str
     title: str | None = None
 
+    # Filterable metadata (see SearchFilter); tenant is required with MULTITENANT
+    tenant: str | None = None
+    tags: List[str] = []
+    created_at: datetime | None = None
+
+    # Optional per-request chunking overrides (tokens)
+    chunk_tokens: int | None = Field(default=None, ge=16, le=8000)
+    chunk_overlap: int | None = Field(default=None, ge=0)
+
+    # "update": embed only new/changed chunks; "replace": re-embed all
+    mode: Literal["update", "replace"] = "update"
+
 
 class SearchIn(BaseModel):
     query: str
     limit: int = 5
+    filter: SearchFilter | None = None
+
+
+class IngestJobFailure(BaseModel):
+    doc_id: str
+    error: str
+
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    status: str  # queued | running | completed | completed_with_errors
+    total: int
+    succeeded: int = 0
+    failed: int = 0
+    chunks_indexed: int = 0
+    elapsed_seconds: float = 0.0
+    docs_per_second: float = 0.0
+    chunks_per_second: float = 0.0
+    failures: List[IngestJobFailure] = []
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
@@ -11,6 +12,16 @@ class RetrievedSource(BaseModel):
     text: str
     score: float
 
+class SearchFilter(BaseModel):
+    """Restricts retrieval to matching chunks (all given fields must match)."""
+    tenant: Optional[str] = None
+    doc_ids: Optional[List[str]] = None
+    # Chunks of documents having any of these tags
+    tags: Optional[List[str]] = None
+    # Document date (DocIn.created_at): created_after <= date < created_before
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
 class ChatRequest(BaseModel):
     session_id: Optional[str] = None
     message: str
@@ -20,9 +31,25 @@ class ChatRequest(BaseModel):
     # RAG flags
     use_rag: bool = True
     rag_top_k: int = 3
+    # Applies to RAG and to the search_documents tool
+    filter: Optional[SearchFilter] = None
+
+    # Agent loop: let the model call server-side tools (POST /chat only)
+    use_tools: bool = False
+
+    # Give up (504) after this many seconds; see also the X-Request-Timeout header
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)
+
+class ToolCall(BaseModel):
+    name: str
+    arguments: dict
+    ok: bool
+    elapsed_ms: float
 
 class ChatResponse(BaseModel):
     session_id: str
     reply: str
     history: List[ChatMessage]
     sources: List[RetrievedSource] | None = None
+    cached: bool = False
+    tool_calls: List[ToolCall] | None = None
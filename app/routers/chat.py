@@ -1,22 +1,87 @@
+import asyncio
+import json
 import logging
-from fastapi import APIRouter, HTTPException
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, TypeVar
 
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.settings import settings
 from app.models.schemas import ChatRequest, ChatResponse
-from app.services import llm_service
+from app.services import deadline, llm_service, search_filters
+
+T = TypeVar("T")
 
 log = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def _timeout_seconds(body: ChatRequest, header: Optional[float]) -> Optional[float]:
+    """The tightest of the body field, the X-Request-Timeout header and the default."""
+    candidates = [t for t in (body.timeout_seconds, header, settings.chat_timeout_seconds) if t and t > 0]
+    return min(candidates) if candidates else None
+
+
+def _search_filter(body: ChatRequest) -> Optional[search_filters.PayloadFilter]:
+    """The request's retrieval filter; 422 when MULTITENANT needs a tenant."""
+    try:
+        search_filters.require_tenant(body.filter.tenant if body.filter else None)
+    except search_filters.TenantRequired as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return search_filters.to_payload_filter(body.filter)
+
+
+async def _cancel_on_disconnect(request: Request, aw: Awaitable[T]) -> T:
+    """
+    Await `aw`, cancelling it (and the embedding/search/LLM calls it is
+    waiting on) if the client disconnects first.
+    """
+    task = asyncio.ensure_future(aw)
+    disconnected = False
+
+    async def watch() -> None:
+        nonlocal disconnected
+        # The body has been read, so the next message is the disconnect
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+                task.cancel()
+                return
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if disconnected:
+            # Nobody is listening; 499 just ends the request cleanly
+            raise HTTPException(status_code=499, detail="Client closed request")
+        raise
+    finally:
+        watcher.cancel()
+
+
 @router.post("", response_model=ChatResponse)
-def chat_api(body: ChatRequest) -> ChatResponse:
+async def chat_api(
+    body: ChatRequest,
+    request: Request,
+    x_request_timeout: Optional[float] = Header(default=None),
+) -> ChatResponse:
     """
     Main chat endpoint for the AI agent.
 
     - Accepts a user message (and optional session_id, RAG flags).
     - Calls llm_service.generate_chat_response.
-    - Returns session_id, reply, full history, and RAG sources.
+    - Returns session_id, reply, full history, RAG sources, and whether
+      the reply came from the semantic cache.
+    - With use_tools the model may call server-side tools (fetch_url,
+      search_documents); the calls made are listed in tool_calls.
+    - `filter` (tenant, doc_ids, tags, dates) restricts RAG and the
+      search_documents tool; a tenant is required with MULTITENANT.
+    - A deadline (timeout_seconds / X-Request-Timeout) bounds every
+      upstream call (504 when it passes); if the client disconnects, the
+      work still in flight is cancelled.
     """
     log.info(
         "POST /chat session_id=%s use_rag=%s rag_top_k=%s",
@@ -25,23 +90,39 @@ def chat_api(body: ChatRequest) -> ChatResponse:
         body.rag_top_k,
     )
 
+    payload_filter = _search_filter(body)
+
     try:
-        sid, reply, history, sources = llm_service.generate_chat_response(
-            session_id=body.session_id,
-            user_message=body.message,
-            model=body.model,
-            temperature=body.temperature,
-            use_rag=body.use_rag,
-            rag_top_k=body.rag_top_k,
-        )
+        with deadline.scope(_timeout_seconds(body, x_request_timeout)), search_filters.scope(payload_filter):
+            sid, reply, history, sources, cached, tool_calls = await _cancel_on_disconnect(
+                request,
+                llm_service.generate_chat_response(
+                    session_id=body.session_id,
+                    user_message=body.message,
+                    model=body.model,
+                    temperature=body.temperature,
+                    use_rag=body.use_rag,
+                    rag_top_k=body.rag_top_k,
+                    use_tools=body.use_tools,
+                ),
+            )
 
         return ChatResponse(
             session_id=sid,
             reply=reply,
             history=history,
             sources=sources,
+            cached=cached,
+            tool_calls=tool_calls or None,
         )
 
+    except HTTPException:
+        raise
+
+    except deadline.DeadlineExceeded as e:
+        log.warning("Deadline exceeded in /chat session_id=%s", body.session_id)
+        raise HTTPException(status_code=504, detail=str(e))
+
     except RuntimeError as e:
         # Errors we intentionally raised (e.g., missing API key, OpenAI error)
         log.error("Handled error in /chat: %s", e, exc_info=True)
@@ -51,3 +132,69 @@ def chat_api(body: ChatRequest) -> ChatResponse:
         # Unexpected bugs
         log.exception("Unexpected error in /chat")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream_api(
+    body: ChatRequest,
+    x_request_timeout: Optional[float] = Header(default=None),
+) -> StreamingResponse:
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    - event "sources": session_id + RAG sources, sent before the LLM call
+    - event "delta": token chunks as they arrive
+    - event "done": session_id + full reply, after memory is updated
+    - event "error": if something fails mid-stream (or the deadline passes)
+
+    A client disconnect cancels the generator (Starlette), which closes
+    the upstream stream.
+    """
+    log.info(
+        "POST /chat/stream session_id=%s use_rag=%s rag_top_k=%s",
+        body.session_id,
+        body.use_rag,
+        body.rag_top_k,
+    )
+
+    if body.use_tools:
+        raise HTTPException(status_code=400, detail="use_tools is only supported on POST /chat")
+
+    try:
+        # Fail fast (503) on config errors before the 200 stream starts
+        llm_service.get_client()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    timeout = _timeout_seconds(body, x_request_timeout)
+    payload_filter = _search_filter(body)
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            with deadline.scope(timeout), search_filters.scope(payload_filter):
+                async for event, data in llm_service.stream_chat_response(
+                    session_id=body.session_id,
+                    user_message=body.message,
+                    model=body.model,
+                    temperature=body.temperature,
+                    use_rag=body.use_rag,
+                    rag_top_k=body.rag_top_k,
+                ):
+                    yield _sse(event, data)
+        except RuntimeError as e:
+            log.error("Handled error in /chat/stream: %s", e, exc_info=True)
+            yield _sse("error", {"detail": str(e)})
+        except Exception:
+            log.exception("Unexpected error in /chat/stream")
+            yield _sse("error", {"detail": "Internal server error"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,38 +1,162 @@
+import json
 import logging
-from fastapi import APIRouter, HTTPException
+from typing import List, Literal, Optional
 
-from app.models.docs import DocIn, SearchIn
-from app.services import rag_service
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+
+from app.models.docs import DocIn, IngestJobStatus, SearchIn
+from app.services import ingest_jobs, rag_service, search_filters, uploads
 
 log = logging.getLogger(__name__)
 router = APIRouter(prefix="/docs", tags=["docs"])
 
 
+def _require_tenant(tenant: Optional[str]) -> None:
+    try:
+        search_filters.require_tenant(tenant)
+    except search_filters.TenantRequired as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @router.post("/index")
-def index_doc(doc: DocIn):
+async def index_doc(doc: DocIn):
+    _require_tenant(doc.tenant)
     try:
-        n_chunks = rag_service.index_document(
+        result = await rag_service.index_document(
             doc_id=doc.doc_id,
-            text=doc.text,
-            metadata={"title": doc.title} if doc.title else None,
+            content=doc.text,
+            source=doc.title,
+            tags=doc.tags,
+            chunk_tokens=doc.chunk_tokens,
+            chunk_overlap=doc.chunk_overlap,
+            mode=doc.mode,
+            tenant=doc.tenant,
+            created_at=doc.created_at,
         )
-        return {"doc_id": doc.doc_id, "chunks_indexed": n_chunks}
+        return {
+            "doc_id": doc.doc_id,
+            "chunks_indexed": result.chunks,
+            "chunks_embedded": result.embedded,
+            "chunks_moved": result.moved,
+            "chunks_deleted": result.deleted,
+        }
     except Exception as e:
         log.exception("Error indexing document")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/upload")
+async def upload_docs(
+    request: Request,
+    doc_prefix: str = Query("", description="Prepended to each file name to form its doc_id"),
+    chunk_tokens: Optional[int] = Query(None, ge=16, le=8000),
+    chunk_overlap: Optional[int] = Query(None, ge=0),
+    mode: Literal["update", "replace"] = "update",
+    tenant: Optional[str] = None,
+    tags: List[str] = Query([]),
+):
+    """
+    Index uploaded text / markdown / HTML files (multipart/form-data, one
+    or more file parts). Each file becomes a document with
+    doc_id = doc_prefix + file name, indexed under tenant / tags.
+
+    The body is read as a stream and chunks are embedded while bytes are
+    still arriving, so memory stays bounded for very large files.
+    Responds 413 above UPLOAD_MAX_BYTES, 422 for malformed bodies or
+    unsupported file types.
+    """
+    _require_tenant(tenant)
+    try:
+        documents = await uploads.ingest_multipart(
+            request.headers.get("content-type", ""),
+            request.stream(),
+            doc_prefix=doc_prefix,
+            options={
+                "chunk_tokens": chunk_tokens,
+                "chunk_overlap": chunk_overlap,
+                "mode": mode,
+                "tenant": tenant,
+                "tags": tags,
+            },
+        )
+        return {"documents": documents}
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        log.exception("Error indexing upload")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/{doc_id}")
+async def delete_doc(doc_id: str, tenant: Optional[str] = None):
+    _require_tenant(tenant)
+    try:
+        n_deleted = await rag_service.delete_document(doc_id, tenant=tenant)
+        return {"doc_id": doc_id, "chunks_deleted": n_deleted}
+    except Exception as e:
+        log.exception("Error deleting document")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/search")
-def search_docs(body: SearchIn):
+async def search_docs(body: SearchIn):
+    _require_tenant(body.filter.tenant if body.filter else None)
     try:
-        results = rag_service.retrieve_relevant(body.query, limit=body.limit)
+        with search_filters.scope(search_filters.to_payload_filter(body.filter)):
+            results = await rag_service.retrieve_for_query(body.query, limit=body.limit)
         return {
             "query": body.query,
             "results": [
-                {"score": score, "text": text}
-                for score, text in results
+                {"score": r.score, "text": r.text, "doc_id": r.doc_id}
+                for r in results
             ],
         }
     except Exception as e:
         log.exception("Error searching documents")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _parse_batch(raw: bytes, content_type: str) -> List[DocIn]:
+    """Accept a JSON array of DocIn, or NDJSON (one DocIn per line)."""
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    else:
+        items = json.loads(raw or b"[]")
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of documents")
+    return [DocIn.model_validate(item) for item in items]
+
+
+@router.post("/index/batch", status_code=202, response_model=IngestJobStatus)
+async def index_batch(request: Request) -> IngestJobStatus:
+    """
+    Queue many documents for background indexing.
+
+    Body: JSON array of DocIn, or NDJSON with Content-Type application/x-ndjson.
+    Returns the job immediately; poll GET /docs/jobs/{job_id} for progress.
+    Responds 429 when the ingestion queue cannot take the whole batch.
+    """
+    try:
+        docs = _parse_batch(await request.body(), request.headers.get("content-type", ""))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    for doc in docs:
+        _require_tenant(doc.tenant)
+
+    try:
+        return ingest_jobs.submit(docs)
+    except ingest_jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def job_status(job_id: str) -> IngestJobStatus:
+    status = ingest_jobs.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
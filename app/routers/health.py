@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from app.core.settings import settings
+from app.services import memory, rag_service
 
 router = APIRouter(tags=["health"])
 
@@ -15,4 +16,6 @@ def ready():
         "openai_key_present": settings.openai_api_key is not None,
         "env": settings.environment,
         "version": settings.version,
+        "sessions": memory.stats(),
+        "vector_store_ready": rag_service.get_store().ready,
     }
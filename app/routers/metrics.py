@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services import memory, metrics, openai_scheduler
+
+router = APIRouter(tags=["metrics"])
+
+metrics.register_gauge(
+    "ai_agent_sessions",
+    "Chat sessions and messages held by the session store",
+    lambda: {
+        (("kind", "sessions"),): memory.stats()["sessions"],
+        (("kind", "messages"),): memory.stats()["messages"],
+    },
+)
+
+metrics.register_gauge(
+    "ai_agent_openai_scheduler",
+    "OpenAI scheduler: calls in flight, queued, and the adaptive concurrency limit",
+    lambda: {(("kind", k),): v for k, v in openai_scheduler.stats().items()},
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus text exposition of stage latencies, cache hits, tokens and errors."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,81 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.settings import settings
+
+log = logging.getLogger(__name__)
+
+_store: Optional["ChunkStore"] = None
+_store_lock = threading.Lock()
+
+# SQLite's default limit on bound parameters is 999 on older builds
+_MAX_PARAMS = 500
+
+
+class ChunkStore:
+    """
+    Chunk text keyed by point id, kept next to the app instead of in the
+    vector store payloads. Searches return slim payloads and the text of
+    the final top-k is read here in one query.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_text ("
+            "point_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, text TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def put(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """Insert or replace (point_id, doc_id, text) rows."""
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunk_text (point_id, doc_id, text) VALUES (?, ?, ?)",
+                    rows,
+                )
+
+    def get_many(self, point_ids: List[str]) -> Dict[str, str]:
+        """point_id -> text for the ids that are stored."""
+        out: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(point_ids), _MAX_PARAMS):
+                page = point_ids[start:start + _MAX_PARAMS]
+                rows = self._db.execute(
+                    "SELECT point_id, text FROM chunk_text WHERE point_id IN "
+                    f"({','.join('?' * len(page))})",
+                    page,
+                ).fetchall()
+                out.update(rows)
+        return out
+
+    def delete(self, point_ids: List[str]) -> None:
+        with self._lock:
+            with self._db:
+                for start in range(0, len(point_ids), _MAX_PARAMS):
+                    page = point_ids[start:start + _MAX_PARAMS]
+                    self._db.execute(
+                        f"DELETE FROM chunk_text WHERE point_id IN ({','.join('?' * len(page))})",
+                        page,
+                    )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM chunk_text").fetchone()
+        return {"chunks": n}
+
+
+def get_chunk_store() -> ChunkStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore(settings.chunk_store_path or None)
+    return _store
@@ -0,0 +1,145 @@
+import logging
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+from app.services.tokens import APPROX_CHARS_PER_TOKEN, count_tokens, get_encoding
+
+log = logging.getLogger(__name__)
+
+# Sentence ends (. ! ? followed by whitespace) and paragraph breaks (blank line)
+_BOUNDARY = re.compile(r"\n[ \t]*\n\s*|(?<=[.!?])\s+")
+
+# Without a boundary, never buffer more than this many chars of streamed input
+_MAX_PENDING_CHARS = 20_000
+
+
+def _split_oversized(segment: str, max_tokens: int) -> Iterator[str]:
+    """Hard-split a single sentence that is larger than a whole chunk."""
+    enc = get_encoding()
+    if enc is not None:
+        ids = enc.encode(segment, disallowed_special=())
+        for start in range(0, len(ids), max_tokens):
+            yield enc.decode(ids[start:start + max_tokens])
+        return
+
+    words: List[str] = []
+    used = 0
+    for word in segment.split():
+        n = count_tokens(word)
+        if n > max_tokens:
+            # One giant "word" (e.g. base64); slice it by chars
+            if words:
+                yield " ".join(words)
+                words, used = [], 0
+            step = max_tokens * APPROX_CHARS_PER_TOKEN
+            for start in range(0, len(word), step):
+                yield word[start:start + step]
+            continue
+        if words and used + n > max_tokens:
+            yield " ".join(words)
+            words, used = [], 0
+        words.append(word)
+        used += n
+    if words:
+        yield " ".join(words)
+
+
+def _segments(pieces: Iterable[str]) -> Iterator[Tuple[str, bool]]:
+    """
+    Turn a stream of text pieces into (sentence, ends_paragraph) pairs.
+
+    Only the unfinished tail of the stream is buffered, so input can be fed
+    line by line (or block by block) from a file.
+    """
+    buf = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        last = 0
+        for m in _BOUNDARY.finditer(buf):
+            if m.end() == len(buf):
+                # Boundary touches the end: the next piece may extend it
+                break
+            seg = buf[last:m.start()].strip()
+            if seg:
+                yield seg, m.group().count("\n") >= 2
+            last = m.end()
+        buf = buf[last:]
+
+        if len(buf) > _MAX_PENDING_CHARS:
+            cut = buf.rfind(" ", 0, _MAX_PENDING_CHARS)
+            cut = cut if cut > 0 else _MAX_PENDING_CHARS
+            yield buf[:cut].strip(), False
+            buf = buf[cut:]
+
+    tail = buf.strip()
+    if tail:
+        yield tail, True
+
+
+def iter_chunks(
+    pieces: Iterable[str],
+    chunk_tokens: int,
+    overlap_tokens: int = 0,
+) -> Iterator[str]:
+    """
+    Yield token-bounded chunks that end on sentence/paragraph boundaries.
+
+    - sentences are packed greedily up to chunk_tokens
+    - a paragraph break flushes the chunk once it is >= 3/4 full
+    - the last sentences (up to overlap_tokens) are repeated at the start
+      of the next chunk
+    - a single sentence larger than chunk_tokens is hard-split
+    """
+    chunk_tokens = max(1, chunk_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+
+    # (sentence, tokens, ends_paragraph)
+    current: List[Tuple[str, int, bool]] = []
+    used = 0
+    fresh = False  # does current hold anything beyond the carried-over overlap?
+
+    def render() -> str:
+        out: List[str] = []
+        for i, (sent, _, para) in enumerate(current):
+            out.append(sent)
+            if i < len(current) - 1:
+                out.append("\n\n" if para else " ")
+        return "".join(out)
+
+    def flush() -> Iterator[str]:
+        nonlocal current, used, fresh
+        if fresh:
+            yield render()
+        carried: List[Tuple[str, int, bool]] = []
+        carried_tokens = 0
+        for item in reversed(current):
+            if carried_tokens + item[1] > overlap_tokens:
+                break
+            carried.insert(0, item)
+            carried_tokens += item[1]
+        current, used, fresh = carried, carried_tokens, False
+
+    for segment, ends_paragraph in _segments(pieces):
+        n = count_tokens(segment)
+        if n > chunk_tokens:
+            yield from flush()
+            current, used = [], 0
+            yield from _split_oversized(segment, chunk_tokens)
+            continue
+
+        if used + n > chunk_tokens:
+            yield from flush()
+            if used + n > chunk_tokens:
+                current, used = [], 0
+
+        current.append((segment, n, ends_paragraph))
+        used += n
+        fresh = True
+
+        if ends_paragraph and used * 4 >= chunk_tokens * 3:
+            yield from flush()
+
+    if fresh:
+        yield render()
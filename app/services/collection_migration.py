@@ -0,0 +1,235 @@
+r"""
+Copy the document collection into a new one with fewer dimensions and/or
+quantized vectors, without re-embedding and without taking search down.
+
+text-embedding-3 vectors can be shortened by keeping the first N
+components and re-normalizing (this is what the API's `dimensions`
+parameter does), so stored vectors are re-projected locally.
+
+    python -m app.services.collection_migration --target docs_1536_int8 \
+        --dimensions 1536 --quantization int8 --evaluate 200 --alias ai_agent_docs_live
+
+The source keeps serving reads while the copy runs. With --alias (Qdrant)
+the alias is switched to the new collection in one atomic operation once
+the copy is done; point QDRANT_COLLECTION at the alias and set
+VECTOR_QUANTIZATION to match. Documents indexed during the copy should be
+re-indexed afterwards (unchanged chunks are skipped by the manifest, so
+this is cheap).
+
+--alias is refused when the dimensions change: running workers would keep
+embedding queries at the old EMBEDDING_DIMENSIONS and every search against
+the alias would fail until they restart. Cut over in stages instead:
+
+    python -m app.services.collection_migration --target docs_512 --dimensions 512
+    # deploy EMBEDDING_DIMENSIONS=512 QDRANT_COLLECTION=docs_512, then
+    python -m app.services.collection_migration --target docs_512 --dimensions 512 \
+        --alias ai_agent_docs_live --alias-only
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from qdrant_client.http import models as qmodels
+
+from app.core.settings import settings
+from app.services import vector_store
+from app.services.vector_store import VectorStore
+
+log = logging.getLogger(__name__)
+
+# RAM-resident bytes per dimension for each quantization
+_BYTES_PER_DIM = {"none": 4.0, "int8": 1.0, "binary": 1 / 8}
+
+
+class Evaluation(NamedTuple):
+    queries: int
+    k: int
+    recall: float           # mean overlap of target top-k with exact source top-k
+    source_p50_ms: float
+    target_p50_ms: float
+    source_bytes_per_vector: float
+    target_bytes_per_vector: float
+
+
+def reproject(vectors: List[List[float]], dimensions: int) -> List[List[float]]:
+    """Keep the first `dimensions` components of each vector and re-normalize."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.shape[1] < dimensions:
+        raise ValueError(
+            f"Cannot re-project {matrix.shape[1]}-d vectors to {dimensions} dimensions; "
+            "re-index the documents instead"
+        )
+    matrix = matrix[:, :dimensions]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).tolist()
+
+
+async def copy_collection(source: VectorStore, target: VectorStore, batch_size: int = 256) -> int:
+    """Stream every point of source into target (re-projected). Returns points copied."""
+    await target.ensure_collection()
+    copied = 0
+    async for records in source.scroll(batch_size, with_vectors=True):
+        ids = [str(r.id) for r in records]
+        vectors = reproject([r.vector for r in records], target.vector_size)
+        await target.upsert(ids, vectors, [r.payload or {} for r in records])
+        copied += len(records)
+        log.info("Copied %d points into %s", copied, target.collection_name)
+    return copied
+
+
+async def evaluate(
+    source: VectorStore,
+    target: VectorStore,
+    n_queries: int = 100,
+    k: int = 10,
+    target_quantization: str = "none",
+) -> Evaluation:
+    """
+    Use stored vectors as queries: compare target top-k against the exact
+    full-precision source top-k and time both searches.
+    """
+    queries: List[List[float]] = []
+    async for records in source.scroll(min(256, max(1, n_queries)), with_vectors=True):
+        queries.extend(r.vector for r in records)
+        if len(queries) >= n_queries:
+            break
+    queries = queries[:n_queries]
+    projected = reproject(queries, target.vector_size) if queries else []
+
+    overlaps: List[float] = []
+    source_ms: List[float] = []
+    target_ms: List[float] = []
+    for full, short in zip(queries, projected):
+        t0 = time.perf_counter()
+        exact = await source.search(full, limit=k)
+        t1 = time.perf_counter()
+        approx = await target.search(short, limit=k)
+        t2 = time.perf_counter()
+        source_ms.append((t1 - t0) * 1000)
+        target_ms.append((t2 - t1) * 1000)
+        expected = {str(p.id) for p in exact}
+        if expected:
+            overlaps.append(len(expected & {str(p.id) for p in approx}) / len(expected))
+
+    return Evaluation(
+        queries=len(queries),
+        k=k,
+        recall=float(np.mean(overlaps)) if overlaps else 0.0,
+        source_p50_ms=float(np.median(source_ms)) if source_ms else 0.0,
+        target_p50_ms=float(np.median(target_ms)) if target_ms else 0.0,
+        source_bytes_per_vector=source.vector_size * _BYTES_PER_DIM["none"],
+        target_bytes_per_vector=target.vector_size * _BYTES_PER_DIM[target_quantization],
+    )
+
+
+async def switch_alias(alias: str, collection_name: str) -> None:
+    """Atomically point a Qdrant alias at collection_name."""
+    client = vector_store.get_qdrant()
+    existing = {a.alias_name for a in (await client.get_aliases()).aliases}
+    operations: List[qmodels.AliasOperations] = []
+    if alias in existing:
+        operations.append(
+            qmodels.DeleteAliasOperation(delete_alias=qmodels.DeleteAlias(alias_name=alias))
+        )
+    operations.append(
+        qmodels.CreateAliasOperation(
+            create_alias=qmodels.CreateAlias(collection_name=collection_name, alias_name=alias)
+        )
+    )
+    await client.update_collection_aliases(change_aliases_operations=operations)
+    log.info("Alias %s now points at %s", alias, collection_name)
+
+
+async def migrate(
+    target_name: str,
+    dimensions: int,
+    quantization: str = "none",
+    source_name: Optional[str] = None,
+    source_dimensions: Optional[int] = None,
+    batch_size: int = 256,
+    alias: Optional[str] = None,
+    n_eval: int = 0,
+    k: int = 10,
+    alias_only: bool = False,
+) -> Dict[str, object]:
+    if alias and settings.vector_backend != "qdrant":
+        raise RuntimeError("Aliases are only supported by the qdrant backend")
+    if alias_only:
+        if not alias:
+            raise ValueError("alias_only needs an alias")
+        await switch_alias(alias, target_name)
+        return {"alias": alias}
+    source_size = source_dimensions or settings.embedding_dimensions or 1536
+    if alias and dimensions != source_size:
+        raise ValueError(
+            f"Not switching alias {alias!r}: dimensions change ({source_size} -> {dimensions}) "
+            "and running workers still embed queries at the old size. Copy without --alias, "
+            "deploy the new EMBEDDING_DIMENSIONS against the new collection, then switch "
+            "with --alias-only"
+        )
+    source = vector_store.create_store(
+        source_name or settings.qdrant_collection,
+        source_size,
+        quantization="none",
+    )
+    target = vector_store.create_store(target_name, dimensions, quantization=quantization)
+    try:
+        report: Dict[str, object] = {"copied": await copy_collection(source, target, batch_size)}
+        if n_eval > 0:
+            evaluation = await evaluate(source, target, n_eval, k, quantization)
+            report["evaluation"] = evaluation._asdict()
+        if alias:
+            await switch_alias(alias, target_name)
+            report["alias"] = alias
+        return report
+    finally:
+        await source.close()
+        await target.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", required=True, help="new collection name")
+    parser.add_argument("--dimensions", type=int, required=True)
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default="none")
+    parser.add_argument("--source", default=None, help="default: QDRANT_COLLECTION")
+    parser.add_argument("--source-dimensions", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--alias", default=None, help="alias to switch to the new collection")
+    parser.add_argument(
+        "--alias-only", action="store_true",
+        help="only switch --alias to --target (second stage of a dimension change)",
+    )
+    parser.add_argument("--evaluate", type=int, default=0, help="queries for the recall check")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def _run() -> Dict[str, object]:
+        try:
+            return await migrate(
+                args.target,
+                args.dimensions,
+                quantization=args.quantization,
+                source_name=args.source,
+                source_dimensions=args.source_dimensions,
+                batch_size=args.batch_size,
+                alias=args.alias,
+                n_eval=args.evaluate,
+                k=args.k,
+                alias_only=args.alias_only,
+            )
+        finally:
+            await vector_store.close_all()
+
+    print(json.dumps(asyncio.run(_run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's deadline passed before an upstream call finished (maps to 504)."""
+
+
+@contextmanager
+def scope(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Run the block (and tasks it spawns) with a deadline `seconds` from now.
+    A nested scope can only shorten the deadline; None or <= 0 adds none.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def clear() -> None:
+    """Drop the deadline for the rest of the current task (shared work)."""
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left (may be negative), or None without a deadline."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check() -> None:
+    """Raise DeadlineExceeded if the deadline has already passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+def timeout(default: Optional[float] = None) -> Optional[float]:
+    """The smaller of `default` and the time left; raises if none is left."""
+    check()
+    left = remaining()
+    if left is None:
+        return default
+    return left if default is None else min(default, left)
+
+
+async def wait(aw: Awaitable[T]) -> T:
+    """
+    Await `aw` within the time left. On expiry it is cancelled (closing
+    e.g. the HTTP request) and DeadlineExceeded is raised.
+    """
+    try:
+        left = timeout()
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+    if left is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded") from None
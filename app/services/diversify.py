@@ -0,0 +1,143 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class Candidate(NamedTuple):
+    """One retrieved chunk on its way from the retrievers to the prompt."""
+    point_id: str
+    payload: Dict[str, Any]
+    score: float
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr_order(
+    query_vector: Sequence[float],
+    vectors: Sequence[Sequence[float]],
+    lambda_: float = 0.7,
+    dedup_threshold: float = 1.0,
+) -> List[int]:
+    """
+    Maximal marginal relevance order of candidate vectors.
+
+    Each step picks argmax(lambda * sim(q, d) - (1 - lambda) * max sim(d, selected)).
+    The pairwise similarity matrix is computed once; per step only the
+    running max-similarity vector is updated. Candidates whose cosine to an
+    already selected one is >= dedup_threshold are dropped as near-duplicates.
+    Returns candidate indices, best first.
+    """
+    n = len(vectors)
+    if n == 0:
+        return []
+    docs = _normalize(np.asarray(vectors, dtype=np.float32))
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    relevance = docs @ query
+    pairwise = docs @ docs.T
+
+    available = np.ones(n, dtype=bool)
+    max_sim = np.zeros(n, dtype=np.float32)
+    order: List[int] = []
+    while available.any():
+        if order:
+            scores = lambda_ * relevance - (1.0 - lambda_) * max_sim
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        max_sim = np.maximum(max_sim, pairwise[pick])
+        available &= pairwise[pick] < dedup_threshold
+    return order
+
+
+def join_overlapping(first: str, second: str, max_overlap: int = 4000) -> str:
+    """
+    Concatenate two consecutive chunks, dropping the text that the chunker
+    repeated as overlap (longest suffix of first that is a prefix of second).
+    """
+    probe = second[:32]
+    if not probe:
+        return first
+    start = max(0, len(first) - max_overlap)
+    pos = first.find(probe, start)
+    while pos != -1:
+        tail = first[pos:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        pos = first.find(probe, pos + 1)
+    return first.rstrip() + "\n" + second.lstrip()
+
+
+class _Group:
+    __slots__ = ("point_id", "doc_id", "first", "last", "chunks", "score", "payload")
+
+    def __init__(self, candidate: Candidate, index: int):
+        self.point_id = candidate.point_id
+        self.doc_id = candidate.payload.get("doc_id")
+        self.first = self.last = index
+        self.chunks: Dict[int, str] = {index: candidate.payload.get("text", "")}
+        self.score = candidate.score
+        self.payload = candidate.payload
+
+
+def merge_adjacent(
+    candidates: List[Candidate],
+    limit: int,
+    max_chunks: int = 3,
+) -> List[Candidate]:
+    """
+    Walk ranked candidates and fold each chunk into an already selected
+    group when it is adjacent (chunk_index +-1) to it in the same document,
+    so overlapping neighbours become one passage instead of using two slots.
+    Stops after limit groups; a group keeps its best score and rank.
+    Exact duplicate texts are skipped.
+    """
+    groups: List[_Group] = []
+    seen_texts = set()
+    for c in candidates:
+        text = c.payload.get("text", "")
+        if text in seen_texts:
+            continue
+        index: Optional[int] = c.payload.get("chunk_index")
+        target = None
+        if index is not None:
+            for g in groups:
+                if (
+                    g.first >= 0
+                    and g.doc_id == c.payload.get("doc_id")
+                    and len(g.chunks) < max_chunks
+                    and (index == g.first - 1 or index == g.last + 1)
+                ):
+                    target = g
+                    break
+        if target is not None:
+            target.chunks[index] = text
+            target.first = min(target.first, index)
+            target.last = max(target.last, index)
+        elif len(groups) < limit:
+            groups.append(_Group(c, index if index is not None else -1))
+        else:
+            continue
+        seen_texts.add(text)
+
+    merged: List[Candidate] = []
+    for g in groups:
+        texts = [g.chunks[i] for i in sorted(g.chunks)]
+        text = texts[0]
+        for nxt in texts[1:]:
+            text = join_overlapping(text, nxt)
+        payload = dict(g.payload, text=text)
+        if len(texts) > 1:
+            payload["chunk_index"] = g.first
+            payload["chunk_count"] = len(texts)
+        merged.append(Candidate(point_id=g.point_id, payload=payload, score=g.score))
+    return merged
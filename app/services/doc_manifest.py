@@ -0,0 +1,96 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.core.settings import settings
+
+log = logging.getLogger(__name__)
+
+_manifest: Optional["DocManifest"] = None
+_manifest_lock = threading.Lock()
+
+# point_id -> (chunk_hash, chunk_index)
+ChunkEntries = Dict[str, Tuple[str, int]]
+
+
+class DocManifest:
+    """
+    Per-document record of which chunks (by point id + content hash) are
+    currently indexed, plus a hash of the document's payload metadata.
+    Lets re-indexing diff old vs new chunks instead of re-embedding
+    everything.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_id TEXT NOT NULL, point_id TEXT NOT NULL, "
+            "chunk_hash TEXT NOT NULL, chunk_index INTEGER NOT NULL, "
+            "PRIMARY KEY (doc_id, point_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, meta_hash TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, doc_id: str) -> ChunkEntries:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT point_id, chunk_hash, chunk_index FROM chunks WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchall()
+        return {point_id: (chunk_hash, idx) for point_id, chunk_hash, idx in rows}
+
+    def load_meta_hash(self, doc_id: str) -> Optional[str]:
+        """Metadata hash saved with doc_id (None if unknown, e.g. older manifests)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT meta_hash FROM docs WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, doc_id: str, entries: List[Tuple[str, str, int]], meta_hash: str = "") -> None:
+        """Replace the manifest of doc_id with (point_id, chunk_hash, chunk_index) rows."""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._db.executemany(
+                    "INSERT INTO chunks (doc_id, point_id, chunk_hash, chunk_index) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(doc_id, pid, h, idx) for pid, h, idx in entries],
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO docs (doc_id, meta_hash) VALUES (?, ?)",
+                    (doc_id, meta_hash),
+                )
+
+    def add(self, doc_id: str, entries: List[Tuple[str, str, int]]) -> None:
+        """Record points written so far (rows are replaced by the final save)."""
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (doc_id, point_id, chunk_hash, chunk_index) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(doc_id, pid, h, idx) for pid, h, idx in entries],
+                )
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._db.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+
+
+def get_manifest() -> DocManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = DocManifest(settings.manifest_path or None)
+    return _manifest
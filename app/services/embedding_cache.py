@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.settings import settings
+
+log = logging.getLogger(__name__)
+
+_cache: Optional["EmbeddingCache"] = None
+_cache_lock = threading.Lock()
+
+
+def make_key(model: str, dimensions: int, text: str) -> str:
+    """Content-addressed key: same model + dims + text -> same vector."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{dimensions}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    - memory: bounded LRU of float32 arrays
+    - disk: optional SQLite table that survives restarts
+    """
+
+    def __init__(self, max_items: int, path: Optional[str] = None):
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Look up keys, memory first, then disk. Missing keys come back as None."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+                    self.memory_hits += 1
+
+            pending = [k for k in dict.fromkeys(keys) if k not in found]
+            if pending and self._db is not None:
+                for start in range(0, len(pending), 500):
+                    page = pending[start:start + 500]
+                    marks = ",".join("?" * len(page))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})",
+                        page,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vec = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vec
+                        self._remember(key, vec)
+                        self.disk_hits += 1
+
+            self.misses += sum(1 for k in keys if k not in found)
+
+        return [found[k].tolist() if k in found else None for k in keys]
+
+    def put_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        with self._lock:
+            rows = []
+            for key, vector in items:
+                vec = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vec)
+                rows.append((key, vec.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    rows,
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "memory_items": len(self._lru),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Lazy-initialize the process-wide cache (None when disabled)."""
+    global _cache
+    if not settings.embedding_cache_enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                max_items=settings.embedding_cache_max_items,
+                path=settings.embedding_cache_path or None,
+            )
+    return _cache
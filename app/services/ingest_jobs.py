@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.settings import settings
+from app.models.docs import DocIn, IngestJobFailure, IngestJobStatus
+from app.services import openai_scheduler, rag_service
+
+log = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a batch does not fit in the ingestion queue (maps to 429)."""
+
+
+class _Job:
+    def __init__(self, job_id: str, total: int):
+        self.job_id = job_id
+        self.total = total
+        self.succeeded = 0
+        self.failures: List[IngestJobFailure] = []
+        self.chunks_indexed = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + len(self.failures)
+
+    def status(self) -> IngestJobStatus:
+        if self.finished_at is not None:
+            state = "completed_with_errors" if self.failures else "completed"
+        elif self.started_at is not None:
+            state = "running"
+        else:
+            state = "queued"
+
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        return IngestJobStatus(
+            job_id=self.job_id,
+            status=state,
+            total=self.total,
+            succeeded=self.succeeded,
+            failed=len(self.failures),
+            chunks_indexed=self.chunks_indexed,
+            elapsed_seconds=round(elapsed, 3),
+            docs_per_second=round(self.processed / elapsed, 3) if elapsed else 0.0,
+            chunks_per_second=round(self.chunks_indexed / elapsed, 3) if elapsed else 0.0,
+            failures=self.failures,
+        )
+
+
+# Bounded queue of (job_id, doc) drained by settings.ingest_workers tasks
+_queue: Optional["asyncio.Queue[Tuple[str, DocIn]]"] = None
+_workers: List[asyncio.Task] = []
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_jobs: "OrderedDict[str, _Job]" = OrderedDict()
+
+
+async def _worker(n: int) -> None:
+    assert _queue is not None
+    queue = _queue
+    # Ingestion embeddings queue behind /chat and /docs/search when rate limited
+    openai_scheduler.set_priority(openai_scheduler.BACKGROUND)
+    while True:
+        job_id, doc = await queue.get()
+        job = _jobs.get(job_id)
+        try:
+            if job is not None and job.started_at is None:
+                job.started_at = time.time()
+            result = await rag_service.index_document(
+                doc_id=doc.doc_id,
+                content=doc.text,
+                source=doc.title,
+                tags=doc.tags,
+                chunk_tokens=doc.chunk_tokens,
+                chunk_overlap=doc.chunk_overlap,
+                mode=doc.mode,
+                tenant=doc.tenant,
+                created_at=doc.created_at,
+            )
+            if job is not None:
+                job.succeeded += 1
+                job.chunks_indexed += result.chunks
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception("Ingest worker %d failed on doc_id=%s", n, doc.doc_id)
+            if job is not None:
+                job.failures.append(IngestJobFailure(doc_id=doc.doc_id, error=str(e)))
+        finally:
+            if job is not None and job.processed >= job.total:
+                job.finished_at = time.time()
+            queue.task_done()
+
+
+def start() -> None:
+    """
+    Start the queue and worker pool on the running event loop.
+    Safe to call repeatedly; restarts if the loop changed.
+    """
+    global _queue, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is loop and _workers:
+        return
+
+    _loop = loop
+    _queue = asyncio.Queue(maxsize=settings.ingest_queue_size)
+    _workers.clear()
+    for n in range(max(1, settings.ingest_workers)):
+        _workers.append(asyncio.create_task(_worker(n), name=f"ingest-worker-{n}"))
+    log.info(
+        "Started %d ingest workers (queue size %d)",
+        len(_workers),
+        settings.ingest_queue_size,
+    )
+
+
+async def stop() -> None:
+    global _queue, _loop
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+    _loop = None
+
+
+def submit(docs: List[DocIn]) -> IngestJobStatus:
+    """
+    Enqueue a batch of documents as one job.
+
+    The whole batch is rejected with QueueFullError if it does not fit,
+    so bursts get backpressure instead of an unbounded backlog (unless
+    INGEST_QUEUE_SIZE is 0, which asyncio.Queue takes as unbounded).
+    """
+    start()
+    assert _queue is not None
+
+    free = _queue.maxsize - _queue.qsize()
+    if _queue.maxsize > 0 and len(docs) > free:
+        raise QueueFullError(
+            f"Ingestion queue is full ({_queue.qsize()}/{_queue.maxsize}); retry later."
+        )
+
+    job = _Job(job_id=str(uuid.uuid4()), total=len(docs))
+    _jobs[job.job_id] = job
+    while len(_jobs) > settings.ingest_job_retention:
+        _jobs.popitem(last=False)
+
+    if not docs:
+        job.started_at = job.finished_at = time.time()
+    for doc in docs:
+        _queue.put_nowait((job.job_id, doc))
+
+    log.info("Queued ingest job %s with %d docs", job.job_id, len(docs))
+    return job.status()
+
+
+def get_status(job_id: str) -> Optional[IngestJobStatus]:
+    job = _jobs.get(job_id)
+    return job.status() if job is not None else None
+
+
+def queue_stats() -> Dict[str, int]:
+    return {
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "capacity": settings.ingest_queue_size,
+        "workers": len(_workers),
+    }
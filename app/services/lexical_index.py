@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.settings import settings
+from app.services.vector_store import PayloadFilter
+
+log = logging.getLogger(__name__)
+
+_index: Optional["LexicalIndex"] = None
+_index_lock = threading.Lock()
+
+# Keep identifiers like ERR-1234 or snake_case names as single terms
+_TERM = re.compile(r"[\w][\w\-]*")
+_TOKENIZER = "unicode61 tokenchars '-_'"
+
+# Filterable payload fields stored next to each chunk (added to older index files)
+_FILTER_COLUMNS = {"tenant": "TEXT", "tags": "TEXT", "created_at": "REAL"}
+_RANGE_SQL = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+class LexicalHit(NamedTuple):
+    point_id: str
+    doc_id: str
+    chunk_index: int
+    source: Optional[str]
+    text: str
+    score: float  # BM25, higher is better
+
+
+def query_terms(query: str) -> List[str]:
+    return [t.lower() for t in _TERM.findall(query)]
+
+
+def looks_like_identifier(query: str) -> bool:
+    """Error codes, versions, snake/kebab names, CamelCase or ACRONYM product names."""
+    for term in _TERM.findall(query):
+        if any(c.isdigit() for c in term) or "-" in term or "_" in term:
+            return True
+        if any(c.isupper() for c in term[1:]):
+            return True
+    return False
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text (SQLite FTS5).
+
+    chunk_rows maps point ids to FTS rowids so updates and deletes are
+    by key instead of scanning the FTS table.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_rows ("
+                "rowid INTEGER PRIMARY KEY, point_id TEXT UNIQUE NOT NULL, "
+                "doc_id TEXT NOT NULL, chunk_index INTEGER NOT NULL, source TEXT)"
+            )
+            self._db.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, tokenize=\"{_TOKENIZER}\")"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(chunk_rows)")}
+            for column, kind in _FILTER_COLUMNS.items():
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE chunk_rows ADD COLUMN {column} {kind}")
+
+    def upsert(self, ids: List[str], payloads: List[dict]) -> None:
+        with self._lock, self._db:
+            self._delete_locked(ids)
+            for point_id, payload in zip(ids, payloads):
+                tags = payload.get("tags")
+                cur = self._db.execute(
+                    "INSERT INTO chunk_rows (point_id, doc_id, chunk_index, source, tenant, tags, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        point_id,
+                        payload.get("doc_id", ""),
+                        payload.get("chunk_index", 0),
+                        payload.get("source"),
+                        payload.get("tenant"),
+                        json.dumps(tags) if tags else None,
+                        payload.get("created_at"),
+                    ),
+                )
+                self._db.execute(
+                    "INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)",
+                    (cur.lastrowid, payload.get("text", "")),
+                )
+
+    def _delete_locked(self, ids: List[str]) -> None:
+        for start in range(0, len(ids), 500):
+            page = ids[start:start + 500]
+            marks = ",".join("?" * len(page))
+            rows = self._db.execute(
+                f"SELECT rowid FROM chunk_rows WHERE point_id IN ({marks})", page
+            ).fetchall()
+            if rows:
+                self._db.executemany("DELETE FROM chunks_fts WHERE rowid = ?", rows)
+                self._db.executemany("DELETE FROM chunk_rows WHERE rowid = ?", rows)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock, self._db:
+            self._delete_locked(ids)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        payload_filter: Optional[PayloadFilter] = None,
+    ) -> List[LexicalHit]:
+        terms = query_terms(query)
+        if not terms or limit <= 0:
+            return []
+        match = " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+
+        sql = (
+            "SELECT r.point_id, r.doc_id, r.chunk_index, r.source, f.text, bm25(chunks_fts) "
+            "FROM chunks_fts f JOIN chunk_rows r ON r.rowid = f.rowid "
+            "WHERE chunks_fts MATCH ?"
+        )
+        params: list = [match]
+        if payload_filter:
+            where, filter_params = _filter_sql(payload_filter)
+            sql += where
+            params.extend(filter_params)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        # FTS5 bm25() is "lower is better"; flip the sign
+        return [
+            LexicalHit(pid, doc_id, idx, source, text, -score)
+            for pid, doc_id, idx, source, text, score in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM chunk_rows").fetchone()
+        return {"chunks": n}
+
+
+def _filter_sql(payload_filter: PayloadFilter) -> Tuple[str, List[Any]]:
+    """SQL conditions on chunk_rows (alias r) for a payload filter (see vector_store.PayloadFilter)."""
+    sql = ""
+    params: List[Any] = []
+    for key, expected in payload_filter.items():
+        if key not in ("doc_id", "source", "chunk_index", *_FILTER_COLUMNS):
+            raise ValueError(f"Cannot filter lexical search on {key!r}")
+        if isinstance(expected, dict):
+            for op, bound in expected.items():
+                if bound is not None:
+                    sql += f" AND r.{key} {_RANGE_SQL[op]} ?"
+                    params.append(bound)
+            continue
+        values = list(expected) if isinstance(expected, (list, tuple, set)) else [expected]
+        marks = ",".join("?" * len(values))
+        if key == "tags":
+            sql += f" AND EXISTS (SELECT 1 FROM json_each(r.tags) WHERE value IN ({marks}))"
+        else:
+            sql += f" AND r.{key} IN ({marks})"
+        params.extend(values)
+    return sql, params
+
+
+def is_decisive(query: str, hits: List[LexicalHit]) -> bool:
+    """
+    True when the lexical match alone is trustworthy enough to skip the
+    embedding call: a short identifier-like query whose terms all occur in
+    the top hit, which clearly outscores the runner-up.
+    """
+    terms = query_terms(query)
+    if not hits or not terms or len(terms) > settings.lexical_fast_path_max_terms:
+        return False
+    if not looks_like_identifier(query):
+        return False
+    top_terms = set(query_terms(hits[0].text))
+    if not all(t in top_terms for t in terms):
+        return False
+    if len(hits) == 1:
+        return True
+    return hits[0].score >= settings.lexical_fast_path_margin * hits[1].score
+
+
+def get_index() -> LexicalIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex(settings.lexical_index_path or None)
+    return _index
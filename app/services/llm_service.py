@@ -1,15 +1,34 @@
+import asyncio
+import json
 import logging
-from typing import List, Dict, Tuple, Optional
+import time
+from typing import Any, AsyncIterator, List, Dict, NamedTuple, Set, Tuple, Optional
 
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAIError
 
-from app.models.schemas import ChatMessage, RetrievedSource
+from app.models.schemas import ChatMessage, RetrievedSource, ToolCall
 from app.core.settings import settings
-from app.services import memory, rag_service
+from app.services import (
+    deadline,
+    memory,
+    metrics,
+    openai_client,
+    openai_scheduler,
+    prompt_budget,
+    rag_service,
+    search_filters,
+    semantic_cache,
+    single_flight,
+    tools as tool_service,
+)
 
 log = logging.getLogger(__name__)
 
-_client: Optional[OpenAI] = None
+# Bounds in-flight chat generations per worker (created lazily on the running loop)
+_chat_slots: Optional[asyncio.Semaphore] = None
+
+# Identical deterministic completions in flight at the same time (opt-in)
+_completion_flight = single_flight.SingleFlight("completion")
 
 # 🔒 System prompt = "instructions" for the agent, constant for all turns
 _SYSTEM_PROMPT = """You are an AI agent in the ai-agent-lab project.
@@ -17,86 +36,380 @@ You answer clearly, concisely, and you explain your reasoning in simple terms wh
 If you don’t know something, say you don’t know instead of guessing."""
 
 
-def get_client() -> OpenAI:
+def get_client() -> AsyncOpenAI:
     """
-    Lazy-initialize a single OpenAI client and reuse it.
+    Return the shared AsyncOpenAI client (pooled connections).
     """
-    global _client
-    if _client is None:
-        if not settings.openai_api_key:
-            # No key: raise a friendly error that the API layer can turn into a 503
-            raise RuntimeError(
-                "OPENAI_API_KEY is missing. Set it in your environment to enable /chat."
-            )
-        _client = OpenAI(api_key=settings.openai_api_key)
-    return _client
+    if not settings.openai_api_key:
+        # No key: raise a friendly error that the API layer can turn into a 503
+        raise RuntimeError(
+            "OPENAI_API_KEY is missing. Set it in your environment to enable /chat."
+        )
+    return openai_client.get_openai()
+
+
+def _message_content(message: Any) -> str:
+    """
+    Text of a completion message. The SDK returns an object with .content;
+    plain dicts (e.g. test doubles) are accepted too.
+    """
+    if isinstance(message, dict):
+        return message.get("content") or ""
+    return message.content or ""
 
 
-def generate_chat_response(
+def _get_chat_slots() -> asyncio.Semaphore:
+    global _chat_slots
+    if _chat_slots is None:
+        _chat_slots = asyncio.Semaphore(max(1, settings.chat_max_concurrency))
+    return _chat_slots
+
+
+async def generate_chat_response(
     session_id: Optional[str],
     user_message: str,
     model: Optional[str],
     temperature: Optional[float],
     use_rag: bool = True,
     rag_top_k: int = 3,
-) -> Tuple[str, str, List[ChatMessage], List[RetrievedSource]]:
+    use_tools: bool = False,
+) -> Tuple[str, str, List[ChatMessage], List[RetrievedSource], bool, List[ToolCall]]:
     """
     Core brain of our backend:
     - figure out the session_id
+    - (optional) answer from the semantic cache
     - build messages = [system prompt + optional RAG context + history + new user message]
-    - call OpenAI
+    - call OpenAI (with use_tools: the tool-calling loop, see _run_agent)
     - update memory
-    - return (session_id, reply, history, sources)
-    """
+    - return (session_id, reply, history, sources, cached, tool_calls)
 
-    # 1) Ensure we have a session_id
-    sid = memory.ensure_session_id(session_id)
+    At most settings.chat_max_concurrency calls run at once per worker;
+    the rest wait for a slot instead of holding a thread.
+    """
+    async with _get_chat_slots():
+        return await _generate_chat_response(
+            session_id,
+            user_message,
+            model,
+            temperature,
+            use_rag=use_rag,
+            rag_top_k=rag_top_k,
+            use_tools=use_tools,
+        )
 
-    # 2) Start with the system prompt
-    messages: List[Dict[str, str]] = [
-        {"role": "system", "content": _SYSTEM_PROMPT}
-    ]
 
+async def _build_messages(
+    sid: str,
+    user_message: str,
+    model: str,
+    use_rag: bool,
+    rag_top_k: int,
+    query_vector: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, str]], List[RetrievedSource]]:
+    """
+    messages = [system prompt + optional RAG context + summary + history + new user message],
+    fitted into the model's prompt token budget (see prompt_budget).
+    Returns only the sources that made it into the prompt.
+    """
     sources: List[RetrievedSource] = []
 
-    # 3) (optional) RAG: pull context from Qdrant
+    # (optional) RAG: pull context from the vector store
     if use_rag:
-        sources = rag_service.retrieve_for_query(user_message, limit=rag_top_k)
-        if sources:
-            context_blocks: List[str] = []
-            for idx, s in enumerate(sources, start=1):
-                context_blocks.append(f"[{idx}] {s.title}\n{s.text}")
-
-            context_text = "\n\n".join(context_blocks)
-            messages.append(
-                {
-                    "role": "system",
-                    "content": (
-                        "Here is some context from internal documents. "
-                        "Use it when relevant, and mention it if you rely on it:\n\n"
-                        f"{context_text}"
-                    ),
-                }
+        with metrics.timed("retrieve"):
+            sources = await rag_service.retrieve_for_query(
+                user_message, limit=rag_top_k, query_vector=query_vector
             )
 
-    # 4) Add conversation history
-    history = memory.get_history(sid)
-    messages.extend({"role": m.role, "content": m.content} for m in history)
+    with metrics.timed("prompt_assembly"):
+        history = await memory.get_history(sid)
+        plan = prompt_budget.assemble(
+            system_prompt=_SYSTEM_PROMPT,
+            sources=sources,
+            history=history,
+            summary=await memory.get_summary(sid),
+            user_message=user_message,
+            budget=prompt_budget.budget_for(model),
+        )
 
-    # 5) Add the latest user message
-    messages.append({"role": "user", "content": user_message})
+    if plan.overflow:
+        # Older turns no longer fit: fold them into the summary off the hot path
+        _schedule_compaction(sid, plan.overflow)
 
-    client = get_client()
+    return plan.messages, plan.sources
+
+
+# Sessions with a compaction in flight, and strong refs to background tasks
+_compacting: Set[str] = set()
+_background: Set[asyncio.Task] = set()
+
+_SUMMARY_PROMPT = """Summarize the conversation below for your own future reference.
+Keep facts, decisions, names, numbers and open questions. Be concise."""
+
+
+def _schedule_compaction(sid: str, n_messages: int) -> None:
+    if sid in _compacting:
+        return
+    _compacting.add(sid)
+    task = asyncio.create_task(_compact_history(sid, n_messages))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _compact_history(sid: str, n_messages: int) -> None:
+    """
+    Fold the oldest n_messages (plus any previous summary) into a new
+    rolling summary, then drop those messages from history.
+    """
+    try:
+        # The marker, not a count: turns appended while the summary is
+        # generated may trim the oldest messages before compaction
+        history, upto = await memory.oldest_messages(sid, n_messages)
+        if not history:
+            return
+        previous = await memory.get_summary(sid)
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in history)
+        if previous is not None:
+            transcript = f"Earlier summary:\n{previous.text}\n\n{transcript}"
+
+        client = get_client()
+        messages = [
+            {"role": "system", "content": _SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+        # Housekeeping: queued behind interactive calls when rate limited
+        with openai_scheduler.priority(openai_scheduler.BACKGROUND):
+            resp = await openai_scheduler.call(
+                lambda: client.chat.completions.create(
+                    model=settings.summary_model or settings.openai_model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=settings.summary_max_tokens,
+                ),
+                tokens=_estimate_tokens(messages, settings.summary_max_tokens),
+            )
+        metrics.record_usage(settings.summary_model or settings.openai_model, getattr(resp, "usage", None))
+        summary = _message_content(resp.choices[0].message)
+        await memory.compact_history(sid, upto, summary.strip())
+        log.info("Compacted %d messages of session %s into summary", len(history), sid)
+    except Exception:
+        # Not fatal: the turns are simply left out of the prompt
+        log.exception("History compaction failed for session %s", sid)
+    finally:
+        _compacting.discard(sid)
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]], reply_tokens: Optional[int] = None) -> int:
+    return openai_scheduler.estimate_tokens(
+        [m.get("content") or "" for m in messages],
+        reply_tokens if reply_tokens is not None else settings.openai_reply_token_estimate,
+    )
+
+
+async def _create_completion(
+    client: AsyncOpenAI,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    tools: Optional[List[Dict[str, Any]]] = None,
+) -> Any:
+    """
+    Non-streaming chat completion. With settings.single_flight_completions,
+    concurrent temperature=0 requests with identical prompts share one call.
+    """
+    extra = {"tools": tools} if tools else {}
+
+    async def _create():
+        with metrics.timed("llm"):
+            resp = await openai_scheduler.call(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    **extra,
+                ),
+                tokens=_estimate_tokens(messages),
+            )
+        metrics.record_usage(model, getattr(resp, "usage", None))
+        return resp
+
+    if not (settings.single_flight_completions and temperature == 0):
+        return await _create()
+    key = (model, json.dumps([messages, tools], sort_keys=True))
+    return await _completion_flight.do(key, _create)
+
+
+def _tool_calls(message: Any) -> List[Tuple[str, str, str]]:
+    """(id, name, arguments) of the tool calls in a completion message (SDK object or dict)."""
+    if isinstance(message, dict):
+        calls = message.get("tool_calls") or []
+        return [(c["id"], c["function"]["name"], c["function"].get("arguments") or "{}") for c in calls]
+    calls = getattr(message, "tool_calls", None) or []
+    return [(c.id, c.function.name, c.function.arguments or "{}") for c in calls]
+
+
+async def _call_tool(name: str, arguments: str, timeout: float) -> Tuple[dict, ToolCall]:
+    started = time.perf_counter()
+    result = await tool_service.run_tool(name, arguments, timeout=timeout)
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        parsed = None
+    record = ToolCall(
+        name=name,
+        arguments=parsed if isinstance(parsed, dict) else {"raw": arguments},
+        ok="error" not in result,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return result, record
+
+
+async def _run_agent(
+    client: AsyncOpenAI,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+) -> Tuple[str, List[ToolCall], List[RetrievedSource]]:
+    """
+    Tool-calling loop: ask the model, run all tool calls of that turn
+    concurrently, append the results, and ask again until it answers.
+
+    Bounded by settings.agent_max_steps model turns and agent_max_seconds
+    of wall-clock time (tools get at most what is left). When either runs
+    out the model is asked once more without tools, so it answers with
+    what it has. Returns (reply, tool calls made, sources found by search).
+    """
+    messages = list(messages)
+    records: List[ToolCall] = []
+    sources: List[RetrievedSource] = []
+    budget_end = time.perf_counter() + settings.agent_max_seconds
+    max_steps = max(1, settings.agent_max_steps)
+
+    step = 0
+    while True:
+        step += 1
+        final = step >= max_steps or time.perf_counter() >= budget_end
+        resp = await _create_completion(
+            client, model, messages, temperature,
+            tools=None if final else tool_service.tool_specs(),
+        )
+        message = resp.choices[0].message
+        calls = _tool_calls(message)
+        if final or not calls:
+            return _message_content(message), records, sources
+
+        messages.append({
+            "role": "assistant",
+            "content": _message_content(message) or None,
+            "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": name, "arguments": args}}
+                for call_id, name, args in calls
+            ],
+        })
+        timeout = max(0.0, min(deadline.timeout(settings.tool_timeout), budget_end - time.perf_counter()))
+        results = await asyncio.gather(
+            *(_call_tool(name, args, timeout) for _, name, args in calls)
+        )
+        for (call_id, name, _), (result, record) in zip(calls, results):
+            records.append(record)
+            if name == "search_documents":
+                sources.extend(RetrievedSource(**r) for r in result.get("results", []))
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call_id,
+                "content": json.dumps(result)[:settings.tool_result_max_chars],
+            })
+
+
+class _CacheProbe(NamedTuple):
+    scope: Optional[str]
+    query_vector: Optional[List[float]]
+    hit: Optional[semantic_cache.CachedAnswer]
+
+
+async def _probe_semantic_cache(
+    sid: str,
+    user_message: str,
+    model: str,
+    temperature: float,
+    use_rag: bool,
+    rag_top_k: int,
+) -> _CacheProbe:
+    """
+    Look the question up in the semantic cache (if enabled).
+
+    Only first turns are cached: follow-ups depend on history, which the
+    cache key does not capture. The query embedding is returned so RAG can
+    reuse it instead of embedding the message a second time.
+    """
+    cache = semantic_cache.get_cache()
+    if cache is None or await memory.get_history(sid):
+        return _CacheProbe(None, None, None)
+
+    query_vector = await rag_service.embed_text(user_message)
+    scope = semantic_cache.make_scope(
+        model, temperature, _SYSTEM_PROMPT, use_rag, rag_top_k,
+        filter_key=search_filters.cache_key(search_filters.current()),
+    )
+    with metrics.timed("semantic_cache"):
+        hit = cache.lookup(scope, query_vector)
+    metrics.CACHE_EVENTS.inc(cache="semantic", result="hit" if hit is not None else "miss")
+    return _CacheProbe(scope, query_vector, hit)
+
+
+def _remember_answer(
+    probe: _CacheProbe,
+    user_message: str,
+    reply: str,
+    sources: List[RetrievedSource],
+) -> None:
+    cache = semantic_cache.get_cache()
+    if cache is not None and probe.scope is not None and probe.query_vector is not None:
+        cache.store(probe.scope, probe.query_vector, user_message, reply, sources)
+
+
+async def _generate_chat_response(
+    session_id: Optional[str],
+    user_message: str,
+    model: Optional[str],
+    temperature: Optional[float],
+    use_rag: bool,
+    rag_top_k: int,
+    use_tools: bool = False,
+) -> Tuple[str, str, List[ChatMessage], List[RetrievedSource], bool, List[ToolCall]]:
+
+    # 1) Ensure we have a session_id
+    sid = memory.ensure_session_id(session_id)
     model = model or settings.openai_model
     temperature = temperature if temperature is not None else settings.openai_temperature
 
+    # 2) Semantic cache: a hit skips retrieval and the LLM entirely.
+    # Not used with tools: their answers depend on live data.
+    probe = _CacheProbe(None, None, None)
+    if not use_tools:
+        probe = await _probe_semantic_cache(sid, user_message, model, temperature, use_rag, rag_top_k)
+    if probe.hit is not None:
+        await memory.append_message(sid, "user", user_message)
+        await memory.append_message(sid, "assistant", probe.hit.reply)
+        return sid, probe.hit.reply, await memory.get_history(sid), probe.hit.sources, True, []
+
+    # 3) Build the prompt (system + RAG + history + user)
+    messages, sources = await _build_messages(
+        sid, user_message, model, use_rag, rag_top_k, query_vector=probe.query_vector
+    )
+
+    client = get_client()
+
+    tool_calls: List[ToolCall] = []
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-        )
-        reply = resp.choices[0].message["content"]
+        if use_tools:
+            reply, tool_calls, tool_sources = await _run_agent(client, model, messages, temperature)
+            sources = sources + tool_sources
+        else:
+            resp = await _create_completion(client, model, messages, temperature)
+            reply = _message_content(resp.choices[0].message)
+    except deadline.DeadlineExceeded:
+        raise
     except OpenAIError as e:
         log.exception("OpenAI error")
         raise RuntimeError(f"OpenAIError: {getattr(e, 'message', str(e))}")
@@ -104,9 +417,122 @@ def generate_chat_response(
         log.exception("Unexpected LLM error")
         raise RuntimeError(f"LLM error: {str(e)}")
 
-    # 6) Update memory: user message + assistant reply
-    memory.append_message(sid, "user", user_message)
-    memory.append_message(sid, "assistant", reply)
-    updated_history = memory.get_history(sid)
+    # 4) Update memory: user message + assistant reply
+    with metrics.timed("memory_update"):
+        await memory.append_message(sid, "user", user_message)
+        await memory.append_message(sid, "assistant", reply)
+        updated_history = await memory.get_history(sid)
+        _remember_answer(probe, user_message, reply, sources)
+
+    return sid, reply, updated_history, sources, False, tool_calls
+
+
+async def _close_stream(stream: Any) -> None:
+    """
+    Close a completion stream. Called early (disconnect, deadline) this
+    drops the HTTP response, so the model stops generating tokens.
+    """
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is not None:
+        await close()
+
+
+async def stream_chat_response(
+    session_id: Optional[str],
+    user_message: str,
+    model: Optional[str],
+    temperature: Optional[float],
+    use_rag: bool = True,
+    rag_top_k: int = 3,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of generate_chat_response.
+
+    Yields (event, data) pairs:
+    - ("sources", {...}) once, before the LLM call
+    - ("delta", {"content": ...}) per token chunk (a single delta on a cache hit)
+    - ("done", {...}) after memory has been updated
+
+    Memory is only updated when the stream completes, so a client that
+    disconnects mid-answer does not leave a half reply in history.
+    """
+    async with _get_chat_slots():
+        sid = memory.ensure_session_id(session_id)
+        model = model or settings.openai_model
+        temperature = temperature if temperature is not None else settings.openai_temperature
+
+        probe = await _probe_semantic_cache(sid, user_message, model, temperature, use_rag, rag_top_k)
+        if probe.hit is not None:
+            yield "sources", {
+                "session_id": sid,
+                "sources": [s.model_dump() for s in probe.hit.sources],
+                "cached": True,
+            }
+            yield "delta", {"content": probe.hit.reply}
+            await memory.append_message(sid, "user", user_message)
+            await memory.append_message(sid, "assistant", probe.hit.reply)
+            yield "done", {"session_id": sid, "reply": probe.hit.reply, "cached": True}
+            return
+
+        messages, sources = await _build_messages(
+            sid, user_message, model, use_rag, rag_top_k, query_vector=probe.query_vector
+        )
+
+        yield "sources", {
+            "session_id": sid,
+            "sources": [s.model_dump() for s in sources],
+            "cached": False,
+        }
+
+        client = get_client()
+
+        parts: List[str] = []
+        started = time.perf_counter()
+        stream = None
+        try:
+            stream = await openai_scheduler.call(
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                tokens=_estimate_tokens(messages),
+            )
+            chunks = stream.__aiter__()
+            while True:
+                # Stop generating (and paying for) an answer that is out of
+                # time, including while the upstream stalls between chunks
+                try:
+                    chunk = await deadline.wait(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                if getattr(chunk, "usage", None) is not None:
+                    metrics.record_usage(model, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        metrics.STAGE_SECONDS.observe(
+                            time.perf_counter() - started, stage="llm_first_token"
+                        )
+                    parts.append(delta)
+                    yield "delta", {"content": delta}
+        except OpenAIError as e:
+            log.exception("OpenAI error")
+            metrics.ERRORS.inc(stage="llm")
+            raise RuntimeError(f"OpenAIError: {getattr(e, 'message', str(e))}")
+        finally:
+            if stream is not None:
+                await _close_stream(stream)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+
+        reply = "".join(parts)
+        with metrics.timed("memory_update"):
+            await memory.append_message(sid, "user", user_message)
+            await memory.append_message(sid, "assistant", reply)
+            _remember_answer(probe, user_message, reply, sources)
 
-    return sid, reply, updated_history, sources
+        yield "done", {"session_id": sid, "reply": reply, "cached": False}
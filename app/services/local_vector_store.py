@@ -0,0 +1,488 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from qdrant_client.http import models as qmodels
+
+from app.services.vector_store import KEYWORD_FIELDS, PayloadFilter, VectorStore
+
+log = logging.getLogger(__name__)
+
+_MIN_CAPACITY = 1024
+# Candidates scored per block by the quantized scan (bounds its temporary memory)
+_SCAN_BLOCK = 4096
+# Exact search gathers the candidate rows only when they are at most
+# 1/_GATHER_RATIO of the matrix; otherwise all rows are scored in place
+_GATHER_RATIO = 4
+
+
+_RANGE_OPS = {
+    "gt": lambda v, b: v > b,
+    "gte": lambda v, b: v >= b,
+    "lt": lambda v, b: v < b,
+    "lte": lambda v, b: v <= b,
+}
+
+
+def _values(value: Any) -> List[Any]:
+    """A payload value as a list (list fields like tags match on any element)."""
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _matches(payload: Optional[dict], payload_filter: PayloadFilter) -> bool:
+    if payload is None:
+        return False
+    for key, expected in payload_filter.items():
+        value = payload.get(key)
+        if isinstance(expected, dict):
+            if not isinstance(value, (int, float)) or not all(
+                _RANGE_OPS[op](value, bound) for op, bound in expected.items() if bound is not None
+            ):
+                return False
+        elif isinstance(expected, (list, tuple, set)):
+            if not any(v in expected for v in _values(value)):
+                return False
+        elif expected not in _values(value):
+            return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray, quantization: str) -> np.ndarray:
+    """
+    Codes for L2-normalized rows:
+    - int8: symmetric scalar quantization (components are in [-1, 1])
+    - binary: one sign bit per dimension, packed 8 per byte
+    """
+    if quantization == "int8":
+        return np.rint(vectors * 127.0).astype(np.int8)
+    return np.packbits(vectors > 0, axis=1)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process cosine index over a contiguous float32 matrix.
+
+    - rows are L2-normalized on write, so cosine = one matrix product
+    - top-k via argpartition (no full sort)
+    - with a directory: vectors live in a memory-mapped file and
+      ids/payloads in SQLite, so the index survives restarts
+    - deleted rows are tombstoned and reused by later inserts
+    - quantization="int8" | "binary" keeps compact codes in RAM, scans
+      those and rescores only the top limit * oversampling rows with the
+      full-precision vectors (which can then stay on disk)
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        vector_size: int,
+        directory: Optional[str] = None,
+        quantization: str = "none",
+        oversampling: float = 3.0,
+    ):
+        super().__init__(collection_name, vector_size)
+        if quantization not in ("none", "int8", "binary"):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self._codes: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[dict]] = []
+        self._row_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        # (field, value) -> rows, for the KEYWORD_FIELDS filters use
+        self._by_value: Dict[Tuple[str, Any], Set[int]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._vectors_path: Optional[str] = None
+
+        if directory:
+            base = os.path.join(directory, collection_name)
+            os.makedirs(base, exist_ok=True)
+            self._vectors_path = os.path.join(base, "vectors.f32")
+            self._db = sqlite3.connect(os.path.join(base, "points.sqlite3"), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS points ("
+                "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._db.commit()
+            self._load()
+        else:
+            self._matrix = np.zeros((_MIN_CAPACITY, vector_size), dtype=np.float32)
+            self._alive = np.zeros(_MIN_CAPACITY, dtype=bool)
+            self._init_codes()
+
+    # --- storage ---
+
+    def _init_codes(self) -> None:
+        if self.quantization == "none":
+            return
+        capacity = self._matrix.shape[0]
+        width = self.vector_size if self.quantization == "int8" else -(-self.vector_size // 8)
+        dtype = np.int8 if self.quantization == "int8" else np.uint8
+        self._codes = np.zeros((capacity, width), dtype=dtype)
+        alive = np.flatnonzero(self._alive)
+        # Rebuild codes from stored vectors in blocks (bounded temporary memory)
+        for start in range(0, alive.size, 8192):
+            rows = alive[start:start + 8192]
+            self._codes[rows] = _quantize(np.asarray(self._matrix[rows]), self.quantization)
+
+    def _open_matrix(self, capacity: int) -> np.ndarray:
+        assert self._vectors_path is not None
+        nbytes = capacity * self.vector_size * 4
+        mode = "r+b" if os.path.exists(self._vectors_path) else "w+b"
+        with open(self._vectors_path, mode) as f:
+            f.truncate(nbytes)
+        return np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.vector_size),
+        )
+
+    def _load(self) -> None:
+        assert self._db is not None
+        rows = self._db.execute("SELECT row, id, payload FROM points ORDER BY row").fetchall()
+        count = rows[-1][0] + 1 if rows else 0
+
+        existing = 0
+        if self._vectors_path and os.path.exists(self._vectors_path):
+            existing = os.path.getsize(self._vectors_path) // (self.vector_size * 4)
+        capacity = max(_MIN_CAPACITY, existing, count)
+        self._matrix = self._open_matrix(capacity)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+        self._ids = [None] * count
+        self._payloads = [None] * count
+        for row, point_id, payload in rows:
+            self._ids[row] = point_id
+            self._payloads[row] = json.loads(payload)
+            self._index_row(row)
+            self._row_of[point_id] = row
+            self._alive[row] = True
+        self._free = [r for r in range(count) if not self._alive[r]]
+        self._init_codes()
+        log.info("Loaded local vector index %s (%d points)", self.collection_name, len(rows))
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        if self._vectors_path:
+            self._matrix.flush()
+            del self._matrix
+            self._matrix = self._open_matrix(new_capacity)
+        else:
+            grown = np.zeros((new_capacity, self.vector_size), dtype=np.float32)
+            grown[:capacity] = self._matrix
+            self._matrix = grown
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:capacity] = self._alive
+        self._alive = alive
+        if self._codes is not None:
+            codes = np.zeros((new_capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+            codes[:capacity] = self._codes
+            self._codes = codes
+
+    def _index_row(self, row: int) -> None:
+        payload = self._payloads[row] or {}
+        for key in KEYWORD_FIELDS:
+            for value in _values(payload.get(key)):
+                self._by_value.setdefault((key, value), set()).add(row)
+
+    def _unindex_row(self, row: int) -> None:
+        payload = self._payloads[row] or {}
+        for key in KEYWORD_FIELDS:
+            for value in _values(payload.get(key)):
+                rows = self._by_value.get((key, value))
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._by_value[(key, value)]
+
+    def _filter_mask(self, payload_filter: PayloadFilter, count: int) -> np.ndarray:
+        """
+        Rows matching payload_filter: keyword conditions come from the value
+        index, only the rows left are checked for the other conditions.
+        """
+        mask = self._alive[:count].copy()
+        rest: PayloadFilter = {}
+        for key, expected in payload_filter.items():
+            if key not in KEYWORD_FIELDS or isinstance(expected, dict):
+                rest[key] = expected
+                continue
+            values = expected if isinstance(expected, (list, tuple, set)) else [expected]
+            hit = np.zeros(count, dtype=bool)
+            for value in values:
+                rows = self._by_value.get((key, value))
+                if rows:
+                    hit[list(rows)] = True
+            mask &= hit
+        if rest:
+            for row in np.flatnonzero(mask):
+                if not _matches(self._payloads[row], rest):
+                    mask[row] = False
+        return mask
+
+    # --- VectorStore API ---
+
+    async def _ensure_collection(self) -> None:
+        return None
+
+    def _upsert_sync(self, ids: List[str], vectors: List[List[float]], payloads: List[dict]) -> None:
+        normalized = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.vector_size))
+        with self._lock:
+            rows: List[int] = []
+            for point_id in ids:
+                row = self._row_of.get(point_id)
+                if row is not None:
+                    self._unindex_row(row)
+                else:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = len(self._ids)
+                        self._ids.append(None)
+                        self._payloads.append(None)
+                        self._grow(len(self._ids))
+                    self._row_of[point_id] = row
+                rows.append(row)
+
+            idx = np.asarray(rows)
+            self._matrix[idx] = normalized
+            self._alive[idx] = True
+            if self._codes is not None:
+                self._codes[idx] = _quantize(normalized, self.quantization)
+            for row, point_id, payload in zip(rows, ids, payloads):
+                self._ids[row] = point_id
+                self._payloads[row] = payload
+                self._index_row(row)
+
+            if self._db is not None:
+                self._matrix.flush()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO points (row, id, payload) VALUES (?, ?, ?)",
+                    [(r, i, json.dumps(p)) for r, i, p in zip(rows, ids, payloads)],
+                )
+                self._db.commit()
+
+    async def upsert(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        payloads: List[dict],
+    ) -> None:
+        if ids:
+            await asyncio.to_thread(self._upsert_sync, ids, vectors, payloads)
+
+    def _search_sync(
+        self,
+        query_vectors: List[List[float]],
+        limit: int,
+        payload_filter: Optional[PayloadFilter],
+        with_vectors: bool,
+    ) -> List[List[qmodels.ScoredPoint]]:
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.vector_size))
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or limit <= 0:
+                return [[] for _ in range(len(queries))]
+
+            if payload_filter:
+                mask = self._filter_mask(payload_filter, count)
+            else:
+                mask = self._alive[:count].copy()
+            candidates = np.flatnonzero(mask)
+            if candidates.size == 0:
+                return [[] for _ in range(len(queries))]
+
+            k = min(limit, candidates.size)
+            codes = self._codes
+            if codes is None:
+                # (n_queries, n_rows) cosine similarities in one product. Only a
+                # selective filter is worth gathering its rows into a copy; else
+                # score every row in place and rule out the others (tombstones)
+                if candidates.size * _GATHER_RATIO <= count:
+                    rows = candidates
+                    scores = queries @ self._matrix[candidates].T
+                else:
+                    rows = None  # column == row
+                    scores = queries @ self._matrix[:count].T
+                    scores[:, ~mask] = -np.inf
+                results = []
+                for q_scores in scores:
+                    cols = self._top(q_scores, k)
+                    hit_rows = cols if rows is None else rows[cols]
+                    results.append(self._hits(hit_rows, q_scores[cols], with_vectors))
+                return results
+
+        # The approximate scan runs without the lock (upserts and other
+        # searches proceed); the shortlist is re-checked under it below
+        shortlist = min(candidates.size, max(k, int(np.ceil(k * self.oversampling))))
+        shortlists = self._scan_codes(codes, queries, candidates, shortlist)
+
+        with self._lock:
+            results = []
+            for q, rows in zip(queries, shortlists):
+                # Rows deleted (or reused for another point) during the scan
+                keep = self._alive[rows]
+                if payload_filter:
+                    keep &= np.fromiter(
+                        (_matches(self._payloads[r], payload_filter) for r in rows), dtype=bool, count=rows.size
+                    )
+                rows = rows[keep]
+                if rows.size == 0:
+                    results.append([])
+                    continue
+                exact = np.asarray(self._matrix[rows]) @ q
+                best = self._top(exact, min(k, rows.size))
+                results.append(self._hits(rows[best], exact[best], with_vectors))
+            return results
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray, with_vectors: bool) -> List[qmodels.ScoredPoint]:
+        return [
+            qmodels.ScoredPoint(
+                id=self._ids[row],
+                version=0,
+                score=float(score),
+                payload=self._payloads[row],
+                vector=self._matrix[row].tolist() if with_vectors else None,
+            )
+            for row, score in zip(rows.tolist(), scores)
+        ]
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k largest scores, best first (argpartition, no full sort)."""
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _scan_codes(
+        self,
+        codes: np.ndarray,
+        queries: np.ndarray,
+        candidates: np.ndarray,
+        shortlist: int,
+    ) -> List[np.ndarray]:
+        """
+        Rows of the `shortlist` best approximate scores per query. Codes are
+        scanned in blocks of _SCAN_BLOCK candidates with a running top list,
+        so temporary memory does not grow with the collection.
+        """
+        n = len(queries)
+        best_scores = np.empty((n, 0), dtype=np.float32)
+        best_rows = np.empty((n, 0), dtype=np.int64)
+        bits = np.packbits(queries > 0, axis=1) if self.quantization == "binary" else None
+        for start in range(0, candidates.size, _SCAN_BLOCK):
+            rows = candidates[start:start + _SCAN_BLOCK]
+            block = codes[rows]
+            if bits is None:
+                approx = queries @ block.T.astype(np.float32)
+            else:
+                # Fewer differing sign bits = closer; negate so larger is better
+                approx = np.stack([
+                    -np.bitwise_count(q_bits ^ block).sum(axis=1, dtype=np.int32) for q_bits in bits
+                ]).astype(np.float32)
+            scores = np.concatenate([best_scores, approx], axis=1)
+            merged = np.concatenate([best_rows, np.broadcast_to(rows, (n, rows.size))], axis=1)
+            if scores.shape[1] > shortlist:
+                keep = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                merged = np.take_along_axis(merged, keep, axis=1)
+            best_scores, best_rows = scores, merged
+        return list(best_rows)
+
+    async def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        payload_filter: Optional[PayloadFilter] = None,
+        with_vectors: bool = False,
+    ) -> List[List[qmodels.ScoredPoint]]:
+        # Matrix products release the GIL; keep them off the event loop
+        return await asyncio.to_thread(
+            self._search_sync, query_vectors, limit, payload_filter, with_vectors
+        )
+
+    def _delete_sync(self, ids: List[str]) -> None:
+        with self._lock:
+            rows = [self._row_of.pop(i) for i in ids if i in self._row_of]
+            for row in rows:
+                self._unindex_row(row)
+                self._alive[row] = False
+                self._ids[row] = None
+                self._payloads[row] = None
+                self._free.append(row)
+            if self._db is not None and rows:
+                self._db.executemany("DELETE FROM points WHERE row = ?", [(r,) for r in rows])
+                self._db.commit()
+
+    async def delete(self, ids: List[str]) -> None:
+        if ids:
+            await asyncio.to_thread(self._delete_sync, ids)
+
+    def _update_payloads_sync(self, ids: List[str], payloads: List[dict]) -> None:
+        with self._lock:
+            updates = [
+                (self._row_of[i], i, p) for i, p in zip(ids, payloads) if i in self._row_of
+            ]
+            for row, _, payload in updates:
+                self._unindex_row(row)
+                self._payloads[row] = payload
+                self._index_row(row)
+            if self._db is not None and updates:
+                self._db.executemany(
+                    "UPDATE points SET payload = ? WHERE row = ?",
+                    [(json.dumps(p), r) for r, _, p in updates],
+                )
+                self._db.commit()
+
+    async def update_payloads(self, ids: List[str], payloads: List[dict]) -> None:
+        if ids:
+            await asyncio.to_thread(self._update_payloads_sync, ids, payloads)
+
+    async def scroll(
+        self,
+        batch_size: int = 256,
+        with_vectors: bool = True,
+    ) -> AsyncIterator[List[qmodels.Record]]:
+        with self._lock:
+            rows = sorted(self._row_of.values())
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = [
+                    qmodels.Record(
+                        id=self._ids[r],
+                        payload=self._payloads[r],
+                        vector=self._matrix[r].tolist() if with_vectors else None,
+                    )
+                    for r in rows[start:start + batch_size]
+                    if self._alive[r]
+                ]
+            yield batch
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._row_of)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._matrix.flush()
+                self._db.close()
+                self._db = None
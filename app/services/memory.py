@@ -1,26 +1,401 @@
-from collections import defaultdict, deque
-from typing import Deque, Dict, List
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
 import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
 
-MAX_MESSAGES = 20
+from app.core.settings import settings
+from app.services.tokens import count_message_tokens
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGES = settings.session_max_messages
+
+# Compact message representation: (role code, content, prompt tokens).
+# Token counts are computed once on append and reused by prompt budgeting.
+_ROLES = ("user", "assistant", "system")
+_ROLE_CODE = {role: code for code, role in enumerate(_ROLES)}
+Message = Tuple[int, str, int]
+
+_store: Optional["SessionStore"] = None
+_store_lock = threading.Lock()
+
+
+def _as_dicts(messages: List[Message]) -> List[dict]:
+    return [
+        {"role": _ROLES[code], "content": content, "tokens": tokens}
+        for code, content, tokens in messages
+    ]
+
+
+class Summary(NamedTuple):
+    """Rolling summary of turns that were compacted out of the history."""
+    text: str
+    tokens: int
+
+
+class SessionStore(ABC):
+    """
+    Session history backend.
+
+    Sessions idle for longer than ttl_seconds are evicted, and past
+    max_sessions the least recently used session is dropped.
+    """
+
+    # Calls may wait on I/O: the async helpers below run them in a thread
+    blocking = False
+
+    def __init__(self, max_messages: int, max_sessions: int, ttl_seconds: float):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    def get(self, session_id: str) -> List[Message]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, role: str, content: str) -> None:
+        ...
+
+    @abstractmethod
+    def reset(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_summary(self, session_id: str) -> Optional[Summary]:
+        ...
+
+    @abstractmethod
+    def oldest(self, session_id: str, n_messages: int) -> Tuple[List[Message], int]:
+        """
+        The oldest n_messages and a marker just past the last of them.
+        Markers identify messages, not positions: they stay valid while
+        newer turns are appended (and the oldest trimmed).
+        """
+        ...
+
+    @abstractmethod
+    def compact(self, session_id: str, upto: int, summary: str) -> None:
+        """Replace the messages before marker `upto` (see oldest) with a rolling summary."""
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+
+class _Session:
+    __slots__ = ("last_access", "messages", "summary", "dropped")
+
+    def __init__(self, last_access: float, max_messages: int):
+        self.last_access = last_access
+        self.messages: Deque[Message] = deque(maxlen=max_messages)
+        self.summary: Optional[Summary] = None
+        # Messages ever removed from the head: messages[i] is message number dropped + i
+        self.dropped = 0
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process store: OrderedDict in least-recently-used order."""
+
+    def __init__(self, max_messages: int, max_sessions: int, ttl_seconds: float):
+        super().__init__(max_messages, max_sessions, ttl_seconds)
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        # Oldest access first, so stop at the first live session
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def _touch(self, session_id: str, now: float) -> Optional[_Session]:
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def get(self, session_id: str) -> List[Message]:
+        with self._lock:
+            session = self._touch(session_id, time.monotonic())
+            return list(session.messages) if session is not None else []
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        now = time.monotonic()
+        tokens = count_message_tokens(content)
+        with self._lock:
+            session = self._touch(session_id, now)
+            if session is None:
+                session = self._sessions[session_id] = _Session(now, self.max_messages)
+            if len(session.messages) == session.messages.maxlen:
+                session.dropped += 1
+            session.messages.append((_ROLE_CODE[role], content, tokens))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def reset(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_summary(self, session_id: str) -> Optional[Summary]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.summary if session is not None else None
+
+    def oldest(self, session_id: str, n_messages: int) -> Tuple[List[Message], int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return [], 0
+            head = list(session.messages)[:n_messages]
+            return head, session.dropped + len(head)
+
+    def compact(self, session_id: str, upto: int, summary: str) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            # Some of them may already have been trimmed by newer turns
+            n = min(max(0, upto - session.dropped), len(session.messages))
+            for _ in range(n):
+                session.messages.popleft()
+            session.dropped += n
+            session.summary = Summary(summary, count_message_tokens(summary))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+                "max_sessions": self.max_sessions,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Store shared by all worker processes on one host (SQLite in WAL mode).
+    Expiry runs at most every few seconds per process.
+    """
+
+    _SWEEP_INTERVAL = 5.0
+    # Can wait up to the 10s busy timeout on another worker's write
+    blocking = True
+
+    def __init__(self, path: str, max_messages: int, max_sessions: int, ttl_seconds: float):
+        super().__init__(max_messages, max_sessions, ttl_seconds)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, last_access REAL NOT NULL, "
+                "summary TEXT, summary_tokens INTEGER)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                "role INTEGER NOT NULL, content TEXT NOT NULL, tokens INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)"
+            )
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < self._SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        cur = self._db.execute(
+            "DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_seconds,)
+        )
+        self.expired += max(cur.rowcount, 0)
+
+        (count,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        if count > self.max_sessions:
+            cur = self._db.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_access LIMIT ?)",
+                (count - self.max_sessions,),
+            )
+            self.evicted += max(cur.rowcount, 0)
+
+        self._db.execute(
+            "DELETE FROM messages WHERE session_id NOT IN (SELECT session_id FROM sessions)"
+        )
+
+    def get(self, session_id: str) -> List[Message]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or now - row[0] > self.ttl_seconds:
+                return []
+            self._db.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+            )
+            rows = self._db.execute(
+                "SELECT role, content, tokens FROM messages WHERE session_id = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (session_id, self.max_messages),
+            ).fetchall()
+        return [(role, content, tokens) for role, content, tokens in reversed(rows)]
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        now = time.time()
+        tokens = count_message_tokens(content)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, now),
+            )
+            self._db.execute(
+                "INSERT INTO messages (session_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+                (session_id, _ROLE_CODE[role], content, tokens),
+            )
+            # Keep only the last max_messages for this session
+            self._db.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id NOT IN ("
+                "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_messages),
+            )
+            self._sweep(now)
+
+    def reset(self, session_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def get_summary(self, session_id: str) -> Optional[Summary]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, summary_tokens FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return Summary(row[0], row[1])
+
+    def oldest(self, session_id: str, n_messages: int) -> Tuple[List[Message], int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, role, content, tokens FROM messages WHERE session_id = ? "
+                "ORDER BY id LIMIT ?",
+                (session_id, n_messages),
+            ).fetchall()
+        if not rows:
+            return [], 0
+        return [(role, content, tokens) for _, role, content, tokens in rows], rows[-1][0] + 1
+
+    def compact(self, session_id: str, upto: int, summary: str) -> None:
+        with self._lock, self._db:
+            # By id: turns appended meanwhile (and trimming) do not shift it
+            self._db.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id < ?", (session_id, upto)
+            )
+            self._db.execute(
+                "UPDATE sessions SET summary = ?, summary_tokens = ? WHERE session_id = ?",
+                (summary, count_message_tokens(summary), session_id),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (sessions,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (messages,) = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()
+        return {
+            "sessions": sessions,
+            "messages": messages,
+            "max_sessions": self.max_sessions,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def get_store() -> SessionStore:
+    """Process-wide session store, per settings.session_backend ("memory" | "sqlite")."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if settings.session_backend == "sqlite":
+                _store = SqliteSessionStore(
+                    settings.session_db_path,
+                    max_messages=MAX_MESSAGES,
+                    max_sessions=settings.session_max_sessions,
+                    ttl_seconds=settings.session_ttl_seconds,
+                )
+            elif settings.session_backend == "memory":
+                _store = InMemorySessionStore(
+                    max_messages=MAX_MESSAGES,
+                    max_sessions=settings.session_max_sessions,
+                    ttl_seconds=settings.session_ttl_seconds,
+                )
+            else:
+                raise RuntimeError(f"Unknown SESSION_BACKEND: {settings.session_backend}")
+    return _store
 
-# session_id -> deque of {"role": ..., "content":...}
-_sessions: Dict[str, Deque[dict]] = defaultdict(
-    lambda: deque(maxlen=MAX_MESSAGES)
-)
 
 def ensure_session_id(session_id: str | None) -> str:
     """If no session_id, create a new one."""
     return session_id or str(uuid.uuid4())
 
-def get_history(session_id: str) -> List[dict]:
-    """Return a list of message dicts for this session."""
-    return list(_sessions[session_id])
+async def _call(method: str, *args):
+    """Run a store method, off the event loop if the backend blocks."""
+    store = get_store()
+    if store.blocking:
+        return await asyncio.to_thread(getattr(store, method), *args)
+    return getattr(store, method)(*args)
+
+async def get_history(session_id: str) -> List[dict]:
+    """
+    Return a list of message dicts for this session (unknown ids -> []).
+    Each dict also carries its cached prompt "tokens".
+    """
+    return _as_dicts(await _call("get", session_id))
+
+async def get_summary(session_id: str) -> Optional[Summary]:
+    """Rolling summary of compacted older turns, if any."""
+    return await _call("get_summary", session_id)
 
-def append_message(session_id: str, role: str, content: str) -> None:
+async def oldest_messages(session_id: str, n_messages: int) -> Tuple[List[dict], int]:
+    """The oldest n_messages as dicts, and the marker to pass to compact_history."""
+    messages, upto = await _call("oldest", session_id, n_messages)
+    return _as_dicts(messages), upto
+
+async def compact_history(session_id: str, upto: int, summary: str) -> None:
+    """Drop the messages before marker `upto` (from oldest_messages), keeping summary in their place."""
+    await _call("compact", session_id, upto, summary)
+
+async def append_message(session_id: str, role: str, content: str) -> None:
     """Add one new message to session history."""
-    _sessions[session_id].append({"role": role, "content": content})
+    await _call("append", session_id, role, content)
 
-def reset_session(session_id: str) -> None:
+async def reset_session(session_id: str) -> None:
     """Clear a session completely (not used yet, but handy)."""
-    _sessions.pop(session_id, None)
+    await _call("reset", session_id)
+
+def stats() -> Dict[str, int]:
+    """Occupancy and eviction counters for sizing the store (sync: called from sync endpoints)."""
+    return get_store().stats()
@@ -0,0 +1,54 @@
+import logging
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.settings import settings
+from app.services import openai_scheduler
+
+log = logging.getLogger(__name__)
+
+# One pooled HTTP client shared by chat completions and embeddings
+_http: Optional[httpx.AsyncClient] = None
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=settings.openai_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_connections,
+            ),
+            # Rate-limit headers feed the scheduler's token buckets
+            event_hooks={"response": [openai_scheduler.observe_response]},
+        )
+    return _http
+
+
+def get_openai() -> AsyncOpenAI:
+    """
+    Lazy-initialize a single AsyncOpenAI client on the shared pool.
+    Callers are expected to check for the API key first.
+    Retries are left to openai_scheduler, so the SDK's own are off.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+    return _client
+
+
+async def aclose() -> None:
+    """Close pooled connections (called from the app lifespan)."""
+    global _http, _client
+    if _http is not None:
+        await _http.aclose()
+    _http = None
+    _client = None
@@ -0,0 +1,324 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, TypeVar
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+
+from app.core.settings import settings
+from app.services import deadline, metrics
+from app.services.tokens import APPROX_CHARS_PER_TOKEN
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Priority classes (lower is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority of OpenAI calls made from the current task (ingestion sets BACKGROUND)
+_priority: ContextVar[int] = ContextVar("openai_priority", default=INTERACTIVE)
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+# Halve the concurrency limit at most this often (one burst of 429s = one decrease)
+_DECREASE_INTERVAL = 1.0
+
+
+class SchedulerTimeout(RuntimeError):
+    """No OpenAI capacity within settings.openai_queue_timeout."""
+
+
+def parse_reset(value: str) -> Optional[float]:
+    """x-ratelimit-reset-* durations ('1s', '6m0s', '20ms') in seconds."""
+    parts = _DURATION.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(texts: List[str], reply_tokens: int = 0) -> int:
+    """Cheap token estimate for rate accounting; the response headers correct it."""
+    return sum(len(t) for t in texts) // APPROX_CHARS_PER_TOKEN + len(texts) + reply_tokens
+
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously. Capacity 0 means unlimited
+    until a limit is learned from response headers.
+    """
+
+    def __init__(self, per_minute: int):
+        self.configured = max(0, per_minute)
+        self.capacity = float(self.configured)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 = now)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # A call bigger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float, now: float) -> None:
+        if self.capacity > 0:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def observe(self, limit: int, remaining: int, reset: Optional[float], now: float) -> None:
+        """
+        Align with the server's view. Only ever lowers the level: our own
+        count already includes calls the server has not seen yet.
+        """
+        self._refill(now)
+        self.capacity = float(min(limit, self.configured) if self.configured else limit)
+        level = min(self.level, float(remaining))
+        if reset is not None:
+            # The server's bucket is full again after `reset` seconds
+            level = min(level, max(0.0, self.capacity - reset * self.capacity / 60))
+        self.level = min(level, self.capacity)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _retry_reason(e: Exception) -> Optional[str]:
+    """Why a failed call is worth retrying, or None if it is not."""
+    if isinstance(e, APIConnectionError):
+        return "connection"
+    if isinstance(e, APIStatusError):
+        if e.status_code == 429:
+            return "rate_limited"
+        if e.status_code >= 500 or e.status_code in (408, 409):
+            return "server_error"
+    return None
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            seconds = float(response.headers[name]) * scale
+        except (KeyError, ValueError):
+            continue
+        if 0 < seconds <= 60:
+            return seconds
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with jitter in [cap/2, cap]."""
+    cap = min(settings.openai_retry_max_delay, settings.openai_retry_base_delay * 2 ** attempt)
+    return cap / 2 + random.uniform(0, cap / 2)
+
+
+class Scheduler:
+    """
+    Admission control for OpenAI calls, shared by completions and embeddings.
+
+    A call waits in a priority queue until there is a concurrency slot and
+    both buckets (requests and estimated tokens per minute) have room;
+    interactive calls are always admitted before background ones. The
+    concurrency limit grows by one per limit's worth of successes and is
+    halved on 429s (AIMD). 429s also pause admission for the advertised
+    retry delay, since the limit is shared by every caller.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.loop = asyncio.get_running_loop()
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: int, tokens: int, timeout: float) -> None:
+        fut = self.loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, fut))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self.release("failed")
+            else:
+                fut.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                left = deadline.remaining()
+                if left is not None and left < 0.01:
+                    raise deadline.DeadlineExceeded("Request deadline exceeded") from None
+                raise SchedulerTimeout(
+                    f"No OpenAI capacity within {timeout:g}s (rate limited)"
+                ) from None
+            raise
+
+    def release(self, outcome: str) -> None:
+        """outcome: "ok", "throttled" (429) or "failed"."""
+        self.in_flight -= 1
+        if outcome == "ok":
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        elif outcome == "throttled":
+            now = time.monotonic()
+            if now - self._last_decrease >= _DECREASE_INTERVAL:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+        self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            _, _, tokens, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return  # the next release dispatches again
+            wait = max(
+                self.paused_until - now,
+                self.requests.delay(1, now),
+                self.tokens.delay(tokens, now),
+            )
+            if wait > 0:
+                self._timer = self.loop.call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _header_int(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _header_int(headers, f"x-ratelimit-remaining-{kind}")
+            if limit is None or remaining is None:
+                continue
+            bucket.observe(limit, remaining, parse_reset(headers.get(f"x-ratelimit-reset-{kind}", "")), now)
+
+    async def run(self, fn: Callable[[], Awaitable[T]], tokens: int, priority: int) -> T:
+        """
+        Run fn once admitted, retrying 429/5xx/connection errors with backoff.
+        Queueing, the call and retries all stay within the request deadline.
+        """
+        attempt = 0
+        while True:
+            with metrics.timed("openai_queue"):
+                await self.acquire(priority, tokens, deadline.timeout(settings.openai_queue_timeout))
+            outcome = "failed"
+            try:
+                result = await deadline.wait(fn())
+                outcome = "ok"
+                return result
+            except (APIStatusError, APIConnectionError) as e:
+                reason = _retry_reason(e)
+                if reason == "rate_limited":
+                    outcome = "throttled"
+                if reason is None or attempt >= settings.openai_max_retries:
+                    raise
+                delay = _retry_after(e) or _backoff(attempt)
+                left = deadline.remaining()
+                if left is not None and delay >= left:
+                    raise  # no time left for another attempt
+                if reason == "rate_limited":
+                    self.pause(delay)
+            finally:
+                self.release(outcome)
+            metrics.OPENAI_RETRIES.inc(reason=reason)
+            log.warning("OpenAI call failed (%s); retry %d in %.2fs", reason, attempt + 1, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": sum(1 for *_, fut in self._waiters if not fut.done()),
+            "concurrency_limit": int(self.limit),
+        }
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """The process-wide scheduler, bound to the running event loop."""
+    global _scheduler
+    if _scheduler is None or _scheduler.loop is not asyncio.get_running_loop():
+        _scheduler = Scheduler(
+            settings.openai_rpm_limit,
+            settings.openai_tpm_limit,
+            settings.openai_max_concurrency,
+        )
+    return _scheduler
+
+
+def stats() -> Dict[str, float]:
+    return _scheduler.stats() if _scheduler is not None else {}
+
+
+def set_priority(level: int) -> None:
+    """Priority for the rest of the current task (e.g. a background worker)."""
+    _priority.set(level)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Run OpenAI calls made inside the block (and tasks it spawns) at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+async def call(fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+    """
+    Run one OpenAI call through the scheduler at the current priority.
+    For streams the slot is held until the response starts, not for the
+    whole stream.
+    """
+    return await get_scheduler().run(fn, tokens, _priority.get())
+
+
+async def observe_response(response: httpx.Response) -> None:
+    """httpx response hook on the OpenAI pool: feeds x-ratelimit-* headers to the scheduler."""
+    if "x-ratelimit-remaining-requests" in response.headers or "x-ratelimit-remaining-tokens" in response.headers:
+        get_scheduler().observe_headers(response.headers)
@@ -0,0 +1,106 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+from app.core.settings import settings
+from app.models.schemas import RetrievedSource
+from app.services.memory import Summary
+from app.services.tokens import count_message_tokens
+
+log = logging.getLogger(__name__)
+
+_CONTEXT_HEADER = (
+    "Here is some context from internal documents. "
+    "Use it when relevant, and mention it if you rely on it:\n\n"
+)
+_SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+
+class PromptPlan(NamedTuple):
+    messages: List[Dict[str, str]]
+    sources: List[RetrievedSource]  # sources that made it into the prompt
+    prompt_tokens: int
+    overflow: int  # oldest history messages that did not fit (to compact)
+
+
+def _parse_budgets(raw: str) -> Dict[str, int]:
+    """PROMPT_TOKEN_BUDGETS="gpt-4o=12000,gpt-4o-mini=6000" -> {model: budget}"""
+    budgets: Dict[str, int] = {}
+    for item in raw.split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            budgets[model.strip()] = int(value)
+    return budgets
+
+
+def budget_for(model: str) -> int:
+    """Prompt token budget for a model (per-model override or the default)."""
+    return _parse_budgets(settings.prompt_token_budgets).get(model, settings.prompt_token_budget)
+
+
+def assemble(
+    system_prompt: str,
+    sources: List[RetrievedSource],
+    history: List[dict],
+    summary: Optional[Summary],
+    user_message: str,
+    budget: int,
+) -> PromptPlan:
+    """
+    Fit [system + RAG context + summary + history + user] into budget tokens.
+
+    - system prompt and the new user message are always sent
+    - RAG sources (best first) may use up to settings.prompt_context_share
+      of what is left; lower-ranked sources that do not fit are dropped
+    - the rolling summary comes next, then history newest-first; the
+      oldest turns that do not fit are reported as overflow so the caller
+      can compact them into the summary
+    History token counts come from memory (cached at append time).
+    """
+    head = [{"role": "system", "content": system_prompt}]
+    tail = [{"role": "user", "content": user_message}]
+    used = count_message_tokens(system_prompt) + count_message_tokens(user_message)
+    remaining = max(0, budget - used)
+
+    # RAG context, in rank order
+    context_budget = int(remaining * settings.prompt_context_share)
+    blocks: List[str] = []
+    kept_sources: List[RetrievedSource] = []
+    context_tokens = count_message_tokens(_CONTEXT_HEADER)
+    for s in sources:
+        block = f"[{len(blocks) + 1}] {s.title}\n{s.text}"
+        cost = count_message_tokens(block)
+        if context_tokens + cost > context_budget:
+            break
+        blocks.append(block)
+        kept_sources.append(s)
+        context_tokens += cost
+    if blocks:
+        head.append({"role": "system", "content": _CONTEXT_HEADER + "\n\n".join(blocks)})
+        remaining -= context_tokens
+        used += context_tokens
+
+    # Rolling summary of compacted turns
+    if summary is not None and summary.tokens <= remaining:
+        head.append({"role": "system", "content": _SUMMARY_HEADER + summary.text})
+        remaining -= summary.tokens
+        used += summary.tokens
+
+    # History, newest first
+    kept = 0
+    for m in reversed(history):
+        tokens = m.get("tokens") or count_message_tokens(m["content"])
+        if tokens > remaining:
+            break
+        remaining -= tokens
+        used += tokens
+        kept += 1
+    recent = history[len(history) - kept:] if kept else []
+    overflow = len(history) - kept
+
+    messages = head + [{"role": m["role"], "content": m["content"]} for m in recent] + tail
+    return PromptPlan(
+        messages=messages,
+        sources=kept_sources,
+        prompt_tokens=used,
+        overflow=overflow,
+    )
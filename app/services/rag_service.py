@@ -1,193 +1,637 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import logging
 import uuid
-from typing import List, Dict, Any, Optional
+import weakref
+from collections import deque
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Callable, Deque, List, Dict, Any, Iterable, Iterator, NamedTuple, Optional, Tuple, TypeVar
 
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import PointStruct, VectorParams, Distance
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from app.core.settings import settings
 from app.models.schemas import RetrievedSource
+from app.services import (
+    chunk_store,
+    chunking,
+    deadline,
+    diversify,
+    doc_manifest,
+    embedding_cache,
+    lexical_index,
+    metrics,
+    openai_client,
+    openai_scheduler,
+    search_filters,
+    single_flight,
+    vector_store,
+)
 
 log = logging.getLogger(__name__)
 
-# --- Qdrant + OpenAI clients ---
+COLLECTION_NAME = settings.qdrant_collection
+# 1536 for text-embedding-3-small unless shortened via EMBEDDING_DIMENSIONS
+EMBED_DIM = settings.embedding_dimensions or 1536
 
-_qdrant: Optional[QdrantClient] = None
-_embeddings_client: Optional[OpenAI] = None
+# Namespace for deterministic point ids: uuid5(doc_id + chunk hash + occurrence)
+_POINT_NAMESPACE = uuid.UUID("6f1c2a8e-3d4b-5c6d-8e9f-0a1b2c3d4e5f")
 
-COLLECTION_NAME = "ai_agent_docs"
-EMBED_DIM = 1536  # for text-embedding-3-small
-CHUNK_SIZE = 400   # chars
-CHUNK_OVERLAP = 80 # chars
+T = TypeVar("T")
 
+# Concurrent identical embedding / vector search calls share one upstream call
+_embed_flight = single_flight.SingleFlight("embed")
+_search_flight = single_flight.SingleFlight("search")
 
-def get_qdrant() -> QdrantClient:
-    global _qdrant
-    if _qdrant is None:
-        _qdrant = QdrantClient(
-            url=settings.qdrant_url,
-            prefer_grpc=False,
-            # No api_key for local Qdrant
-        )
-    return _qdrant
+# One indexing run per doc_id at a time (manifest read-diff-write)
+_doc_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+class IndexResult(NamedTuple):
+    chunks: int    # chunks in the document now
+    embedded: int  # chunks (re-)embedded and upserted
+    moved: int     # unchanged chunks whose position payload was updated
+    deleted: int   # stale chunks removed
+
+
+def get_store() -> vector_store.VectorStore:
+    """Vector store for document chunks (Qdrant or local, per settings)."""
+    return vector_store.get_store(COLLECTION_NAME, EMBED_DIM)
 
 
-def get_embeddings_client() -> OpenAI:
-    global _embeddings_client
-    if _embeddings_client is None:
-        if not settings.openai_api_key:
-            raise RuntimeError("OPENAI_API_KEY missing for embeddings.")
-        _embeddings_client = OpenAI(api_key=settings.openai_api_key)
-    return _embeddings_client
+def get_embeddings_client() -> AsyncOpenAI:
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY missing for embeddings.")
+    return openai_client.get_openai()
 
 
-def ensure_collection() -> None:
+async def ensure_collection() -> None:
     """
     Create the collection if it does not exist.
+    Checked once per process (at startup via the app lifespan, or on first
+    use), then cached by the store.
     """
-    client = get_qdrant()
-    existing = [c.name for c in client.get_collections().collections]
-    if COLLECTION_NAME in existing:
-        return
-
-    log.info("Creating Qdrant collection %s", COLLECTION_NAME)
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(
-            size=EMBED_DIM,
-            distance=Distance.COSINE,
-        ),
-    )
+    await get_store().ensure_collection()
+
+
+async def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many strings with a single embeddings API call.
+    Identical concurrent requests are coalesced into one call.
+    """
+    if not settings.single_flight_enabled:
+        return await _call_embeddings(texts)
+    key = (settings.openai_embedding_model, EMBED_DIM, tuple(texts))
+    return await _embed_flight.do(key, lambda: _call_embeddings(texts))
 
 
-def embed_text(text: str) -> List[float]:
+async def _call_embeddings(texts: List[str]) -> List[List[float]]:
+    """The API may return items out of order, so we sort by index."""
     client = get_embeddings_client()
-    resp = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text,
-    )
-    return resp.data[0].embedding
+    extra = {"dimensions": settings.embedding_dimensions} if settings.embedding_dimensions else {}
+    with metrics.timed("embed"):
+        resp = await openai_scheduler.call(
+            lambda: client.embeddings.create(
+                model=settings.openai_embedding_model,
+                input=texts,
+                **extra,
+            ),
+            tokens=openai_scheduler.estimate_tokens(texts),
+        )
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many strings, serving repeats from the embedding cache.
+    Only unique cache misses are sent to the API.
+    """
+    if not texts:
+        return []
+
+    cache = embedding_cache.get_cache()
+    if cache is None:
+        return await _embed_uncached(texts)
+
+    keys = [
+        embedding_cache.make_key(settings.openai_embedding_model, EMBED_DIM, t)
+        for t in texts
+    ]
+    # SQLite lookups/commits run off the event loop
+    vectors = await asyncio.to_thread(cache.get_many, keys)
+
+    missing: Dict[str, str] = {}
+    for key, text, vec in zip(keys, texts, vectors):
+        if vec is None:
+            missing.setdefault(key, text)
+    n_hits = sum(vec is not None for vec in vectors)
+    if n_hits:
+        metrics.CACHE_EVENTS.inc(n_hits, cache="embedding", result="hit")
+    if n_hits < len(texts):
+        metrics.CACHE_EVENTS.inc(len(texts) - n_hits, cache="embedding", result="miss")
+
+    if missing:
+        fresh = await _embed_uncached(list(missing.values()))
+        fetched = dict(zip(missing.keys(), fresh))
+        await asyncio.to_thread(cache.put_many, list(fetched.items()))
+        vectors = [
+            vec if vec is not None else fetched[key]
+            for key, vec in zip(keys, vectors)
+        ]
+
+    return vectors
+
+
+async def embed_text(text: str) -> List[float]:
+    return (await embed_texts([text]))[0]
+
+
+def _batch_chunks(
+    chunks: Iterable[T],
+    max_items: int,
+    max_chars: int,
+    size: Callable[[T], int] = len,
+) -> Iterator[List[T]]:
+    """
+    Group chunks into embedding batches bounded by item count and total chars.
+    A single oversized chunk still gets its own batch.
+    """
+    batch: List[T] = []
+    batch_chars = 0
+    for chunk in chunks:
+        n = size(chunk)
+        if batch and (len(batch) >= max_items or batch_chars + n > max_chars):
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append(chunk)
+        batch_chars += n
+    if batch:
+        yield batch
 
 
-def _chunk_text(text: str) -> List[str]:
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(doc_id: str, content_hash: str, occurrence: int = 0) -> str:
+    """
+    Deterministic point id for a chunk: the same text in the same doc always
+    maps to the same id (occurrence disambiguates repeated chunks).
     """
-    Simple character-based chunking with overlap.
+    return str(uuid.uuid5(_POINT_NAMESPACE, f"{doc_id}\x00{content_hash}\x00{occurrence}"))
+
+
+def _chunk_text(
+    text: str | Iterable[str],
+    chunk_tokens: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+) -> Iterator[str]:
     """
-    chunks: List[str] = []
-    start = 0
-    while start < len(text):
-        end = start + CHUNK_SIZE
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += CHUNK_SIZE - CHUNK_OVERLAP
-    return chunks
+    Token-sized, sentence/paragraph-aligned chunks (lazy).
+    Accepts a whole string or an iterable of text pieces.
+    """
+    pieces = [text] if isinstance(text, str) else text
+    return chunking.iter_chunks(
+        pieces,
+        chunk_tokens=chunk_tokens or settings.chunk_tokens,
+        overlap_tokens=settings.chunk_overlap_tokens if chunk_overlap is None else chunk_overlap,
+    )
+
+
+def _doc_key(doc_id: str, tenant: Optional[str]) -> str:
+    """Manifest/point-id key of a document: doc_ids are per tenant."""
+    return f"{tenant}\x1f{doc_id}" if tenant else doc_id
+
+
+def _doc_lock(doc_id: str) -> asyncio.Lock:
+    lock = _doc_locks.get(doc_id)
+    if lock is None:
+        lock = _doc_locks[doc_id] = asyncio.Lock()
+    return lock
+
+
+def _local_chunk_store() -> Optional[chunk_store.ChunkStore]:
+    """The chunk docstore, or None when chunk text stays in the vector payloads."""
+    if settings.chunk_text_store == "payload":
+        return None
+    return chunk_store.get_chunk_store()
+
+
+def _without_text(payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{k: v for k, v in p.items() if k != "text"} for p in payloads]
+
+
+async def _update_payload_pages(
+    store: vector_store.VectorStore,
+    ids: List[str],
+    payloads: List[Dict[str, Any]],
+) -> None:
+    page = settings.upsert_page_size
+    for start in range(0, len(ids), page):
+        await store.update_payloads(ids[start:start + page], payloads[start:start + page])
 
 
-def index_document(
+async def index_document(
     doc_id: str,
-    content: str,
+    content: str | Iterable[str],
     source: Optional[str] = None,
-    tags: Optional[Dict[str, Any]] = None,
-) -> None:
+    tags: Optional[List[str]] = None,
+    chunk_tokens: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    mode: str = "update",
+    tenant: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+    executor: Optional[Executor] = None,
+) -> IndexResult:
     """
-    Store a single long document into Qdrant as multiple chunks.
-    """
-    ensure_collection()
-    client = get_qdrant()
-    chunks = _chunk_text(content)
-    points: List[PointStruct] = []
-
-    for idx, chunk in enumerate(chunks):
-        emb = embed_text(chunk)
-        point_id = str(uuid.uuid4())
-        payload: Dict[str, Any] = {
-            "doc_id": doc_id,
-            "chunk_index": idx,
-            "text": chunk,
-        }
-        if source:
-            payload["source"] = source
-        if tags:
-            payload["tags"] = tags
-
-        points.append(
-            PointStruct(
-                id=point_id,
-                vector=emb,
-                payload=payload,
-            )
+    Store a single long document in the vector store as multiple chunks.
+
+    Point ids are derived from doc_id + chunk content, and the previous
+    set of chunks is kept in the doc manifest. Re-indexing a doc_id:
+    - mode="update": only new/changed chunks are embedded and upserted,
+      unchanged chunks that moved (or all of them, when the metadata
+      changed) get their payload updated without re-embedding
+    - mode="replace": every chunk is re-embedded and upserted
+    In both modes chunks that no longer exist are deleted by id.
+
+    tenant, tags and created_at are stored in every chunk's payload for
+    filtering; the same doc_id under two tenants is two documents.
+
+    The pipeline is streaming end to end: chunks are produced lazily
+    (in a worker thread, so `content` may be a blocking iterator),
+    grouped into size-bounded embedding batches, at most
+    settings.embed_concurrency batches are in flight, and points are
+    upserted in pages as embeddings arrive. Pass an `executor` of its own
+    when `content` blocks, so a waiting chunker does not hold a thread of
+    the default pool that every asyncio.to_thread call shares.
+    """
+    metadata: Dict[str, Any] = {}
+    if source:
+        metadata["source"] = source
+    if tags:
+        metadata["tags"] = list(tags)
+    if tenant:
+        metadata["tenant"] = tenant
+    if created_at is not None:
+        metadata["created_at"] = created_at.timestamp()
+    doc_key = _doc_key(doc_id, tenant)
+    async with _doc_lock(doc_key):
+        return await _index_document(
+            doc_id, doc_key, content, metadata, chunk_tokens, chunk_overlap, mode, executor
         )
 
-    if not points:
-        log.warning("No chunks generated for doc_id=%s", doc_id)
-        return
 
-    client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=points,
+async def _index_document(
+    doc_id: str,
+    doc_key: str,
+    content: str | Iterable[str],
+    metadata: Dict[str, Any],
+    chunk_tokens: Optional[int],
+    chunk_overlap: Optional[int],
+    mode: str,
+    executor: Optional[Executor] = None,
+) -> IndexResult:
+    if mode not in ("update", "replace"):
+        raise ValueError(f"Unknown index mode: {mode}")
+
+    await ensure_collection()
+    store = get_store()
+    manifest = doc_manifest.get_manifest()
+    previous = await asyncio.to_thread(manifest.load, doc_key)
+    meta_hash = hashlib.sha256(json.dumps(metadata, sort_keys=True).encode("utf-8")).hexdigest()
+    # New title/tags/tenant/date: unchanged chunks need their payloads rewritten too
+    meta_changed = bool(previous) and await asyncio.to_thread(manifest.load_meta_hash, doc_key) != meta_hash
+
+    current: List[Tuple[str, str, int]] = []  # (point_id, chunk_hash, chunk_index)
+    # Kept chunks whose payload changed (moved, or new metadata): no re-embedding
+    moved_ids: List[str] = []
+    moved_payloads: List[Dict[str, Any]] = []
+    n_moved = 0
+
+    def _payload(idx: int, chunk: str) -> Dict[str, Any]:
+        return {"doc_id": doc_id, "chunk_index": idx, "text": chunk, **metadata}
+
+    def _changed_chunks() -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Yield (point_id, chunk, payload) for chunks that need embedding."""
+        nonlocal n_moved
+        occurrences: Dict[str, int] = {}
+        for idx, chunk in enumerate(_chunk_text(content, chunk_tokens, chunk_overlap)):
+            h = chunk_hash(chunk)
+            occurrences[h] = occurrences.get(h, -1) + 1
+            point_id = chunk_point_id(doc_key, h, occurrences[h])
+            current.append((point_id, h, idx))
+
+            old = previous.get(point_id)
+            if mode == "update" and old is not None:
+                if old[1] != idx:
+                    n_moved += 1
+                if old[1] != idx or meta_changed:
+                    moved_ids.append(point_id)
+                    moved_payloads.append(_payload(idx, chunk))
+                continue
+            yield point_id, chunk, _payload(idx, chunk)
+
+    batches = _batch_chunks(
+        _changed_chunks(),
+        max_items=settings.embed_batch_size,
+        max_chars=settings.embed_batch_max_chars,
+        size=lambda item: len(item[1]),
+    )
+
+    in_flight: Deque[Tuple[List[Tuple[str, str, Dict[str, Any]]], asyncio.Task]] = deque()
+    ids: List[str] = []
+    vectors: List[List[float]] = []
+    payloads: List[Dict[str, Any]] = []
+    embedded = 0
+    n_batches = 0
+
+    lexical = lexical_index.get_index()
+    # Vector payloads carry only ids and filterable fields; the text goes to
+    # the chunk store (written first, so a search never finds a point without it)
+    text_store = _local_chunk_store()
+
+    async def _write_text(point_ids: List[str], page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if text_store is None:
+            return page
+        await asyncio.to_thread(
+            text_store.put, [(pid, doc_key, p["text"]) for pid, p in zip(point_ids, page)]
+        )
+        return _without_text(page)
+
+    async def _upsert_page() -> None:
+        await store.upsert(ids, vectors, await _write_text(ids, payloads))
+        await asyncio.to_thread(lexical.upsert, ids, payloads)
+        # Recorded page by page: if a later page fails, delete_document and
+        # the next re-index still find the points written so far
+        await asyncio.to_thread(
+            manifest.add,
+            doc_key,
+            [(pid, chunk_hash(p["text"]), p["chunk_index"]) for pid, p in zip(ids, payloads)],
+        )
+
+    async def _drain_one() -> None:
+        nonlocal ids, vectors, payloads, embedded
+        # Consume in submission order so pages are upserted in chunk order
+        batch, task = in_flight.popleft()
+        embeddings = await task
+        for (point_id, _, payload), emb in zip(batch, embeddings):
+            ids.append(point_id)
+            vectors.append(emb)
+            payloads.append(payload)
+            embedded += 1
+
+            if len(ids) >= settings.upsert_page_size:
+                await _upsert_page()
+                ids, vectors, payloads = [], [], []
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # Chunking/tokenizing runs off the event loop; content may also be
+            # a blocking feed of uploaded text (uploads.PieceFeed)
+            batch = await loop.run_in_executor(
+                executor, functools.partial(contextvars.copy_context().run, next, batches, None)
+            )
+            if batch is None:
+                break
+            texts = [chunk for _, chunk, _ in batch]
+            in_flight.append((batch, asyncio.create_task(embed_texts(texts))))
+            n_batches += 1
+            if len(in_flight) >= max(1, settings.embed_concurrency):
+                await _drain_one()
+        while in_flight:
+            await _drain_one()
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+    if ids:
+        await _upsert_page()
+    await _update_payload_pages(store, moved_ids, await _write_text(moved_ids, moved_payloads))
+    await asyncio.to_thread(lexical.upsert, moved_ids, moved_payloads)
+
+    current_ids = {point_id for point_id, _, _ in current}
+    stale = [point_id for point_id in previous if point_id not in current_ids]
+    for start in range(0, len(stale), settings.upsert_page_size):
+        await store.delete(stale[start:start + settings.upsert_page_size])
+    await asyncio.to_thread(lexical.delete, stale)
+    if text_store is not None:
+        await asyncio.to_thread(text_store.delete, stale)
+
+    await asyncio.to_thread(manifest.save, doc_key, current, meta_hash)
+
+    if not current:
+        log.warning("No chunks generated for doc_id=%s", doc_id)
+    else:
+        log.info(
+            "Indexed doc_id=%s: %d chunks, %d embedded in %d batches, %d moved, %d deleted",
+            doc_id,
+            len(current),
+            embedded,
+            n_batches,
+            n_moved,
+            len(stale),
+        )
+    return IndexResult(
+        chunks=len(current),
+        embedded=embedded,
+        moved=n_moved,
+        deleted=len(stale),
     )
-    log.info("Indexed %d chunks for doc_id=%s", len(points), doc_id)
 
 
-def search_similar_chunks(
+async def delete_document(doc_id: str, tenant: Optional[str] = None) -> int:
+    """Remove every indexed chunk of doc_id (of tenant). Returns the number deleted."""
+    doc_key = _doc_key(doc_id, tenant)
+    async with _doc_lock(doc_key):
+        manifest = doc_manifest.get_manifest()
+        previous = await asyncio.to_thread(manifest.load, doc_key)
+        ids = list(previous)
+        store = get_store()
+        for start in range(0, len(ids), settings.upsert_page_size):
+            await store.delete(ids[start:start + settings.upsert_page_size])
+        await asyncio.to_thread(lexical_index.get_index().delete, ids)
+        text_store = _local_chunk_store()
+        if text_store is not None:
+            await asyncio.to_thread(text_store.delete, ids)
+        await asyncio.to_thread(manifest.delete, doc_key)
+    return len(ids)
+
+
+async def search_similar_chunks(
     query: str,
     top_k: int = 5,
-    doc_filter: Optional[str] = None,
+    payload_filter: Optional[vector_store.PayloadFilter] = None,
+    query_vector: Optional[List[float]] = None,
+    with_vectors: bool = False,
 ):
-    ensure_collection()
-    client = get_qdrant()
-    query_emb = embed_text(query)
-
-    qfilter = None
-    if doc_filter:
-        qfilter = Filter(
-            must=[
-                FieldCondition(
-                    key="doc_id",
-                    match=MatchValue(value=doc_filter),
-                )
-            ]
-        )
-
-    res = client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_emb,
-        limit=top_k,
-        query_filter=qfilter,
-        with_payload=True,
-        with_vectors=False,
+    await ensure_collection()
+    query_emb = query_vector if query_vector is not None else await embed_text(query)
+
+    async def _search():
+        with metrics.timed("vector_search"):
+            return await deadline.wait(get_store().search(
+                query_emb,
+                limit=top_k,
+                payload_filter=payload_filter,
+                with_vectors=with_vectors,
+            ))
+
+    if not settings.single_flight_enabled:
+        return await _search()  # list[ScoredPoint]
+    key = (tuple(query_emb), top_k, search_filters.cache_key(payload_filter), with_vectors)
+    return await _search_flight.do(key, _search)
+
+
+def _to_source(candidate: diversify.Candidate) -> RetrievedSource:
+    payload = candidate.payload
+    doc_id = payload.get("doc_id", "")
+    return RetrievedSource(
+        doc_id=doc_id,
+        title=str(payload.get("source") or doc_id),
+        text=payload.get("text", ""),
+        score=candidate.score,
     )
-    return res  # list[ScoredPoint]
 
 
-def retrieve_for_query(
+def _lexical_candidate(hit: lexical_index.LexicalHit) -> diversify.Candidate:
+    payload: Dict[str, Any] = {
+        "doc_id": hit.doc_id,
+        "chunk_index": hit.chunk_index,
+        "text": hit.text,
+    }
+    if hit.source:
+        payload["source"] = hit.source
+    return diversify.Candidate(hit.point_id, payload, hit.score)
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion: score(id) = sum over rankings of 1 / (k + rank).
+    Returns (id, score) best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking, start=1):
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def _with_text(candidates: List[diversify.Candidate]) -> List[diversify.Candidate]:
+    """
+    Fill in chunk text from the chunk store (one bulk read) where the
+    payload has none. Hits whose text is in neither are dropped.
+    """
+    missing = [c.point_id for c in candidates if "text" not in c.payload]
+    if not missing:
+        return candidates
+    with metrics.timed("chunk_fetch"):
+        texts = await asyncio.to_thread(chunk_store.get_chunk_store().get_many, missing)
+    lost = [point_id for point_id in missing if point_id not in texts]
+    if lost:
+        log.warning(
+            "No text for %d of %d retrieved chunks (e.g. %s): indexed on another host with "
+            "CHUNK_TEXT_STORE=local? Dropping them from the results",
+            len(lost), len(candidates), lost[0],
+        )
+    return [
+        c if "text" in c.payload else c._replace(payload={**c.payload, "text": texts[c.point_id]})
+        for c in candidates
+        if "text" in c.payload or c.point_id in texts
+    ]
+
+
+async def _finalize(candidates: List[diversify.Candidate], limit: int) -> List[RetrievedSource]:
+    # Only text that can end up in a source is fetched: the top `limit`, or
+    # the whole candidate list when merging adjacent chunks (it needs theirs)
+    if settings.retrieval_diversify:
+        candidates = await _with_text(candidates)
+        candidates = diversify.merge_adjacent(
+            candidates, limit, max_chunks=settings.retrieval_merge_max_chunks
+        )
+    else:
+        candidates = await _with_text(candidates[:limit])
+    return [_to_source(c) for c in candidates[:limit]]
+
+
+async def retrieve_for_query(
     query: str,
     limit: int = 3,
-    doc_filter: Optional[str] = None,
+    payload_filter: Optional[vector_store.PayloadFilter] = None,
+    query_vector: Optional[List[float]] = None,
 ) -> List[RetrievedSource]:
     """
     High-level helper for /chat:
-    - search Qdrant
+    - search the vector store (reusing query_vector if the caller already embedded the query)
     - wrap results as RetrievedSource objects
+
+    With settings.retrieval_mode="hybrid" the BM25 index is searched as
+    well and both rankings are fused with RRF (score = fused RRF score).
+    A short identifier-like query with a decisive BM25 winner is answered
+    from the lexical index alone (score = BM25), without embedding it.
+
+    Every upstream call stays within the request deadline (see deadline).
+    Both searches apply payload_filter together with the request's filter
+    scope (see search_filters), which cannot be widened from here.
+
+    Vector hits below settings.retrieval_min_score are dropped. With
+    settings.retrieval_diversify, candidates are over-fetched with their
+    vectors, re-ordered by MMR (near-duplicates dropped) and adjacent
+    chunks of the same document are merged into one source.
+
+    With settings.chunk_text_store="local" vector payloads hold no chunk
+    text: the text of the chunks that make the cut is read from the chunk
+    store in one query.
     """
-    results = search_similar_chunks(query, top_k=limit, doc_filter=doc_filter)
-
-    sources: List[RetrievedSource] = []
-    for r in results:
-        payload = r.payload or {}
-        text = payload.get("text", "")
-        doc_id = payload.get("doc_id", "")
-        source = payload.get("source") or doc_id
-
-        sources.append(
-            RetrievedSource(
-                doc_id=doc_id,
-                title=str(source),
-                text=text,
-                score=r.score,
+    payload_filter = search_filters.current(payload_filter)
+    hybrid = settings.retrieval_mode == "hybrid"
+    diversified = settings.retrieval_diversify
+    candidates = limit * max(1, settings.retrieval_candidates_factor) if hybrid or diversified else limit
+
+    lexical_hits: List[lexical_index.LexicalHit] = []
+    if hybrid:
+        deadline.check()
+        with metrics.timed("lexical_search"):
+            lexical_hits = await asyncio.to_thread(
+                lexical_index.get_index().search, query, candidates, payload_filter
             )
-        )
+        if settings.lexical_fast_path_margin > 0 and lexical_index.is_decisive(query, lexical_hits):
+            log.debug("Lexical fast path for query %r", query)
+            metrics.CACHE_EVENTS.inc(cache="lexical_fast_path", result="hit")
+            return await _finalize([_lexical_candidate(h) for h in lexical_hits], limit)
+
+    if query_vector is None:
+        query_vector = await embed_text(query)
+    vector_hits = await search_similar_chunks(
+        query,
+        top_k=candidates,
+        payload_filter=payload_filter,
+        query_vector=query_vector,
+        with_vectors=diversified,
+    )
+    if settings.retrieval_min_score > 0:
+        vector_hits = [r for r in vector_hits if r.score >= settings.retrieval_min_score]
+    if diversified and vector_hits:
+        with metrics.timed("mmr"):
+            order = diversify.mmr_order(
+                query_vector,
+                [r.vector for r in vector_hits],
+                lambda_=settings.mmr_lambda,
+                dedup_threshold=settings.retrieval_dedup_threshold,
+            )
+        vector_hits = [vector_hits[i] for i in order]
 
-    return sources
+    ranked = [diversify.Candidate(str(r.id), r.payload or {}, r.score) for r in vector_hits]
+    if not hybrid:
+        return await _finalize(ranked, limit)
+
+    by_id = {c.point_id: c for c in map(_lexical_candidate, lexical_hits)}
+    by_id.update((c.point_id, c) for c in ranked)
+    fused = rrf_fuse(
+        [[c.point_id for c in ranked], [h.point_id for h in lexical_hits]],
+        k=settings.rrf_k,
+    )
+    return await _finalize([by_id[pid]._replace(score=score) for pid, score in fused], limit)
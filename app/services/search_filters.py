@@ -0,0 +1,69 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from app.core.settings import settings
+from app.models.schemas import SearchFilter
+from app.services.vector_store import PayloadFilter
+
+# Filter every retrieval of the current request must respect (set by the routers)
+_filter: ContextVar[Optional[PayloadFilter]] = ContextVar("search_filter", default=None)
+
+
+class TenantRequired(ValueError):
+    """settings.multitenant is on and the request names no tenant (maps to 422)."""
+
+
+def require_tenant(tenant: Optional[str]) -> None:
+    if settings.multitenant and not tenant:
+        raise TenantRequired("tenant is required (MULTITENANT is enabled)")
+
+
+def to_payload_filter(search_filter: Optional[SearchFilter]) -> Optional[PayloadFilter]:
+    """SearchFilter -> payload filter on the indexed fields (None if it filters nothing)."""
+    if search_filter is None:
+        return None
+    out: PayloadFilter = {}
+    if search_filter.tenant:
+        out["tenant"] = search_filter.tenant
+    if search_filter.doc_ids:
+        out["doc_id"] = list(search_filter.doc_ids)
+    if search_filter.tags:
+        out["tags"] = list(search_filter.tags)
+    if search_filter.created_after or search_filter.created_before:
+        out["created_at"] = {
+            "gte": search_filter.created_after.timestamp() if search_filter.created_after else None,
+            "lt": search_filter.created_before.timestamp() if search_filter.created_before else None,
+        }
+    return out or None
+
+
+@contextmanager
+def scope(payload_filter: Optional[PayloadFilter]) -> Iterator[None]:
+    """
+    Apply payload_filter to every retrieval in the block (and tasks it
+    spawns, e.g. tool calls). Fields set by an outer scope, like the
+    tenant, cannot be overridden by a nested one.
+    """
+    if not payload_filter:
+        yield
+        return
+    token = _filter.set({**payload_filter, **(_filter.get() or {})})
+    try:
+        yield
+    finally:
+        _filter.reset(token)
+
+
+def current(payload_filter: Optional[PayloadFilter] = None) -> Optional[PayloadFilter]:
+    """payload_filter narrowed by the request's scope (the scope wins on shared fields)."""
+    scoped = _filter.get()
+    if not scoped:
+        return payload_filter or None
+    return {**(payload_filter or {}), **scoped}
+
+
+def cache_key(payload_filter: Optional[PayloadFilter]) -> str:
+    """Stable string form, for cache and single-flight keys."""
+    return json.dumps(payload_filter, sort_keys=True, default=list) if payload_filter else ""
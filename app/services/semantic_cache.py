@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from app.core.settings import settings
+from app.models.schemas import RetrievedSource
+
+log = logging.getLogger(__name__)
+
+_cache: Optional["SemanticCache"] = None
+
+
+class CachedAnswer(NamedTuple):
+    query: str
+    reply: str
+    sources: List[RetrievedSource]
+    score: float
+
+
+def make_scope(
+    model: str,
+    temperature: float,
+    system_prompt: str,
+    use_rag: bool,
+    rag_top_k: int,
+    filter_key: str = "",
+) -> str:
+    """Answers are only reused between requests with the same scope (incl. search filter / tenant)."""
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{model}|{temperature}|{prompt_hash}|{use_rag}|{rag_top_k}|{filter_key}"
+
+
+class SemanticCache:
+    """
+    Cache of (query embedding -> reply, sources) looked up by cosine similarity.
+
+    Entries live in the rows ("slots") of one float32 matrix preallocated
+    at (max_entries, dim), so a lookup is a single matrix-vector product
+    over the scope's slots and a store writes one row in place. Entries
+    expire after ttl_seconds and the least recently used entry is evicted
+    past max_entries.
+    """
+
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # allocated on the first store
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._created = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._scopes: List[Optional[str]] = [None] * max_entries
+        self._answers: List[Optional[CachedAnswer]] = [None] * max_entries
+        self._by_scope: Dict[str, Set[int]] = {}
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _release(self, slot: int) -> None:
+        scope = self._scopes[slot]
+        slots = self._by_scope[scope]
+        slots.discard(slot)
+        if not slots:
+            del self._by_scope[scope]
+        self._used[slot] = False
+        self._scopes[slot] = self._answers[slot] = None
+        self._free.append(slot)
+
+    def _purge_expired(self, now: float) -> None:
+        expired = np.flatnonzero(self._used & (now - self._created > self.ttl_seconds))
+        self.evictions += len(expired)
+        for slot in expired.tolist():
+            self._release(slot)
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, scope: str, vector: List[float]) -> Optional[CachedAnswer]:
+        query = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            slots = self._by_scope.get(scope)
+            if not slots or self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            rows = np.fromiter(slots, dtype=np.intp, count=len(slots))
+            scores = self._vectors[rows] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(rows[best])
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._answers[slot]._replace(score=float(scores[best]))
+
+    def store(
+        self,
+        scope: str,
+        vector: List[float],
+        query: str,
+        reply: str,
+        sources: List[RetrievedSource],
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        unit = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != unit.shape[0]:
+                # First entry, or the embedding dimension changed
+                for slot in np.flatnonzero(self._used).tolist():
+                    self._release(slot)
+                self._vectors = np.zeros((self.max_entries, unit.shape[0]), dtype=np.float32)
+
+            if not self._free:
+                lru = int(np.argmin(self._last_used))  # every slot is in use here
+                self._release(lru)
+                self.evictions += 1
+
+            slot = self._free.pop()
+            self._vectors[slot] = unit
+            self._used[slot] = True
+            self._created[slot] = self._last_used[slot] = now
+            self._scopes[slot] = scope
+            self._answers[slot] = CachedAnswer(query, reply, list(sources), 1.0)
+            self._by_scope.setdefault(scope, set()).add(slot)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": self.max_entries - len(self._free),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def get_cache() -> Optional[SemanticCache]:
+    """Process-wide semantic cache, or None unless SEMANTIC_CACHE_ENABLED."""
+    global _cache
+    if not settings.semantic_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+            max_entries=settings.semantic_cache_max_entries,
+        )
+    return _cache
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.services import deadline, metrics
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical async calls.
+
+    The first caller for a key starts the upstream call as a task; callers
+    arriving with the same key while it is in flight await that same task
+    instead of issuing their own. Nothing is cached: once the call settles
+    the next caller starts a fresh one.
+
+    The task is shielded, so a cancelled waiter (e.g. a disconnected
+    client) does not cancel the call for everyone else; it is cancelled
+    once every waiter has gone. The call runs without a deadline and each
+    waiter waits within its own. All waiters get the same result object
+    and must treat it as read-only.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0   # upstream calls started
+        self.shared = 0  # callers served by someone else's call
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._run(fn))
+            self._inflight[key] = task
+            self.calls += 1
+            metrics.SINGLE_FLIGHT.inc(flight=self.name, result="leader")
+            task.add_done_callback(lambda t: self._settled(key, t))
+        else:
+            self.shared += 1
+            metrics.SINGLE_FLIGHT.inc(flight=self.name, result="shared")
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await deadline.wait(asyncio.shield(task))
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Every caller disconnected or ran out of time
+                    task.cancel()
+
+    @staticmethod
+    async def _run(fn: Callable[[], Awaitable[T]]) -> T:
+        # Shared by callers with different deadlines
+        deadline.clear()
+        return await fn()
+
+    def _settled(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._inflight)}
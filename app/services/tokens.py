@@ -0,0 +1,49 @@
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+log = logging.getLogger(__name__)
+
+try:  # optional: exact OpenAI token counts
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on environment
+    tiktoken = None
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+APPROX_CHARS_PER_TOKEN = 4
+
+# Per-message framing tokens added by the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def get_encoding() -> Optional[Any]:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # e.g. BPE file cannot be downloaded in an offline container
+        log.warning("tiktoken encoding unavailable; using approximate token counts")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count for text: exact with tiktoken, otherwise a pure-Python
+    estimate (one token per word/punctuation piece, long words ~4 chars/token).
+    """
+    enc = get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return sum(
+        max(1, math.ceil(len(piece) / APPROX_CHARS_PER_TOKEN))
+        for piece in _WORD.findall(text)
+    )
+
+
+def count_message_tokens(content: str) -> int:
+    """Tokens one chat message costs in the prompt."""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
@@ -1,21 +1,405 @@
-# app/services/tools.py
+import asyncio
+import httpcore
 import httpx
+import inspect
+import ipaddress
+import json
 import logging
+import socket
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from app.core.settings import settings
+from app.services import metrics, rag_service
 
 log = logging.getLogger(__name__)
 
-async def fetch_url(url: str, timeout: float = 10.0) -> dict:
-    """Fetch a URL and return minimal payload: status, text (first N chars), headers."""
+# One pooled client for all tool fetches (closed from the app lifespan)
+_http: Optional[httpx.AsyncClient] = None
+
+
+# Response headers kept in cache entries (validators and content info); anything
+# else, e.g. Set-Cookie, is dropped. Live responses return all their headers
+_KEPT_HEADERS = ("etag", "last-modified", "cache-control", "content-type")
+
+
+class _CachedResponse(NamedTuple):
+    status_code: int
+    headers: Dict[str, str]
+    snippet: str
+    url: str
+    truncated: bool
+    fresh_until: float  # time.monotonic(); 0 = revalidate on every use
+
+
+# url -> cached response, least recently used first
+_cache: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+
+
+class BlockedURL(ValueError):
+    """fetch_url refuses the URL: not http(s), host not allowed, or a non-public address."""
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        http2 = settings.fetch_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                log.warning("FETCH_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+                http2 = False
+        _http = httpx.AsyncClient(
+            timeout=settings.fetch_timeout,
+            # Followed by _fetch, which checks every hop
+            follow_redirects=False,
+            transport=_PublicOnlyTransport(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.fetch_max_connections,
+                    max_keepalive_connections=settings.fetch_max_connections,
+                ),
+            ),
+            # Proxies from the environment would resolve hosts themselves,
+            # past the address check
+            trust_env=False,
+        )
+    return _http
+
+
+async def aclose() -> None:
+    """Close pooled connections (called from the app lifespan)."""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+    _http = None
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])  # drop an IPv6 zone id
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def _public_addresses(host: str, port: int) -> List[str]:
+    """Addresses host resolves to; BlockedURL if any of them is not public."""
+    addresses = await _resolve(host, port)
+    for address in addresses:
+        if not _is_public(address):
+            raise BlockedURL(f"host {host!r} resolves to non-public address {address}")
+    if not addresses:
+        raise BlockedURL(f"host {host!r} does not resolve")
+    return addresses
+
+
+class _PublicOnlyBackend(httpcore.AsyncNetworkBackend):
+    """
+    Connects to the addresses it has just checked, so a host cannot pass
+    _check_url and then be re-resolved (DNS rebinding) to a private one.
+    TLS (SNI, certificate) and the Host header still use the hostname.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        error: Optional[Exception] = None
+        for address in await _public_addresses(host, port):
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        assert error is not None
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedURL("unix sockets cannot be fetched")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class _PublicOnlyTransport(httpx.AsyncHTTPTransport):
+    """httpx transport whose connections go through _PublicOnlyBackend."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # httpx (pinned in requirements.txt) takes no network backend argument
+        self._pool._network_backend = _PublicOnlyBackend(self._pool._network_backend)
+
+
+async def _check_url(url: httpx.URL) -> None:
+    """
+    Raise BlockedURL unless url is http(s), its host passes
+    settings.fetch_allowed_hosts and every address it resolves to is
+    public (no private, loopback, link-local or reserved ranges). This
+    fails fast with a clear error; _PublicOnlyBackend enforces the same
+    rule when it connects.
+    """
+    if url.scheme not in ("http", "https"):
+        raise BlockedURL(f"only http(s) URLs can be fetched, not {url.scheme or 'relative'!r}")
+    host = url.host.lower()
+    if not host:
+        raise BlockedURL("URL has no host")
+    allowed = settings.fetch_allowed_hosts
+    if allowed and not any(host == h or host.endswith("." + h) for h in allowed):
+        raise BlockedURL(f"host {host!r} is not in FETCH_ALLOWED_HOSTS")
+    await _public_addresses(host, url.port or (443 if url.scheme == "https" else 80))
+
+
+def _cache_directives(headers: httpx.Headers) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def _uncacheable(headers: httpx.Headers) -> bool:
+    """Marked no-store or private, or sets a cookie: specific to this client."""
+    directives = _cache_directives(headers)
+    return "no-store" in directives or "private" in directives or "set-cookie" in headers
+
+
+def _fresh_until(headers: httpx.Headers, now: float) -> Optional[float]:
+    """
+    Until when a response may be served without revalidation, or None if
+    it must not be cached at all (no-store, private, sets a cookie, or
+    nothing to revalidate with).
+    """
+    if _uncacheable(headers):
+        return None
+    directives = _cache_directives(headers)
+    max_age = 0
+    if "no-cache" not in directives and directives.get("max-age"):
+        try:
+            max_age = int(directives["max-age"])
+        except ValueError:
+            max_age = 0
+    if max_age <= 0 and "etag" not in headers and "last-modified" not in headers:
+        return None
+    return now + max_age
+
+
+def _remember(url: str, entry: _CachedResponse) -> None:
+    _cache[url] = entry
+    _cache.move_to_end(url)
+    while len(_cache) > settings.fetch_cache_max_entries:
+        _cache.popitem(last=False)
+
+
+def _as_result(entry: _CachedResponse, cached: bool, headers: Optional[Dict[str, str]] = None) -> dict:
+    return {
+        "status_code": entry.status_code,
+        "headers": entry.headers if headers is None else headers,
+        "snippet": entry.snippet,
+        "url": entry.url,
+        "truncated": entry.truncated,
+        "cached": cached,
+    }
+
+
+async def fetch_url(url: str, timeout: Optional[float] = None) -> dict:
+    """
+    Fetch a URL and return minimal payload: status, text (first N chars), headers.
+
+    - uses the shared pooled client
+    - only public http(s) hosts are reached, redirects included (see _check_url)
+    - the body is streamed and reading stops at settings.fetch_max_bytes
+    - 200 responses are cached per URL: fresh entries (Cache-Control
+      max-age) are served without a request, stale ones are revalidated
+      with If-None-Match / If-Modified-Since and reused on 304 (the
+      validators are only sent to the URL that returned them)
+    """
+    now = time.monotonic()
+    entry = _cache.get(url) if settings.fetch_cache_max_entries > 0 else None
+    if entry is not None:
+        _cache.move_to_end(url)
+        if now < entry.fresh_until:
+            metrics.CACHE_EVENTS.inc(cache="fetch", result="fresh")
+            return _as_result(entry, cached=True)
+
+    request_headers: Dict[str, str] = {}
+    if entry is not None:
+        if "etag" in entry.headers:
+            request_headers["If-None-Match"] = entry.headers["etag"]
+        if "last-modified" in entry.headers:
+            request_headers["If-Modified-Since"] = entry.headers["last-modified"]
+
     try:
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            resp = await client.get(url)
-            text = resp.text
-            return {
-                "status_code": resp.status_code,
-                "headers": dict(resp.headers),
-                "snippet": text[:2000],  # keep small for now
-                "url": str(resp.url),
-            }
+        with metrics.timed("fetch_url"):
+            return await _fetch(url, timeout, entry, request_headers, now)
+    except BlockedURL as e:
+        log.warning("fetch_url blocked: %s", e)
+        return {"error": str(e), "url": url}
     except Exception as e:
         log.exception("fetch_url failed")
-        return {"error": str(e), "url": url}
\ No newline at end of file
+        return {"error": str(e), "url": url}
+
+
+async def _fetch(
+    url: str,
+    timeout: Optional[float],
+    entry: Optional[_CachedResponse],
+    request_headers: Dict[str, str],
+    now: float,
+) -> dict:
+    client = get_http_client()
+    target = httpx.URL(url)
+    for _ in range(settings.fetch_max_redirects + 1):
+        await _check_url(target)
+        # Validators belong to the URL the cached body came from, not to
+        # whatever another hop redirects to
+        revalidating = entry is not None and str(target) == entry.url
+        async with client.stream(
+            "GET",
+            target,
+            headers=request_headers if revalidating else None,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            follow_redirects=False,
+        ) as resp:
+            if resp.next_request is not None:
+                target = resp.next_request.url
+                continue
+            return await _read(url, resp, entry if revalidating else None, now)
+    raise BlockedURL(f"more than {settings.fetch_max_redirects} redirects")
+
+
+async def _read(
+    url: str, resp: httpx.Response, entry: Optional[_CachedResponse], now: float
+) -> dict:
+    if resp.status_code == 304 and entry is not None:
+        fresh_until = _fresh_until(resp.headers, now)
+        entry = entry._replace(fresh_until=fresh_until or 0.0)
+        if _uncacheable(resp.headers):
+            _cache.pop(url, None)
+        else:
+            _remember(url, entry)
+        metrics.CACHE_EVENTS.inc(cache="fetch", result="revalidated")
+        return _as_result(entry, cached=True)
+
+    body = bytearray()
+    truncated = False
+    async for chunk in resp.aiter_bytes():
+        body += chunk
+        if len(body) >= settings.fetch_max_bytes:
+            truncated = True
+            break
+    text = bytes(body[:settings.fetch_max_bytes]).decode(
+        resp.charset_encoding or "utf-8", errors="replace"
+    )
+    entry = _CachedResponse(
+        status_code=resp.status_code,
+        headers={k: resp.headers[k] for k in _KEPT_HEADERS if k in resp.headers},
+        snippet=text[:settings.fetch_snippet_chars],
+        url=str(resp.url),
+        truncated=truncated,
+        fresh_until=0.0,
+    )
+    fresh_until = _fresh_until(resp.headers, now)
+    if resp.status_code == 200 and fresh_until is not None:
+        _remember(url, entry._replace(fresh_until=fresh_until))
+    else:
+        _cache.pop(url, None)
+    metrics.CACHE_EVENTS.inc(cache="fetch", result="miss")
+    return _as_result(entry, cached=False, headers=dict(resp.headers))
+
+
+# --- tool registry for the agent loop (llm_service) -------------------------
+
+
+class Tool(NamedTuple):
+    name: str
+    description: str
+    parameters: Dict[str, Any]  # JSON schema of the arguments
+    fn: Callable[..., Awaitable[dict]]
+
+
+async def _fetch_tool(url: str) -> dict:
+    return await fetch_url(url)
+
+
+async def _search_tool(query: str, top_k: int = 3) -> dict:
+    sources = await rag_service.retrieve_for_query(query, limit=max(1, min(int(top_k), 10)))
+    return {"results": [s.model_dump() for s in sources]}
+
+
+TOOLS: Dict[str, Tool] = {
+    tool.name: tool
+    for tool in (
+        Tool(
+            name="fetch_url",
+            description="Fetch a web page over HTTP(S) and return its status and the start of its body.",
+            parameters={
+                "type": "object",
+                "properties": {"url": {"type": "string", "description": "Absolute http(s) URL"}},
+                "required": ["url"],
+            },
+            fn=_fetch_tool,
+        ),
+        Tool(
+            name="search_documents",
+            description="Search the indexed documents and return the most relevant chunks.",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "top_k": {"type": "integer", "minimum": 1, "maximum": 10},
+                },
+                "required": ["query"],
+            },
+            fn=_search_tool,
+        ),
+    )
+}
+
+
+def tool_specs() -> List[Dict[str, Any]]:
+    """The registry in the OpenAI `tools` format."""
+    return [
+        {
+            "type": "function",
+            "function": {"name": t.name, "description": t.description, "parameters": t.parameters},
+        }
+        for t in TOOLS.values()
+    ]
+
+
+async def run_tool(name: str, arguments: str, timeout: Optional[float] = None) -> dict:
+    """
+    Run one tool call from the model. Never raises: unknown tools, bad
+    arguments, failures and timeouts come back as {"error": ...} so the
+    model can see what went wrong.
+    """
+    tool = TOOLS.get(name)
+    if tool is None:
+        return {"error": f"unknown tool {name!r}"}
+    try:
+        kwargs = json.loads(arguments or "{}")
+        if not isinstance(kwargs, dict):
+            raise ValueError("arguments must be a JSON object")
+        inspect.signature(tool.fn).bind(**kwargs)
+    except (ValueError, TypeError) as e:
+        return {"error": f"invalid arguments: {e}"}
+
+    timeout = settings.tool_timeout if timeout is None else timeout
+    try:
+        with metrics.timed(f"tool_{name}"):
+            return await asyncio.wait_for(tool.fn(**kwargs), timeout)
+    except asyncio.TimeoutError:
+        return {"error": f"{name} timed out after {timeout:g}s"}
+    except Exception as e:
+        log.exception("Tool %s failed", name)
+        return {"error": str(e)}
@@ -0,0 +1,339 @@
+import asyncio
+import codecs
+import logging
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:  # python-multipart >= 0.0.13 renamed its package
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # pragma: no cover - depends on installed version
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.settings import settings
+from app.services import rag_service
+
+log = logging.getLogger(__name__)
+
+_TEXT_TYPES = {"text/plain": "text", "text/markdown": "text", "text/x-markdown": "text", "text/html": "html"}
+_EXTENSIONS = {".txt": "text", ".text": "text", ".md": "text", ".markdown": "text", ".html": "html", ".htm": "html"}
+
+_END = object()
+
+# Bounds concurrent uploads per worker (each keeps a chunker thread busy)
+_upload_slots: Optional[asyncio.Semaphore] = None
+# Chunker threads, one per upload slot: they block on PieceFeed, so they
+# must not come from the default pool shared by every asyncio.to_thread
+_chunkers: Optional[ThreadPoolExecutor] = None
+
+
+class UploadError(ValueError):
+    """The upload cannot be ingested (bad multipart, unsupported file type)."""
+
+
+class UploadTooLarge(UploadError):
+    """The request body exceeded settings.upload_max_bytes."""
+
+
+class PieceFeed:
+    """
+    Text pieces pushed from the event loop and iterated (blocking) by the
+    chunker, which index_document runs in a worker thread. At most
+    `maxsize` pieces are buffered: put() waits for the chunker beyond
+    that, so memory does not grow with the file.
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self._loop = asyncio.get_running_loop()
+        self._space = asyncio.Event()
+        self._consumer_gone = False
+        self._aborted = False
+
+    async def put(self, piece: str) -> None:
+        while True:
+            if self._consumer_gone:
+                raise RuntimeError("Indexing stopped before the upload was consumed")
+            try:
+                self._queue.put_nowait(piece)
+                return
+            except queue.Full:
+                self._space.clear()
+                if not self._queue.full():
+                    continue
+                await self._space.wait()
+
+    def abort(self) -> None:
+        """Make the chunker stop at its next read (upload failed or cancelled)."""
+        self._aborted = True
+        try:
+            self._queue.put_nowait(_END)
+        except queue.Full:
+            pass
+
+    def _wake(self, gone: bool = False) -> None:
+        if gone:
+            self._consumer_gone = True
+        self._space.set()
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            while True:
+                item = self._queue.get()
+                self._loop.call_soon_threadsafe(self._wake)
+                if item is _END or self._aborted:
+                    return
+                yield item
+        finally:
+            try:
+                self._loop.call_soon_threadsafe(self._wake, True)
+            except RuntimeError:
+                pass  # loop already closed
+
+
+class _HTMLText(HTMLParser):
+    """Incremental HTML -> text: drops script/style, breaks paragraphs at block tags."""
+
+    _BLOCK = {
+        "p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article",
+        "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "header", "footer",
+    }
+    _SKIP = {"script", "style", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BLOCK:
+            self._out.append("\n\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self._BLOCK:
+            self._out.append("\n\n")
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipping:
+            self._out.append(data)
+
+    def take(self) -> str:
+        text, self._out = "".join(self._out), []
+        return text
+
+
+class TextExtractor:
+    """Incremental bytes -> text for one uploaded file."""
+
+    def __init__(self, kind: str, charset: Optional[str]):
+        try:
+            # utf-8-sig drops a leading BOM
+            self._decoder = codecs.getincrementaldecoder(charset or "utf-8-sig")(errors="replace")
+        except LookupError:
+            raise UploadError(f"Unknown charset {charset!r}")
+        self._html = _HTMLText() if kind == "html" else None
+
+    def feed(self, data: bytes, final: bool = False) -> str:
+        text = self._decoder.decode(data, final=final)
+        if self._html is None:
+            return text
+        self._html.feed(text)
+        if final:
+            self._html.close()
+        return self._html.take()
+
+
+def file_kind(filename: str, content_type: str) -> Optional[str]:
+    """"text" or "html" for supported uploads, else None."""
+    mime = content_type.split(";", 1)[0].strip().lower()
+    if mime in _TEXT_TYPES:
+        return _TEXT_TYPES[mime]
+    return _EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def make_doc_id(prefix: str, filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    name = re.sub(r"\s+", "_", name)
+    if not name:
+        raise UploadError("Uploaded file has no filename")
+    return f"{prefix}{name}"
+
+
+class _FileIngest:
+    """One file part being indexed while it streams in."""
+
+    def __init__(self, doc_id: str, filename: str, kind: str, charset: Optional[str], options: Dict[str, Any]):
+        self.doc_id = doc_id
+        self.filename = filename
+        self.bytes = 0
+        self._extractor = TextExtractor(kind, charset)
+        self._feed = PieceFeed(settings.upload_buffer_pieces)
+        self._task = asyncio.create_task(
+            rag_service.index_document(
+                doc_id=doc_id, content=self._feed, source=filename, executor=_chunkers, **options
+            )
+        )
+
+    async def write(self, data: bytes) -> None:
+        self.bytes += len(data)
+        text = self._extractor.feed(data)
+        if text:
+            await self._put(text)
+
+    async def finish(self) -> Dict[str, Any]:
+        text = self._extractor.feed(b"", final=True)
+        if text:
+            await self._put(text)
+        await self._put(_END)
+        result = await self._task
+        return {
+            "doc_id": self.doc_id,
+            "filename": self.filename,
+            "bytes": self.bytes,
+            "chunks_indexed": result.chunks,
+            "chunks_embedded": result.embedded,
+            "chunks_moved": result.moved,
+            "chunks_deleted": result.deleted,
+        }
+
+    async def _put(self, piece: Any) -> None:
+        try:
+            await self._feed.put(piece)
+        except RuntimeError:
+            # The indexer stopped early: surface its error instead
+            await self._task
+            raise
+
+    async def abort(self) -> None:
+        self._feed.abort()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class _Events:
+    """Collects python-multipart callbacks so they can be handled with await."""
+
+    def __init__(self):
+        self.items: List[Tuple[str, Any]] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_part_data": lambda data, start, end: self.items.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self.items.append(("end", None)),
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": lambda: self.items.append(("headers", self._headers)),
+        }
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+
+    def _header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def take(self) -> List[Tuple[str, Any]]:
+        items, self.items = self.items, []
+        return items
+
+
+async def ingest_multipart(
+    content_type: str,
+    stream,
+    doc_prefix: str = "",
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Index every file part of a multipart/form-data body as its own
+    document (doc_id = doc_prefix + file name) while the body streams in.
+
+    Bytes are decoded (and HTML reduced to text) incrementally and handed
+    to index_document through a bounded PieceFeed, so chunks are embedded
+    as they are produced and memory does not depend on the file size.
+    Files are processed one after another; non-file fields are ignored.
+    """
+    mime, params = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected multipart/form-data with a boundary")
+    global _upload_slots, _chunkers
+    if _upload_slots is None:
+        slots = max(1, settings.upload_max_concurrency)
+        _upload_slots = asyncio.Semaphore(slots)
+        _chunkers = ThreadPoolExecutor(slots, thread_name_prefix="upload-chunker")
+    async with _upload_slots:
+        return await _ingest(params[b"boundary"], stream, doc_prefix, options or {})
+
+
+async def _ingest(boundary: bytes, stream, doc_prefix: str, options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    events = _Events()
+    parser = MultipartParser(boundary, events.callbacks())
+
+    results: List[Dict[str, Any]] = []
+    current: Optional[_FileIngest] = None
+    total = 0
+    try:
+        async for chunk in stream:
+            total += len(chunk)
+            if settings.upload_max_bytes and total > settings.upload_max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {settings.upload_max_bytes} bytes")
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise UploadError(f"Malformed multipart body: {e}")
+            for event, value in events.take():
+                if event == "headers":
+                    current = _start_file(value, doc_prefix, options)
+                elif event == "data" and current is not None:
+                    await current.write(value)
+                elif event == "end" and current is not None:
+                    ingest, current = current, None
+                    results.append(await ingest.finish())
+        parser.finalize()
+        if current is not None:
+            raise UploadError("Multipart body ended in the middle of a file")
+    except BaseException:
+        if current is not None:
+            await current.abort()
+        raise
+    if not results:
+        raise UploadError("No files in upload")
+    return results
+
+
+def _start_file(headers: Dict[bytes, bytes], doc_prefix: str, options: Dict[str, Any]) -> Optional[_FileIngest]:
+    """Begin indexing a file part; None for plain form fields."""
+    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+    if b"filename" not in disposition:
+        return None
+    filename = disposition[b"filename"].decode("utf-8", errors="replace")
+    content_type = headers.get(b"content-type", b"").decode("latin-1")
+    kind = file_kind(filename, content_type)
+    if kind is None:
+        raise UploadError(f"Unsupported file type for {filename!r} ({content_type or 'no content type'})")
+    _, type_params = parse_options_header(content_type)
+    charset = type_params.get(b"charset")
+    return _FileIngest(
+        make_doc_id(doc_prefix, filename),
+        filename,
+        kind,
+        charset.decode("latin-1") if charset else None,
+        options,
+    )
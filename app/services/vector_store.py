@@ -1,82 +1,389 @@
-from typing import List, Optional, Tuple
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
 import logging
 
-import numpy as np
-from qdrant_client import QdrantClient
+import httpx
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as qmodels
 
 from app.core.settings import settings
 
 log = logging.getLogger(__name__)
 
-_client: QdrantClient | None = None
+# Conditions on payload fields, all of which must hold:
+# {"doc_id": "a"} equality, {"doc_id": ["a", "b"]} any of (for list fields like
+# tags: any element), {"created_at": {"gte": t0, "lt": t1}} numeric range
+PayloadFilter = Dict[str, Any]
 
+# Payload fields filters run on; Qdrant gets a payload index for each
+KEYWORD_FIELDS = ("doc_id", "tenant", "tags")
+RANGE_FIELDS = ("created_at",)
 
-def get_client() -> QdrantClient:
-    global _client
-    if _client is None:
-        _client = QdrantClient(url=settings.qdrant_url)
-    return _client
+_qdrant: AsyncQdrantClient | None = None
+_stores: Dict[str, "VectorStore"] = {}
 
 
-def ensure_collection(
-    vector_size: int,
-    distance: qmodels.Distance = qmodels.Distance.COSINE,
-) -> None:
-    client = get_client()
-    coll_name = settings.qdrant_collection
-
-    collections = client.get_collections().collections
-    existing = {c.name for c in collections}
-    if coll_name in existing:
-        return
-
-    log.info("Creating Qdrant collection %s with size=%d", coll_name, vector_size)
-    client.create_collection(
-        collection_name=coll_name,
-        vectors_config=qmodels.VectorParams(size=vector_size, distance=distance),
-    )
-
-
-def upsert_points(
-    vectors: List[List[float]],
-    payloads: List[dict],
-    ids: Optional[List[str]] = None,
-) -> None:
-    client = get_client()
-    coll_name = settings.qdrant_collection
-
-    if ids is None:
-        ids = [None] * len(vectors)  # Qdrant will auto-generate
-
-    points = []
-    for idx, (vec, payload) in enumerate(zip(vectors, payloads)):
-        point_id = ids[idx] if ids[idx] is not None else None
-        points.append(
-            qmodels.PointStruct(
-                id=point_id,
-                vector=vec,
-                payload=payload,
+class VectorStore(ABC):
+    """
+    Backend-agnostic vector store used by rag_service.
+
+    Search results are qdrant ScoredPoint objects for every backend,
+    so callers read .id / .score / .payload / .vector the same way.
+
+    ensure_collection() checks (or creates) the collection once per
+    process and then caches the result, so it costs nothing on the
+    search/index hot path.
+    """
+
+    def __init__(self, collection_name: str, vector_size: int):
+        self.collection_name = collection_name
+        self.vector_size = vector_size
+        self.ready = False
+
+    async def ensure_collection(self) -> None:
+        if self.ready:
+            return
+        await self._ensure_collection()
+        self.ready = True
+
+    @abstractmethod
+    async def _ensure_collection(self) -> None:
+        """Verify the collection exists with the right schema, creating it if missing."""
+        ...
+
+    @abstractmethod
+    async def upsert(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        payloads: List[dict],
+    ) -> None:
+        ...
+
+    @abstractmethod
+    async def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        payload_filter: Optional[PayloadFilter] = None,
+        with_vectors: bool = False,
+    ) -> List[List[qmodels.ScoredPoint]]:
+        ...
+
+    @abstractmethod
+    async def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def update_payloads(self, ids: List[str], payloads: List[dict]) -> None:
+        """Replace the payloads of existing points, keeping their vectors."""
+        ...
+
+    @abstractmethod
+    def scroll(
+        self,
+        batch_size: int = 256,
+        with_vectors: bool = True,
+    ) -> AsyncIterator[List[qmodels.Record]]:
+        """Iterate over every stored point in pages (used by migrations)."""
+        ...
+
+    async def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        payload_filter: Optional[PayloadFilter] = None,
+        with_vectors: bool = False,
+    ) -> List[qmodels.ScoredPoint]:
+        results = await self.search_batch(
+            [query_vector],
+            limit=limit,
+            payload_filter=payload_filter,
+            with_vectors=with_vectors,
+        )
+        return results[0]
+
+    async def close(self) -> None:
+        return None
+
+
+def get_qdrant() -> AsyncQdrantClient:
+    """The one pooled Qdrant client shared by all Qdrant-backed stores."""
+    global _qdrant
+    if _qdrant is None:
+        _qdrant = AsyncQdrantClient(
+            url=settings.qdrant_url,
+            api_key=settings.qdrant_api_key,
+            prefer_grpc=settings.qdrant_prefer_grpc,
+            grpc_port=settings.qdrant_grpc_port,
+            # Explicit limits: qdrant-client disables keep-alive for localhost by default.
+            limits=httpx.Limits(
+                max_connections=settings.qdrant_max_connections,
+                max_keepalive_connections=settings.qdrant_max_connections,
+            ),
+        )
+    return _qdrant
+
+
+def _to_qdrant_filter(payload_filter: Optional[PayloadFilter]) -> Optional[qmodels.Filter]:
+    if not payload_filter:
+        return None
+    must: List[qmodels.Condition] = []
+    for key, value in payload_filter.items():
+        if isinstance(value, dict):
+            must.append(qmodels.FieldCondition(key=key, range=qmodels.Range(**value)))
+            continue
+        if isinstance(value, (list, tuple, set)):
+            match: Any = qmodels.MatchAny(any=list(value))
+        else:
+            match = qmodels.MatchValue(value=value)
+        must.append(qmodels.FieldCondition(key=key, match=match))
+    return qmodels.Filter(must=must)
+
+
+def _payload_schemas() -> Dict[str, Any]:
+    schemas: Dict[str, Any] = {key: qmodels.PayloadSchemaType.KEYWORD for key in KEYWORD_FIELDS}
+    schemas.update((key, qmodels.PayloadSchemaType.FLOAT) for key in RANGE_FIELDS)
+    if settings.multitenant:
+        # Co-locates each tenant's points on disk; with payload_m below,
+        # Qdrant builds one HNSW graph per tenant
+        schemas["tenant"] = qmodels.KeywordIndexParams(type=qmodels.KeywordIndexType.KEYWORD, is_tenant=True)
+    return schemas
+
+
+def _quantization_config(quantization: str) -> Optional[qmodels.QuantizationConfig]:
+    if quantization == "int8":
+        return qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(
+                type=qmodels.ScalarType.INT8, quantile=0.99, always_ram=True
             )
         )
+    if quantization == "binary":
+        return qmodels.BinaryQuantization(
+            binary=qmodels.BinaryQuantizationConfig(always_ram=True)
+        )
+    if quantization == "none":
+        return None
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    Collection on the shared Qdrant client.
+
+    Filtered fields (KEYWORD_FIELDS, RANGE_FIELDS) get payload indexes, so
+    filtered searches do not scan payloads. With settings.multitenant new
+    collections are partitioned by tenant instead of having a global graph.
 
-    client.upsert(collection_name=coll_name, points=points)
+    With quantization="int8" | "binary" new collections keep quantized
+    vectors in RAM (originals on disk) and searches rescore the top
+    limit * oversampling candidates with the original vectors.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        vector_size: int,
+        quantization: str = "none",
+        oversampling: float = 3.0,
+    ):
+        super().__init__(collection_name, vector_size)
+        self.client = get_qdrant()
+        self.quantization_config = _quantization_config(quantization)
+        self.search_params = None
+        if self.quantization_config is not None:
+            self.search_params = qmodels.SearchParams(
+                quantization=qmodels.QuantizationSearchParams(
+                    rescore=True, oversampling=oversampling
+                )
+            )
+
+    async def _ensure_collection(
+        self,
+        distance: qmodels.Distance = qmodels.Distance.COSINE,
+    ) -> None:
+        if not await self.client.collection_exists(self.collection_name):
+            log.info(
+                "Creating Qdrant collection %s with size=%d",
+                self.collection_name,
+                self.vector_size,
+            )
+            try:
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=qmodels.VectorParams(
+                        size=self.vector_size,
+                        distance=distance,
+                        on_disk=self.quantization_config is not None,
+                    ),
+                    quantization_config=self.quantization_config,
+                    # Every search names a tenant: skip the global graph
+                    hnsw_config=qmodels.HnswConfigDiff(payload_m=16, m=0) if settings.multitenant else None,
+                )
+                await self._ensure_payload_indexes({})
+                return
+            except Exception:
+                # Another worker may have created it concurrently
+                if not await self.client.collection_exists(self.collection_name):
+                    raise
+
+        info = await self.client.get_collection(self.collection_name)
+        params = info.config.params.vectors
+        if isinstance(params, qmodels.VectorParams) and (
+            params.size != self.vector_size or params.distance != distance
+        ):
+            raise RuntimeError(
+                f"Qdrant collection {self.collection_name} has size={params.size}, "
+                f"distance={params.distance}; expected size={self.vector_size}, "
+                f"distance={distance}"
+            )
+        await self._ensure_payload_indexes(info.payload_schema or {})
+
+    async def _ensure_payload_indexes(self, existing: Dict[str, Any]) -> None:
+        """Create the payload indexes the collection does not have yet."""
+        for field, schema in _payload_schemas().items():
+            if field in existing:
+                continue
+            log.info("Creating payload index %s.%s", self.collection_name, field)
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field,
+                field_schema=schema,
+            )
+
+    async def upsert(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        payloads: List[dict],
+    ) -> None:
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            points=qmodels.Batch(ids=ids, vectors=vectors, payloads=payloads),
+        )
+
+    async def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        limit: int = 5,
+        payload_filter: Optional[PayloadFilter] = None,
+        with_vectors: bool = False,
+    ) -> List[List[qmodels.ScoredPoint]]:
+        qfilter = _to_qdrant_filter(payload_filter)
+        if len(query_vectors) == 1:
+            res = await self.client.search(
+                collection_name=self.collection_name,
+                query_vector=query_vectors[0],
+                limit=limit,
+                query_filter=qfilter,
+                search_params=self.search_params,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            return [res]
+
+        return await self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[
+                qmodels.SearchRequest(
+                    vector=vec,
+                    limit=limit,
+                    filter=qfilter,
+                    params=self.search_params,
+                    with_payload=True,
+                    with_vector=with_vectors,
+                )
+                for vec in query_vectors
+            ],
+        )
+
+    async def delete(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=qmodels.PointIdsList(points=ids),
+        )
+
+    async def scroll(
+        self,
+        batch_size: int = 256,
+        with_vectors: bool = True,
+    ) -> AsyncIterator[List[qmodels.Record]]:
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            if records:
+                yield records
+            if offset is None:
+                break
+
+    async def update_payloads(self, ids: List[str], payloads: List[dict]) -> None:
+        if not ids:
+            return
+        await self.client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=[
+                qmodels.OverwritePayloadOperation(
+                    overwrite_payload=qmodels.SetPayload(payload=payload, points=[point_id])
+                )
+                for point_id, payload in zip(ids, payloads)
+            ],
+        )
+
+
+def create_store(
+    collection_name: str,
+    vector_size: int,
+    quantization: Optional[str] = None,
+) -> VectorStore:
+    """
+    New store object for a collection, using settings.vector_backend:
+    - "qdrant": remote Qdrant server (default)
+    - "local": in-process NumPy index (see local_vector_store)
+    quantization defaults to settings.vector_quantization.
+    """
+    quantization = quantization or settings.vector_quantization
+    if settings.vector_backend == "local":
+        from app.services.local_vector_store import LocalVectorStore
+
+        return LocalVectorStore(
+            collection_name,
+            vector_size,
+            settings.local_index_dir,
+            quantization=quantization,
+            oversampling=settings.quantization_oversampling,
+        )
+    if settings.vector_backend == "qdrant":
+        return QdrantVectorStore(
+            collection_name,
+            vector_size,
+            quantization=quantization,
+            oversampling=settings.quantization_oversampling,
+        )
+    raise RuntimeError(f"Unknown VECTOR_BACKEND: {settings.vector_backend}")
 
 
-def search_similar(
-    query_vector: List[float],
-    limit: int = 5,
-) -> List[Tuple[float, dict]]:
-    client = get_client()
-    coll_name = settings.qdrant_collection
+def get_store(collection_name: str, vector_size: int) -> VectorStore:
+    """Shared store for a collection (created on first use)."""
+    store = _stores.get(collection_name)
+    if store is None:
+        store = _stores[collection_name] = create_store(collection_name, vector_size)
+    return store
 
-    search_result = client.search(
-        collection_name=coll_name,
-        query_vector=query_vector,
-        limit=limit,
-    )
 
-    results: List[Tuple[float, dict]] = []
-    for r in search_result:
-        results.append((r.score, r.payload or {}))
-    return results
+async def close_all() -> None:
+    """Close stores and the shared Qdrant client (called from the app lifespan)."""
+    global _qdrant
+    for store in _stores.values():
+        await store.close()
+    _stores.clear()
+    if _qdrant is not None:
+        await _qdrant.close()
+    _qdrant = None
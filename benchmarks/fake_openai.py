@@ -0,0 +1,188 @@
+"""
+Offline stand-in for the OpenAI API used by the benchmark harness.
+
+Serves /v1/embeddings and /v1/chat/completions (plain and streaming)
+with simulated latency, token-by-token streams and rate-limit errors.
+Configured through environment variables so it can run under uvicorn:
+
+    FAKE_OPENAI_LATENCY_MS        time to first token / full reply (default 50)
+    FAKE_OPENAI_JITTER_MS         +- uniform jitter on every latency (default 10)
+    FAKE_OPENAI_TOKENS            tokens per reply (default 30)
+    FAKE_OPENAI_TOKEN_DELAY_MS    delay between streamed tokens (default 5)
+    FAKE_OPENAI_EMBED_LATENCY_MS  embeddings call latency (default 20)
+    FAKE_OPENAI_ERROR_RATE        share of requests answered with 429 (default 0)
+    FAKE_OPENAI_RPM               requests per minute before 429s, 0 = unlimited
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import zlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "50"))
+JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "10"))
+REPLY_TOKENS = int(os.getenv("FAKE_OPENAI_TOKENS", "30"))
+TOKEN_DELAY_MS = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY_MS", "5"))
+EMBED_LATENCY_MS = float(os.getenv("FAKE_OPENAI_EMBED_LATENCY_MS", "20"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+RPM = int(os.getenv("FAKE_OPENAI_RPM", "0"))
+
+_WORDS = "the agent answers questions using retrieved context from indexed documents".split()
+
+app = FastAPI(title="fake-openai")
+
+# Fixed one-minute window request counter for FAKE_OPENAI_RPM
+_window = {"start": time.monotonic(), "count": 0}
+
+
+async def _sleep(ms: float) -> None:
+    delay = ms + random.uniform(-JITTER_MS, JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _rate_limit_headers(remaining: int) -> dict:
+    reset = max(0.0, 60 - (time.monotonic() - _window["start"]))
+    return {
+        "x-ratelimit-limit-requests": str(RPM or 10_000),
+        "x-ratelimit-remaining-requests": str(max(0, remaining)),
+        "x-ratelimit-reset-requests": f"{reset:.3f}s",
+    }
+
+
+def _admit() -> JSONResponse | None:
+    """429 when over FAKE_OPENAI_RPM or picked by FAKE_OPENAI_ERROR_RATE."""
+    now = time.monotonic()
+    if now - _window["start"] >= 60:
+        _window["start"], _window["count"] = now, 0
+    _window["count"] += 1
+    remaining = (RPM - _window["count"]) if RPM else 10_000
+    if (RPM and remaining < 0) or random.random() < ERROR_RATE:
+        headers = _rate_limit_headers(0)
+        headers["retry-after-ms"] = "200"
+        return JSONResponse(
+            status_code=429,
+            headers=headers,
+            content={
+                "error": {
+                    "message": "Rate limit reached (fake)",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+        )
+    return None
+
+
+@lru_cache(maxsize=50_000)
+def _word_vector(word: str, dims: int) -> np.ndarray:
+    rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+    return rng.standard_normal(dims).astype(np.float32)
+
+
+def embed(text: str, dims: int) -> List[float]:
+    """Bag-of-words hashing: texts sharing words get similar vectors."""
+    vec = np.zeros(dims, dtype=np.float32)
+    for word in text.lower().split()[:512]:
+        vec += _word_vector(word, dims)
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    rejected = _admit()
+    if rejected is not None:
+        return rejected
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    dims = int(body.get("dimensions") or 1536)
+    await _sleep(EMBED_LATENCY_MS)
+    data = [
+        {"object": "embedding", "index": i, "embedding": embed(text, dims)}
+        for i, text in enumerate(inputs)
+    ]
+    n_tokens = sum(len(t.split()) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "fake-embedding"),
+        "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+    }
+
+
+def _reply_tokens() -> List[str]:
+    return [random.choice(_WORDS) + " " for _ in range(REPLY_TOKENS)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    rejected = _admit()
+    if rejected is not None:
+        return rejected
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    tokens = _reply_tokens()
+    created = int(time.time())
+    completion_id = f"chatcmpl-fake-{random.getrandbits(48):x}"
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+    }
+    headers = _rate_limit_headers(RPM - _window["count"] if RPM else 10_000)
+
+    if not body.get("stream"):
+        await _sleep(LATENCY_MS + TOKEN_DELAY_MS * len(tokens))
+        return JSONResponse(
+            headers=headers,
+            content={
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta: dict, finish_reason=None, choices=True, with_usage=False) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+        }
+        if with_usage:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def stream():
+        await _sleep(LATENCY_MS)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            yield chunk({"content": token})
+            await _sleep(TOKEN_DELAY_MS)
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield chunk({}, choices=False, with_usage=True)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
@@ -0,0 +1,340 @@
+"""
+Offline load / latency benchmark for the API.
+
+Starts the fake OpenAI server (benchmarks/fake_openai.py) and the real app
+(local vector backend, in-memory caches) as uvicorn subprocesses on
+loopback ports, drives /docs/index, /docs/search and /chat at the given
+concurrency, and reports throughput plus p50/p95/p99 per endpoint and per
+pipeline stage (from the app's /metrics). Nothing leaves the machine.
+
+    python -m benchmarks.run --requests 200 --concurrency 16 --output bench.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_VOCAB = (
+    "agent vector index query chunk embedding latency cache session token "
+    "prompt model retrieval search document upload error limit budget stream "
+    "policy refund shipping invoice account password deploy cluster backup"
+).split()
+
+_METRIC_LINE = re.compile(r'^(\w+)\{(.*)\}\s+([0-9.eE+-]+|\+Inf)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# --- statistics -----------------------------------------------------------
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in [0, 100]) of raw samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def bucket_percentile(buckets: List[Tuple[float, float]], q: float) -> float:
+    """
+    Percentile estimated from cumulative histogram buckets [(le, count)],
+    interpolating linearly inside the bucket (as Prometheus does).
+    """
+    if not buckets or buckets[-1][1] <= 0:
+        return 0.0
+    total = buckets[-1][1]
+    rank = total * q / 100
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == float("inf"):
+                return prev_le
+            span = count - prev_count
+            frac = (rank - prev_count) / span if span else 0.0
+            return prev_le + (le - prev_le) * frac
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def parse_stage_histograms(text: str) -> Dict[str, List[Tuple[float, float]]]:
+    """stage -> cumulative [(le, count)] from ai_agent_stage_seconds_bucket lines."""
+    stages: Dict[str, Dict[float, float]] = {}
+    for line in text.splitlines():
+        m = _METRIC_LINE.match(line)
+        if not m or m.group(1) != "ai_agent_stage_seconds_bucket":
+            continue
+        labels = dict(_LABEL.findall(m.group(2)))
+        le = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+        stages.setdefault(labels["stage"], {})[le] = float(m.group(3))
+    return {stage: sorted(b.items()) for stage, b in stages.items()}
+
+
+def diff_histograms(
+    before: Dict[str, List[Tuple[float, float]]],
+    after: Dict[str, List[Tuple[float, float]]],
+) -> Dict[str, List[Tuple[float, float]]]:
+    out = {}
+    for stage, buckets in after.items():
+        old = dict(before.get(stage, []))
+        delta = [(le, count - old.get(le, 0.0)) for le, count in buckets]
+        if delta and delta[-1][1] > 0:
+            out[stage] = delta
+    return out
+
+
+def summarize(latencies_ms: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    n = len(latencies_ms) + errors
+    return {
+        "requests": n,
+        "errors": errors,
+        "throughput_rps": round(len(latencies_ms) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+            "p50": round(percentile(latencies_ms, 50), 2),
+            "p95": round(percentile(latencies_ms, 95), 2),
+            "p99": round(percentile(latencies_ms, 99), 2),
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of current vs baseline: p95 latency up or throughput down by > tolerance."""
+    problems = []
+    for name, base in baseline.get("scenarios", {}).items():
+        cur = current.get("scenarios", {}).get(name)
+        if cur is None:
+            problems.append(f"{name}: missing from this run")
+            continue
+        base_p95, cur_p95 = base["latency_ms"]["p95"], cur["latency_ms"]["p95"]
+        if base_p95 and cur_p95 > base_p95 * (1 + tolerance):
+            problems.append(f"{name}: p95 {cur_p95:.1f}ms > baseline {base_p95:.1f}ms")
+        base_rps, cur_rps = base["throughput_rps"], cur["throughput_rps"]
+        if base_rps and cur_rps < base_rps * (1 - tolerance):
+            problems.append(f"{name}: throughput {cur_rps:.1f}/s < baseline {base_rps:.1f}/s")
+        if cur["errors"] > base["errors"]:
+            problems.append(f"{name}: {cur['errors']} errors (baseline {base['errors']})")
+    return problems
+
+
+# --- servers --------------------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(module: str, port: int, env: Dict[str, str], verbose: bool) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+        # The app logs every request at INFO on stdout
+        stdout=None if verbose else subprocess.DEVNULL,
+    )
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server for {url} exited with {proc.returncode}")
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"server for {url} did not start")
+
+
+# --- load -----------------------------------------------------------------
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_VOCAB) for _ in range(words)) + "."
+
+
+async def _drive(
+    n: int,
+    concurrency: int,
+    call: Callable[[int], Awaitable[httpx.Response]],
+) -> Tuple[List[float], int, float]:
+    """Run n calls with at most `concurrency` in flight; returns (latencies ms, errors, seconds)."""
+    latencies: List[float] = []
+    errors = 0
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i, errors
+        while next_i < n:
+            i = next_i
+            next_i += 1
+            start = time.perf_counter()
+            try:
+                resp = await call(i)
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_scenarios(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    scenarios: Dict[str, Any] = {}
+
+    calls: Dict[str, Callable[[httpx.AsyncClient], Callable[[int], Awaitable[httpx.Response]]]] = {
+        "index": lambda c: lambda i: c.post("/docs/index", json={
+            "doc_id": f"bench-{i % args.docs}",
+            "title": f"Bench doc {i % args.docs}",
+            "text": "\n\n".join(_text(rng, 40) for _ in range(args.doc_paragraphs)),
+        }),
+        "search": lambda c: lambda i: c.post("/docs/search", json={"query": _text(rng, 6), "limit": 5}),
+        "chat": lambda c: lambda i: c.post("/chat", json={"message": _text(rng, 12), "use_rag": True}),
+        "chat_stream": lambda c: lambda i: c.post(
+            "/chat/stream", json={"message": _text(rng, 12), "use_rag": True}
+        ),
+    }
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        for name in args.scenarios:
+            before = parse_stage_histograms((await client.get("/metrics")).text)
+            latencies, errors, elapsed = await _drive(args.requests, args.concurrency, calls[name](client))
+            after = parse_stage_histograms((await client.get("/metrics")).text)
+
+            result = summarize(latencies, errors, elapsed)
+            result["stages"] = {
+                stage: {
+                    "count": int(buckets[-1][1]),
+                    "p50_ms": round(bucket_percentile(buckets, 50) * 1000, 2),
+                    "p95_ms": round(bucket_percentile(buckets, 95) * 1000, 2),
+                    "p99_ms": round(bucket_percentile(buckets, 99) * 1000, 2),
+                }
+                for stage, buckets in sorted(diff_histograms(before, after).items())
+            }
+            scenarios[name] = result
+            print(
+                f"{name:12s} {result['throughput_rps']:8.1f} req/s  "
+                f"p50 {result['latency_ms']['p50']:7.1f}ms  p95 {result['latency_ms']['p95']:7.1f}ms  "
+                f"p99 {result['latency_ms']['p99']:7.1f}ms  errors {errors}",
+                file=sys.stderr,
+            )
+    return scenarios
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_port, app_port = _free_port(), _free_port()
+    fake_env = {
+        "FAKE_OPENAI_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_OPENAI_TOKENS": str(args.reply_tokens),
+        "FAKE_OPENAI_TOKEN_DELAY_MS": str(args.token_delay_ms),
+        "FAKE_OPENAI_EMBED_LATENCY_MS": str(args.embed_latency_ms),
+        "FAKE_OPENAI_ERROR_RATE": str(args.error_rate),
+        "FAKE_OPENAI_RPM": str(args.rpm),
+    }
+    app_env = {
+        "OPENAI_API_KEY": "offline-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_DIR": "",
+        "LEXICAL_INDEX_PATH": "",
+        "MANIFEST_PATH": "",
+        "CHUNK_STORE_PATH": "",
+        "EMBEDDING_CACHE_PATH": "",
+        "SESSION_BACKEND": "memory",
+    }
+    fake = _start("benchmarks.fake_openai:app", fake_port, fake_env, args.verbose)
+    server = _start("app.main:app", app_port, app_env, args.verbose)
+    try:
+        await _wait_ready(f"http://127.0.0.1:{fake_port}/docs", fake)
+        await _wait_ready(f"http://127.0.0.1:{app_port}/health", server)
+        scenarios = await run_scenarios(f"http://127.0.0.1:{app_port}", args)
+    finally:
+        for proc in (server, fake):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "embed_latency_ms": args.embed_latency_ms,
+            "reply_tokens": args.reply_tokens,
+            "error_rate": args.error_rate,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline API load/latency benchmark")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--scenarios", default="index,search,chat",
+        type=lambda s: [x.strip() for x in s.split(",") if x.strip()],
+        help="comma-separated: index,search,chat,chat_stream",
+    )
+    parser.add_argument("--docs", type=int, default=50, help="distinct doc ids for the index scenario")
+    parser.add_argument("--doc-paragraphs", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--reply-tokens", type=int, default=30)
+    parser.add_argument("--token-delay-ms", type=float, default=2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake 429s")
+    parser.add_argument("--rpm", type=int, default=0, help="fake requests/minute limit (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against this JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,3 +6,10 @@ import sys
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
+
+# Keep test runs from writing persistent caches into the repo
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LOCAL_INDEX_DIR", "")
+os.environ.setdefault("MANIFEST_PATH", "")
+os.environ.setdefault("CHUNK_STORE_PATH", "")
+os.environ.setdefault("LEXICAL_INDEX_PATH", "")
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.core.settings import settings
+from app.main import app
+from app.services import llm_service, tools
+
+client = TestClient(app)
+
+
+def _tool_call(call_id, name, **arguments):
+    return SimpleNamespace(
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def fake_agent_client(turns, seen):
+    """
+    Fake OpenAI client: returns the scripted turns in order (a list of
+    tool calls, or a final text reply) and records each request.
+    """
+    turns = iter(turns)
+
+    async def create(model, messages, temperature, tools=None):
+        seen.append({"messages": list(messages), "tools": tools})
+        turn = next(turns)
+        if isinstance(turn, str):
+            message = SimpleNamespace(content=turn, tool_calls=None)
+        else:
+            message = SimpleNamespace(content=None, tool_calls=turn)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _slow_tools(monkeypatch, delay):
+    async def slow_fetch(url):
+        await asyncio.sleep(delay)
+        return {"status_code": 200, "snippet": f"page {url}"}
+
+    async def slow_search(query, top_k=3):
+        await asyncio.sleep(delay)
+        return {"results": [{"doc_id": "faq", "title": "FAQ", "text": "Refunds take 5 days.", "score": 0.9}]}
+
+    registry = dict(tools.TOOLS)
+    registry["fetch_url"] = registry["fetch_url"]._replace(fn=slow_fetch)
+    registry["search_documents"] = registry["search_documents"]._replace(fn=slow_search)
+    monkeypatch.setattr(tools, "TOOLS", registry)
+
+
+def test_tool_calls_of_one_turn_run_in_parallel(monkeypatch):
+    _slow_tools(monkeypatch, delay=0.3)
+    seen = []
+    turns = [
+        [
+            _tool_call("c1", "search_documents", query="refunds"),
+            _tool_call("c2", "fetch_url", url="https://example.com/policy"),
+        ],
+        "Refunds take 5 days.",
+    ]
+    monkeypatch.setattr(llm_service, "get_client", lambda: fake_agent_client(turns, seen))
+
+    started = time.perf_counter()
+    resp = client.post("/chat", json={"message": "How long do refunds take?", "use_rag": False, "use_tools": True})
+    elapsed = time.perf_counter() - started
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["reply"] == "Refunds take 5 days."
+    assert [c["name"] for c in data["tool_calls"]] == ["search_documents", "fetch_url"]
+    assert all(c["ok"] for c in data["tool_calls"])
+    assert data["sources"][0]["doc_id"] == "faq"
+    # Both 0.3s tools ran concurrently
+    assert elapsed < 0.55
+
+    # The second turn saw both results, matched to their call ids
+    tool_messages = [m for m in seen[1]["messages"] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["c1", "c2"]
+    assert "page https://example.com/policy" in tool_messages[1]["content"]
+    assert seen[0]["tools"] and len(seen[0]["tools"]) == len(tools.TOOLS)
+
+
+def test_slow_tools_time_out_and_steps_are_bounded(monkeypatch):
+    _slow_tools(monkeypatch, delay=1.0)
+    monkeypatch.setattr(settings, "tool_timeout", 0.05)
+    monkeypatch.setattr(settings, "agent_max_steps", 2)
+    seen = []
+    # The model keeps asking for tools; the last step does not offer any
+    turns = [[_tool_call("c1", "fetch_url", url="https://slow.example")], "Could not fetch it."]
+    monkeypatch.setattr(llm_service, "get_client", lambda: fake_agent_client(turns, seen))
+
+    resp = client.post("/chat", json={"message": "fetch it", "use_rag": False, "use_tools": True})
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["reply"] == "Could not fetch it."
+    assert data["tool_calls"][0]["ok"] is False
+    assert "timed out" in seen[1]["messages"][-1]["content"]
+    assert seen[1]["tools"] is None
+
+
+def test_run_tool_reports_bad_calls():
+    assert "unknown tool" in asyncio.run(tools.run_tool("rm_rf", "{}"))["error"]
+    assert "invalid arguments" in asyncio.run(tools.run_tool("fetch_url", "{not json"))["error"]
+    assert "invalid arguments" in asyncio.run(tools.run_tool("fetch_url", '{"uri": "x"}'))["error"]
+
+
+def test_stream_rejects_tools():
+    resp = client.post("/chat/stream", json={"message": "hi", "use_tools": True})
+    assert resp.status_code == 400
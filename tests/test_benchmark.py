@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+
+from benchmarks import fake_openai, run
+
+
+def test_percentiles():
+    values = [float(v) for v in range(1, 101)]
+    assert run.percentile(values, 50) == 50.5
+    assert run.percentile(values, 99) == 99.01
+    assert run.percentile([], 95) == 0.0
+
+    # 10 observations <= 0.1s, 10 more <= 0.2s: the median sits on the first edge
+    buckets = [(0.1, 10.0), (0.2, 20.0), (float("inf"), 20.0)]
+    assert run.bucket_percentile(buckets, 50) == 0.1
+    assert abs(run.bucket_percentile(buckets, 75) - 0.15) < 1e-9
+
+
+def test_compare_flags_regressions():
+    def report(p95, rps, errors=0):
+        return {"scenarios": {"chat": {"latency_ms": {"p95": p95}, "throughput_rps": rps, "errors": errors}}}
+
+    baseline = report(100.0, 50.0)
+    assert run.compare(report(110.0, 48.0), baseline, tolerance=0.25) == []
+
+    problems = run.compare(report(200.0, 20.0, errors=3), baseline, tolerance=0.25)
+    assert len(problems) == 3
+    assert run.compare({"scenarios": {}}, baseline, 0.25) == ["chat: missing from this run"]
+
+
+def test_fake_openai_shapes(monkeypatch):
+    monkeypatch.setattr(fake_openai, "EMBED_LATENCY_MS", 0)
+    monkeypatch.setattr(fake_openai, "LATENCY_MS", 0)
+    monkeypatch.setattr(fake_openai, "TOKEN_DELAY_MS", 0)
+    monkeypatch.setattr(fake_openai, "JITTER_MS", 0)
+    client = TestClient(fake_openai.app)
+
+    resp = client.post(
+        "/v1/embeddings",
+        json={"model": "m", "input": ["reset password", "reset my password"], "dimensions": 64},
+    )
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    assert [len(d["embedding"]) for d in data] == [64, 64]
+
+    resp = client.post("/v1/chat/completions", json={"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+    assert resp.status_code == 200
+    assert resp.json()["choices"][0]["message"]["content"]
+    assert resp.json()["usage"]["completion_tokens"] > 0
+    assert "x-ratelimit-remaining-requests" in resp.headers
+
+
+def test_fake_openai_rate_limits(monkeypatch):
+    monkeypatch.setattr(fake_openai, "ERROR_RATE", 1.0)
+    client = TestClient(fake_openai.app)
+    resp = client.post("/v1/embeddings", json={"model": "m", "input": "x"})
+    assert resp.status_code == 429
+    assert resp.json()["error"]["code"] == "rate_limit_exceeded"
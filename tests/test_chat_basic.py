@@ -1,5 +1,7 @@
+import asyncio
 from types import SimpleNamespace
 
+import httpx
 from fastapi.testclient import TestClient
 from app.main import app
 from app.services import llm_service
@@ -14,7 +16,7 @@ def fake_get_client():
     and always returns a dummy reply.
     """
 
-    def create(model, messages, temperature):
+    async def create(model, messages, temperature):
         # This shape matches what llm_service expects:
         # resp.choices[0].message["content"]
         return SimpleNamespace(
@@ -68,3 +70,167 @@ def test_chat_missing_message(monkeypatch):
     # Missing "message"
     resp = client.post("/chat", json={"session_id": None})
     assert resp.status_code == 422
+
+
+def fake_get_streaming_client():
+    """
+    Fake OpenAI client for stream=True:
+    create(...) returns an async iterator of delta chunks.
+    """
+
+    async def chunks():
+        for piece in ["hi ", "from ", "stream"]:
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))]
+            )
+
+    async def create(model, messages, temperature, stream=False, stream_options=None):
+        assert stream is True
+        return chunks()
+
+    completions = SimpleNamespace(create=create)
+    chat = SimpleNamespace(completions=completions)
+    return SimpleNamespace(chat=chat)
+
+
+def test_chat_stream(monkeypatch):
+    """
+    /chat/stream should emit sources first, then deltas, then done,
+    and commit the full reply to memory.
+    """
+    monkeypatch.setattr(llm_service, "get_client", fake_get_streaming_client)
+
+    payload = {"message": "Hello stream", "use_rag": False}
+    resp = client.post("/chat/stream", json=payload)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        line.split(": ", 1)[1]
+        for line in resp.text.splitlines()
+        if line.startswith("event: ")
+    ]
+    assert events[0] == "sources"
+    assert events[-1] == "done"
+    assert events.count("delta") == 3
+    assert '"reply": "hi from stream"' in resp.text
+
+    # Next turn sees the streamed answer in history
+    monkeypatch.setattr(llm_service, "get_client", fake_get_client)
+    sid = resp.text.split('"session_id": "', 1)[1].split('"', 1)[0]
+    resp = client.post("/chat", json={"message": "again", "session_id": sid, "use_rag": False})
+    assert resp.status_code == 200
+    assert resp.json()["history"][1]["content"] == "hi from stream"
+
+
+def test_chat_semantic_cache_hit(monkeypatch):
+    """
+    With the semantic cache on, a near-duplicate first-turn question
+    is answered from cache without calling the LLM.
+    """
+    from app.core.settings import settings
+    from app.services import rag_service, semantic_cache
+
+    calls = []
+
+    def counting_client():
+        fake = fake_get_client()
+        create = fake.chat.completions.create
+
+        async def counted(**kwargs):
+            calls.append(kwargs)
+            return await create(**kwargs)
+
+        fake.chat.completions.create = counted
+        return fake
+
+    async def fake_embed(text):
+        # "reset password" phrasings land on the same direction
+        return [1.0, 0.01 * len(text)] if "password" in text else [0.0, 1.0]
+
+    monkeypatch.setattr(settings, "semantic_cache_enabled", True)
+    monkeypatch.setattr(semantic_cache, "_cache", None)
+    monkeypatch.setattr(rag_service, "embed_text", fake_embed)
+    monkeypatch.setattr(llm_service, "get_client", counting_client)
+
+    first = client.post("/chat", json={"message": "How do I reset my password?", "use_rag": False})
+    second = client.post("/chat", json={"message": "how to reset password", "use_rag": False})
+    other = client.post("/chat", json={"message": "What is RAG?", "use_rag": False})
+
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["reply"] == "hi from test"
+    assert other.json()["cached"] is False
+    assert len(calls) == 2
+
+
+def _asgi_client():
+    # Requests share one event loop, so they really run concurrently
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_chat_concurrency_is_limited(monkeypatch):
+    """Past settings.chat_max_concurrency, /chat calls wait for a slot."""
+    from app.core.settings import settings
+
+    in_flight = [0]
+    peak = [0]
+
+    async def create(model, messages, temperature):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.02)
+        in_flight[0] -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message={"content": "ok"})])
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_service, "get_client", lambda: fake)
+    monkeypatch.setattr(settings, "chat_max_concurrency", 2)
+    monkeypatch.setattr(llm_service, "_chat_slots", None)
+
+    async def burst():
+        async with _asgi_client() as ac:
+            return await asyncio.gather(*(
+                ac.post("/chat", json={"message": f"question {i}", "use_rag": False})
+                for i in range(6)
+            ))
+
+    responses = asyncio.run(burst())
+    assert [r.status_code for r in responses] == [200] * 6
+    assert peak[0] == 2
+
+
+def test_docs_index_and_search_async(monkeypatch):
+    from app.core.settings import settings
+    from app.services import doc_manifest, lexical_index, rag_service
+    from app.services.local_vector_store import LocalVectorStore
+    from tests.test_rag_indexing import FakeEmbeddings
+
+    embeddings = FakeEmbeddings()
+    store = LocalVectorStore("test", 2)
+    manifest = doc_manifest.DocManifest()
+    index = lexical_index.LexicalIndex()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(lexical_index, "get_index", lambda: index)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "retrieval_min_score", 0.0)
+
+    async def index_then_search():
+        async with _asgi_client() as ac:
+            indexed = await asyncio.gather(*(
+                ac.post("/docs/index", json={"doc_id": f"d{i}", "text": f"Refund policy number {i}."})
+                for i in range(3)
+            ))
+            found = await ac.post("/docs/search", json={"query": "refund policy", "limit": 5})
+            return indexed, found
+
+    indexed, found = asyncio.run(index_then_search())
+    assert all(r.status_code == 200 and r.json()["chunks_indexed"] == 1 for r in indexed)
+    assert found.status_code == 200, found.text
+    results = found.json()["results"]
+    assert sorted(r["doc_id"] for r in results) == ["d0", "d1", "d2"]
+    assert all(r["text"].startswith("Refund policy") for r in results)
@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.settings import settings
+from app.services import chunk_store, doc_manifest, lexical_index, rag_service
+from tests.test_rag_indexing import FakeEmbeddings, RecordingStore
+
+DOCS = {
+    "billing": "Invoices are sent on the first day of each month.",
+    "refunds": "Refunds are issued within five business days.",
+    "shipping": "Orders ship from the nearest warehouse.",
+    "support": "Support is available around the clock by chat.",
+}
+
+
+class SpyChunkStore(chunk_store.ChunkStore):
+    def __init__(self):
+        super().__init__()
+        self.fetched = []
+
+    def get_many(self, point_ids):
+        self.fetched.append(list(point_ids))
+        return super().get_many(point_ids)
+
+
+def _setup(monkeypatch, text_store="local"):
+    embeddings = FakeEmbeddings()
+    store = RecordingStore()
+    chunks = SpyChunkStore()
+    manifest = doc_manifest.DocManifest()
+    index = lexical_index.LexicalIndex()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(chunk_store, "get_chunk_store", lambda: chunks)
+    monkeypatch.setattr(lexical_index, "get_index", lambda: index)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "retrieval_mode", "vector")
+    monkeypatch.setattr(settings, "retrieval_diversify", False)
+    monkeypatch.setattr(settings, "retrieval_min_score", 0.0)
+    monkeypatch.setattr(settings, "chunk_text_store", text_store)
+    for doc_id, text in DOCS.items():
+        asyncio.run(rag_service.index_document(doc_id, text))
+    return store, chunks
+
+
+def test_payloads_are_slim_and_only_top_k_text_is_fetched(monkeypatch):
+    store, chunks = _setup(monkeypatch)
+    assert all("text" not in p for page in store.upserts for p in page)
+    assert chunks.stats() == {"chunks": len(DOCS)}
+
+    sources = asyncio.run(rag_service.retrieve_for_query("refunds", limit=2))
+
+    assert len(sources) == 2
+    assert {s.text for s in sources} <= set(DOCS.values())
+    assert len(chunks.fetched) == 1 and len(chunks.fetched[0]) == 2
+
+
+def test_text_is_removed_with_the_chunks(monkeypatch):
+    _, chunks = _setup(monkeypatch)
+    asyncio.run(rag_service.index_document("billing", "Invoices are now sent weekly."))
+    asyncio.run(rag_service.delete_document("refunds"))
+    assert chunks.stats() == {"chunks": len(DOCS) - 1}
+
+
+def test_payload_mode_keeps_text_in_the_vector_store(monkeypatch):
+    store, chunks = _setup(monkeypatch, text_store="payload")
+    assert all(p["text"] for page in store.upserts for p in page)
+
+    sources = asyncio.run(rag_service.retrieve_for_query("refunds", limit=2))
+    assert all(s.text for s in sources)
+    assert chunks.fetched == [] and chunks.stats() == {"chunks": 0}
+
+
+def test_hits_without_text_are_dropped_and_logged(monkeypatch, caplog):
+    """Another host querying a collection indexed with CHUNK_TEXT_STORE=local."""
+    _setup(monkeypatch)
+    monkeypatch.setattr(chunk_store, "get_chunk_store", lambda: SpyChunkStore())
+
+    sources = asyncio.run(rag_service.retrieve_for_query("refunds", limit=2))
+
+    assert sources == []
+    assert "No text for 2 of 2 retrieved chunks" in caplog.text
@@ -0,0 +1,34 @@
+from app.services.chunking import count_tokens, iter_chunks
+
+
+DOC = "".join(
+    f"Paragraph {p} starts here. It has a second sentence! And a third one?\n\n"
+    for p in range(40)
+)
+
+
+def test_chunks_respect_token_budget_and_sentences():
+    chunks = list(iter_chunks([DOC], chunk_tokens=50, overlap_tokens=10))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert count_tokens(chunk) <= 50
+        # never cut mid-sentence
+        assert chunk.rstrip()[-1] in ".!?"
+
+
+def test_overlap_repeats_trailing_sentences():
+    chunks = list(iter_chunks([DOC], chunk_tokens=50, overlap_tokens=10))
+    assert chunks[0].endswith("And a third one?")
+    assert chunks[1].startswith("And a third one?")
+
+
+def test_streamed_input_matches_whole_string():
+    """Feeding the text in small pieces must give the same chunks."""
+    pieces = (DOC[i:i + 7] for i in range(0, len(DOC), 7))
+    assert list(iter_chunks(pieces, 50, 10)) == list(iter_chunks([DOC], 50, 10))
+
+
+def test_oversized_sentence_is_split():
+    chunks = list(iter_chunks(["x" * 4000], chunk_tokens=100))
+    assert "".join(chunks) == "x" * 4000
+    assert all(count_tokens(c) <= 100 for c in chunks)
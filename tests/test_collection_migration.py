@@ -0,0 +1,66 @@
+import asyncio
+
+import numpy as np
+
+from app.core.settings import settings
+from app.services import collection_migration, vector_store
+from app.services.local_vector_store import LocalVectorStore
+
+
+def test_migrate_reprojects_into_smaller_quantized_collection(monkeypatch, tmp_path):
+    """
+    The migration copies every point with vectors truncated + re-normalized,
+    keeps payloads, and reports recall against the full-precision source.
+    """
+    monkeypatch.setattr(settings, "vector_backend", "local")
+    monkeypatch.setattr(settings, "local_index_dir", str(tmp_path))
+
+    rng = np.random.default_rng(0)
+    # Most of the signal in the leading dimensions, as with text-embedding-3
+    vectors = rng.normal(size=(200, 32)) * np.linspace(3.0, 0.1, 32)
+    source = LocalVectorStore("docs", 32, str(tmp_path))
+    ids = [f"p{i}" for i in range(200)]
+    asyncio.run(source.upsert(ids, vectors.tolist(), [{"doc_id": i} for i in ids]))
+    asyncio.run(source.close())
+
+    report = asyncio.run(
+        collection_migration.migrate(
+            "docs_16_int8",
+            16,
+            quantization="int8",
+            source_name="docs",
+            source_dimensions=32,
+            n_eval=50,
+            k=5,
+        )
+    )
+    assert report["copied"] == 200
+    evaluation = report["evaluation"]
+    assert evaluation["recall"] > 0.5
+    assert evaluation["target_bytes_per_vector"] == 16
+
+    target = vector_store.create_store("docs_16_int8", 16)
+    hits = asyncio.run(target.search(vectors[7, :16].tolist(), limit=1, with_vectors=True))
+    assert hits[0].id == "p7" and hits[0].payload == {"doc_id": "p7"}
+    assert abs(np.linalg.norm(hits[0].vector) - 1.0) < 1e-5
+
+
+def test_alias_switch_is_refused_when_dimensions_change(monkeypatch):
+    switched = []
+
+    async def fake_switch(alias, collection_name):
+        switched.append((alias, collection_name))
+
+    monkeypatch.setattr(settings, "vector_backend", "qdrant")
+    monkeypatch.setattr(collection_migration, "switch_alias", fake_switch)
+
+    try:
+        asyncio.run(collection_migration.migrate("docs_16", 16, source_dimensions=32, alias="live"))
+        raise AssertionError("alias switched while dimensions change")
+    except ValueError as e:
+        assert "--alias-only" in str(e)
+    assert switched == []
+
+    # Second stage, once workers run with the new dimensions
+    report = asyncio.run(collection_migration.migrate("docs_16", 16, alias="live", alias_only=True))
+    assert report == {"alias": "live"} and switched == [("live", "docs_16")]
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.main import app
+from app.routers import chat as chat_router
+from app.services import deadline, llm_service, single_flight
+
+client = TestClient(app)
+
+
+def slow_client(delay, cancelled):
+    async def create(model, messages, temperature):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return SimpleNamespace(choices=[SimpleNamespace(message={"content": "late"})])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_scopes_only_shorten_the_deadline():
+    async def main():
+        assert deadline.remaining() is None
+        with deadline.scope(10):
+            with deadline.scope(0.05):
+                assert deadline.remaining() <= 0.05
+                with pytest.raises(deadline.DeadlineExceeded):
+                    await deadline.wait(asyncio.sleep(1))
+            with deadline.scope(100):
+                assert deadline.remaining() <= 10
+
+    asyncio.run(main())
+
+
+def test_chat_deadline_returns_504_and_cancels_the_llm_call(monkeypatch):
+    cancelled = []
+    monkeypatch.setattr(llm_service, "get_client", lambda: slow_client(2.0, cancelled))
+
+    started = time.perf_counter()
+    resp = client.post("/chat", json={"message": "hi", "use_rag": False, "timeout_seconds": 0.1})
+    assert resp.status_code == 504
+    assert time.perf_counter() - started < 1.0
+    assert cancelled == [True]
+
+    resp = client.post(
+        "/chat", json={"message": "hi", "use_rag": False}, headers={"X-Request-Timeout": "0.1"}
+    )
+    assert resp.status_code == 504
+
+
+def test_disconnect_cancels_in_flight_work():
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def receive():
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    async def main():
+        request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+        with pytest.raises(HTTPException) as exc:
+            await chat_router._cancel_on_disconnect(request, work())
+        return exc.value.status_code
+
+    assert asyncio.run(main()) == 499
+    assert cancelled == [True]
+
+
+def test_shared_call_is_cancelled_when_every_waiter_leaves():
+    cancelled = []
+
+    async def upstream():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        flight = single_flight.SingleFlight("test")
+        first = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        # The second waiter has a tighter deadline; the call keeps going for the first
+        with deadline.scope(0.05):
+            with pytest.raises(deadline.DeadlineExceeded):
+                await flight.do("k", upstream)
+        await asyncio.sleep(0)
+        assert cancelled == []
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_stalled_stream_is_cut_off_by_the_deadline(monkeypatch):
+    """The deadline fires while waiting for the next chunk, not only when one arrives."""
+    cancelled = []
+
+    async def chunks():
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"))])
+        try:
+            await asyncio.sleep(30)  # upstream stalls
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="late"))])
+
+    async def create(model, messages, temperature, stream=False, stream_options=None):
+        return chunks()
+
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_service, "get_client", lambda: fake)
+
+    started = time.monotonic()
+    resp = client.post("/chat/stream", json={"message": "hi", "use_rag": False, "timeout_seconds": 0.2})
+
+    assert time.monotonic() - started < 5
+    assert "event: error" in resp.text and "deadline" in resp.text
+    assert '"content": "hi"' in resp.text and "late" not in resp.text
+    assert cancelled == [True]
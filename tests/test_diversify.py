@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.settings import settings
+from app.services import diversify, doc_manifest, lexical_index, rag_service
+from app.services.diversify import Candidate
+from app.services.local_vector_store import LocalVectorStore
+
+
+def test_mmr_prefers_diverse_and_drops_near_duplicates():
+    query = [1.0, 0.0, 0.0]
+    vectors = [
+        [0.9, 0.1, 0.0],    # best match
+        [0.9, 0.1, 0.001],  # near-duplicate of the best match
+        [0.8, 0.0, 0.6],    # relevant, different direction
+        [0.0, 1.0, 0.0],    # irrelevant
+    ]
+    order = diversify.mmr_order(query, vectors, lambda_=0.5, dedup_threshold=0.99)
+    assert order[:2] == [0, 2]
+    assert 1 not in order
+
+
+def test_join_overlapping_removes_repeated_text():
+    first = "Alpha sentence one. Beta sentence two that is repeated."
+    second = "Beta sentence two that is repeated. Gamma sentence three."
+    assert diversify.join_overlapping(first, second) == (
+        "Alpha sentence one. Beta sentence two that is repeated. Gamma sentence three."
+    )
+
+
+def test_merge_adjacent_folds_neighbours_into_one_source():
+    def c(pid, doc, idx, score):
+        return Candidate(pid, {"doc_id": doc, "chunk_index": idx, "text": f"{doc}-{idx}"}, score)
+
+    ranked = [c("a", "d1", 4, 0.9), c("b", "d2", 0, 0.8), c("c", "d1", 5, 0.7), c("d", "d3", 1, 0.6)]
+    merged = diversify.merge_adjacent(ranked, limit=2)
+    assert [m.point_id for m in merged] == ["a", "b"]
+    assert merged[0].payload["text"] == "d1-4\nd1-5"
+    assert merged[0].payload["chunk_count"] == 2
+    assert merged[0].score == 0.9
+
+
+class AxisEmbeddings:
+    """Embeds text onto fixed directions by keyword, so near-duplicates are easy to build."""
+
+    async def create(self, model, input):
+        def vec(text):
+            return [
+                1.0 if "refund" in text else 0.0,
+                1.0 if "shipping" in text else 0.0,
+                0.1,
+            ]
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=vec(t)) for i, t in enumerate(input)]
+        )
+
+
+def test_retrieve_for_query_diversifies(monkeypatch):
+    store = LocalVectorStore("test", 3)
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=AxisEmbeddings())
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(lexical_index, "get_index", lambda: lexical_index.LexicalIndex())
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: doc_manifest.DocManifest())
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "retrieval_mode", "vector")
+    monkeypatch.setattr(settings, "chunk_tokens", 20)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 0)
+
+    faq = "\n\n".join(
+        f"Our refund policy, part {i}, covers returns within thirty days." for i in range(3)
+    )
+    asyncio.run(rag_service.index_document("faq", faq))
+    asyncio.run(rag_service.index_document("ship", "The shipping and refund rules for parcels."))
+
+    plain = asyncio.run(rag_service.retrieve_for_query("refund", limit=2))
+    assert [s.doc_id for s in plain] == ["faq", "faq"]
+
+    monkeypatch.setattr(settings, "retrieval_diversify", True)
+    monkeypatch.setattr(settings, "retrieval_dedup_threshold", 0.999)
+    diverse = asyncio.run(rag_service.retrieve_for_query("refund", limit=2))
+    assert [s.doc_id for s in diverse] == ["faq", "ship"]
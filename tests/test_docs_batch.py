@@ -0,0 +1,81 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.settings import settings
+from app.main import app
+from app.services import rag_service
+
+
+def _wait_for(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(f"/docs/jobs/{job_id}").json()
+        if data["status"].startswith("completed"):
+            return data
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish: {data}")
+
+
+def test_batch_index_ndjson_reports_progress_and_failures(monkeypatch):
+    """
+    /docs/index/batch should return a job id right away, index in the
+    background, and report per-doc failures.
+    """
+
+    async def fake_index(doc_id, content, source=None, tags=None, **kwargs):
+        if doc_id == "bad":
+            raise RuntimeError("boom")
+        return rag_service.IndexResult(chunks=2, embedded=2, moved=0, deleted=0)
+
+    monkeypatch.setattr(rag_service, "index_document", fake_index)
+
+    docs = [{"doc_id": f"d{i}", "text": "hello"} for i in range(5)]
+    docs.append({"doc_id": "bad", "text": "x"})
+    body = "\n".join(json.dumps(d) for d in docs)
+
+    with TestClient(app) as client:
+        resp = client.post(
+            "/docs/index/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert resp.status_code == 202
+        job_id = resp.json()["job_id"]
+
+        data = _wait_for(client, job_id)
+        assert data["status"] == "completed_with_errors"
+        assert data["succeeded"] == 5
+        assert data["chunks_indexed"] == 10
+        assert data["failures"] == [{"doc_id": "bad", "error": "boom"}]
+
+        assert client.get("/docs/jobs/nope").status_code == 404
+
+
+def test_batch_index_backpressure(monkeypatch):
+    """A batch larger than the free queue space is rejected with 429."""
+    monkeypatch.setattr(settings, "ingest_queue_size", 2)
+
+    with TestClient(app) as client:
+        docs = [{"doc_id": f"d{i}", "text": "hello"} for i in range(3)]
+        resp = client.post("/docs/index/batch", json=docs)
+        assert resp.status_code == 429
+
+        resp = client.post("/docs/index/batch", json=[{"doc_id": "x"}])
+        assert resp.status_code == 422
+
+
+def test_batch_index_unbounded_queue(monkeypatch):
+    """INGEST_QUEUE_SIZE=0 means no limit, not "always full"."""
+    async def fake_index(doc_id, content, source=None, tags=None, **kwargs):
+        return rag_service.IndexResult(chunks=1, embedded=1, moved=0, deleted=0)
+
+    monkeypatch.setattr(rag_service, "index_document", fake_index)
+    monkeypatch.setattr(settings, "ingest_queue_size", 0)
+
+    with TestClient(app) as client:
+        docs = [{"doc_id": f"d{i}", "text": "hello"} for i in range(3)]
+        resp = client.post("/docs/index/batch", json=docs)
+        assert resp.status_code == 202, resp.text
+        assert _wait_for(client, resp.json()["job_id"])["succeeded"] == 3
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.core.settings import settings
+from app.main import app
+from app.services import chunk_store, doc_manifest, lexical_index, rag_service, uploads
+from tests.test_rag_indexing import FakeEmbeddings, RecordingStore
+
+client = TestClient(app)
+
+
+def _setup(monkeypatch):
+    embeddings = FakeEmbeddings()
+    store = RecordingStore()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(doc_manifest, "_manifest", doc_manifest.DocManifest())
+    monkeypatch.setattr(lexical_index, "_index", None)
+    monkeypatch.setattr(chunk_store, "_store", chunk_store.ChunkStore())
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "chunk_text_store", "local")
+    return embeddings, store
+
+
+def test_upload_indexes_each_file(monkeypatch):
+    embeddings, store = _setup(monkeypatch)
+    notes = "".join(f"Note {i} covers refunds and shipping. " for i in range(200))
+    page = (
+        "<html><head><style>body { color: red }</style><script>var x = 1;</script></head>"
+        "<body><h1>Returns</h1><p>Items can be returned within 30 days &amp; refunded.</p></body></html>"
+    )
+
+    resp = client.post(
+        "/docs/upload?doc_prefix=kb/",
+        files=[
+            ("files", ("notes.md", notes.encode(), "text/markdown")),
+            ("files", ("returns.html", page.encode(), "text/html")),
+            ("comment", (None, "plain form fields are ignored")),
+        ],
+    )
+
+    assert resp.status_code == 200, resp.text
+    docs = {d["doc_id"]: d for d in resp.json()["documents"]}
+    assert set(docs) == {"kb/notes.md", "kb/returns.html"}
+    assert docs["kb/notes.md"]["chunks_indexed"] > 1
+    assert docs["kb/notes.md"]["bytes"] == len(notes)
+
+    payloads = [p for upsert in store.upserts for p in upsert]
+    assert all("text" not in p for p in payloads)
+    html_ids = sorted(doc_manifest.get_manifest().load("kb/returns.html").items(), key=lambda e: e[1][1])
+    texts = chunk_store.get_chunk_store().get_many([pid for pid, _ in html_ids])
+    html_text = " ".join(texts[pid] for pid, _ in html_ids)
+    assert "Items can be returned within 30 days & refunded." in html_text
+    assert "color" not in html_text and "var x" not in html_text
+    assert {p["source"] for p in payloads} == {"notes.md", "returns.html"}
+
+
+def test_upload_rejects_unsupported_files(monkeypatch):
+    _setup(monkeypatch)
+    resp = client.post("/docs/upload", files=[("files", ("logo.png", b"\x89PNG", "image/png"))])
+    assert resp.status_code == 422
+    assert "Unsupported file type" in resp.json()["detail"]
+
+    resp = client.post("/docs/upload", json={"text": "not multipart"})
+    assert resp.status_code == 422
+
+
+def test_upload_embeds_while_the_body_streams(monkeypatch):
+    """Chunks are embedded before the last byte arrives, with bounded buffering."""
+    embeddings, store = _setup(monkeypatch)
+    monkeypatch.setattr(settings, "upload_buffer_pieces", 2)
+    monkeypatch.setattr(settings, "embed_batch_size", 8)
+    boundary = "testboundary"
+    seen_calls_mid_stream = []
+
+    async def body():
+        yield (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="files"; filename="big.txt"\r\n'
+            "Content-Type: text/plain; charset=utf-8\r\n\r\n"
+        ).encode()
+        for block in range(200):
+            yield "".join(f"Block {block} line {i} mentions invoices. " for i in range(20)).encode()
+            await asyncio.sleep(0)
+            if block == 150:
+                seen_calls_mid_stream.append(len(embeddings.calls))
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    docs = asyncio.run(
+        uploads.ingest_multipart(f"multipart/form-data; boundary={boundary}", body(), options={})
+    )
+
+    assert docs[0]["doc_id"] == "big.txt"
+    assert docs[0]["chunks_indexed"] == store.count() > 50
+    assert seen_calls_mid_stream[0] > 0
+
+
+def test_html_extraction_is_incremental():
+    extractor = uploads.TextExtractor("html", None)
+    data = "<p>café <b>au</b> lait</p><script>skip()</script>".encode()
+    text = "".join(extractor.feed(data[i:i + 3]) for i in range(0, len(data), 3))
+    text += extractor.feed(b"", final=True)
+    assert text.split() == ["café", "au", "lait"]
+
+
+def test_upload_chunker_has_its_own_threads(monkeypatch):
+    """A chunker waiting on the upload must not hold a default-pool (to_thread) worker."""
+    _setup(monkeypatch)
+    threads = set()
+    chunk_text = rag_service._chunk_text
+
+    def spy(*args):
+        threads.add(threading.current_thread().name)
+        yield from chunk_text(*args)
+
+    monkeypatch.setattr(rag_service, "_chunk_text", spy)
+    resp = client.post("/docs/upload", files=[("files", ("a.txt", b"Refunds take five days.", "text/plain"))])
+    assert resp.status_code == 200, resp.text
+    assert threads and all(name.startswith("upload-chunker") for name in threads)
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.settings import settings
+from app.services import doc_manifest, lexical_index, rag_service
+from app.services.local_vector_store import LocalVectorStore
+from tests.test_rag_indexing import FakeEmbeddings
+
+DOCS = {
+    "errors": "Error ERR-4031 means the upload token expired. Request a new token and retry.",
+    "setup": "To set up the agent, install the dependencies and export your API key.",
+    "limits": "Uploads larger than 50 MB are rejected. Split big files before uploading.",
+}
+
+
+def _index_docs(monkeypatch):
+    embeddings = FakeEmbeddings()
+    store = LocalVectorStore("test", 2)
+    index = lexical_index.LexicalIndex()
+    manifest = doc_manifest.DocManifest()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(lexical_index, "get_index", lambda: index)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "retrieval_mode", "hybrid")
+
+    for doc_id, text in DOCS.items():
+        asyncio.run(rag_service.index_document(doc_id, text))
+    embeddings.calls.clear()
+    return embeddings, index
+
+
+def test_rrf_fuse_rewards_agreement():
+    fused = rag_service.rrf_fuse([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [point_id for point_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_identifier_query_skips_embedding(monkeypatch):
+    embeddings, _ = _index_docs(monkeypatch)
+
+    sources = asyncio.run(rag_service.retrieve_for_query("ERR-4031", limit=2))
+    assert sources[0].doc_id == "errors"
+    assert embeddings.calls == []
+
+
+def test_natural_language_query_is_fused(monkeypatch):
+    embeddings, _ = _index_docs(monkeypatch)
+
+    sources = asyncio.run(rag_service.retrieve_for_query("why was my upload rejected", limit=3))
+    assert len(embeddings.calls) == 1
+    assert {s.doc_id for s in sources} <= set(DOCS)
+    # "upload"/"rejected" are lexical hits for the limits doc, so fusion ranks it first
+    assert sources[0].doc_id == "limits"
+    assert all(0 < s.score <= 2 / (settings.rrf_k + 1) for s in sources)
+
+
+def test_lexical_index_follows_reindex_and_delete(monkeypatch):
+    _, index = _index_docs(monkeypatch)
+    assert index.stats()["chunks"] == 3
+
+    asyncio.run(rag_service.index_document("errors", "Error ERR-5000 is an internal failure."))
+    assert index.search("ERR-4031") == []
+    assert index.search("ERR-5000")[0].doc_id == "errors"
+
+    asyncio.run(rag_service.delete_document("errors"))
+    assert index.stats()["chunks"] == 2
@@ -0,0 +1,128 @@
+import asyncio
+
+import numpy as np
+
+from app.services import local_vector_store
+from app.services.local_vector_store import LocalVectorStore
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_search_matches_bruteforce_cosine():
+    """
+    Top-k from the local index should match a brute-force cosine ranking.
+    """
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    store = LocalVectorStore("test", 8)
+    ids = [f"p{i}" for i in range(len(vectors))]
+    _run(store.upsert(ids, vectors.tolist(), [{"doc_id": str(i % 3)} for i in range(300)]))
+
+    queries = rng.normal(size=(4, 8)).astype(np.float32)
+    results = _run(store.search_batch(queries.tolist(), limit=5))
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for q, hits in zip(queries, results):
+        expected = np.argsort(-(unit @ (q / np.linalg.norm(q))))[:5]
+        assert [h.id for h in hits] == [ids[i] for i in expected]
+        assert hits[0].score >= hits[-1].score
+
+
+def test_filter_delete_and_reuse():
+    store = LocalVectorStore("test", 2)
+    _run(store.upsert(
+        ["a", "b", "c"],
+        [[1, 0], [0.9, 0.1], [0, 1]],
+        [{"doc_id": "x"}, {"doc_id": "y"}, {"doc_id": "x"}],
+    ))
+
+    hits = _run(store.search([1, 0], limit=3, payload_filter={"doc_id": "y"}))
+    assert [h.id for h in hits] == ["b"]
+
+    _run(store.delete(["a"]))
+    hits = _run(store.search([1, 0], limit=3))
+    assert [h.id for h in hits] == ["b", "c"]
+
+    # Deleted row is reused instead of growing the matrix
+    _run(store.upsert(["d"], [[1, 0]], [{"doc_id": "z"}]))
+    assert store.count() == 3
+    assert len(store._ids) == 3
+
+
+def test_persists_across_restarts(tmp_path):
+    store = LocalVectorStore("docs", 2, str(tmp_path))
+    _run(store.upsert(["a", "b"], [[1, 0], [0, 1]], [{"doc_id": "x"}, {"doc_id": "y"}]))
+    _run(store.close())
+
+    reopened = LocalVectorStore("docs", 2, str(tmp_path))
+    hits = _run(reopened.search([0, 1], limit=1, with_vectors=True))
+    assert hits[0].id == "b"
+    assert hits[0].payload == {"doc_id": "y"}
+    assert hits[0].vector == [0.0, 1.0]
+
+
+def test_ensure_collection_is_checked_once():
+    """Collection state is cached after the first successful check."""
+
+    class CountingStore(LocalVectorStore):
+        checks = 0
+
+        async def _ensure_collection(self):
+            CountingStore.checks += 1
+
+    store = CountingStore("test", 2)
+    assert not store.ready
+    for _ in range(3):
+        _run(store.ensure_collection())
+    assert store.ready and CountingStore.checks == 1
+
+
+def test_quantized_search_rescoring_keeps_recall(monkeypatch):
+    """int8 and binary codes + full-precision rescoring should find (almost) the exact top-k."""
+    # Several scan blocks (the last one partial) exercise the running shortlist merge
+    monkeypatch.setattr(local_vector_store, "_SCAN_BLOCK", 128)
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    ids = [f"p{i}" for i in range(len(vectors))]
+    queries = rng.normal(size=(20, 64)).astype(np.float32)
+
+    exact_store = LocalVectorStore("exact", 64)
+    _run(exact_store.upsert(ids, vectors.tolist(), [{}] * len(ids)))
+    exact = _run(exact_store.search_batch(queries.tolist(), limit=10))
+
+    for quantization, min_recall in (("int8", 0.95), ("binary", 0.6)):
+        store = LocalVectorStore("q", 64, quantization=quantization, oversampling=4.0)
+        _run(store.upsert(ids, vectors.tolist(), [{}] * len(ids)))
+        approx = _run(store.search_batch(queries.tolist(), limit=10))
+        recall = np.mean([
+            len({h.id for h in a} & {h.id for h in e}) / 10 for a, e in zip(approx, exact)
+        ])
+        assert recall >= min_recall, (quantization, recall)
+        # Scores are exact cosines after rescoring
+        exact_scores = {h.id: h.score for h in exact[0]}
+        for h in approx[0]:
+            if h.id in exact_scores:
+                assert abs(h.score - exact_scores[h.id]) < 1e-5
+
+
+def test_exact_search_with_tombstones_and_selective_filters():
+    """Dead rows are ruled out in place; a selective filter still gathers its rows."""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 8)).astype(np.float32)
+    store = LocalVectorStore("test", 8)
+    ids = [f"p{i}" for i in range(200)]
+    _run(store.upsert(ids, vectors.tolist(), [{"doc_id": str(i % 10)} for i in range(200)]))
+    _run(store.delete(ids[::3]))
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = rng.normal(size=8).astype(np.float32)
+    order = np.argsort(-(unit @ (q / np.linalg.norm(q))))
+    alive = [i for i in order if i % 3]
+
+    hits = _run(store.search(q.tolist(), limit=150))
+    assert [h.id for h in hits] == [ids[i] for i in alive[:150]]
+
+    hits = _run(store.search(q.tolist(), limit=5, payload_filter={"doc_id": "4"}))
+    assert [h.id for h in hits] == [ids[i] for i in alive if i % 10 == 4][:5]
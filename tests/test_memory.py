@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+from app.services import memory
+
+
+def test_unknown_session_is_not_created():
+    store = memory.InMemorySessionStore(max_messages=4, max_sessions=10, ttl_seconds=60)
+    assert store.get("nope") == []
+    assert store.stats()["sessions"] == 0
+
+
+def test_lru_and_ttl_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(memory.time, "monotonic", lambda: now[0])
+    store = memory.InMemorySessionStore(max_messages=2, max_sessions=2, ttl_seconds=60)
+
+    for i in range(3):
+        store.append("a", "user", f"m{i}")
+    assert [c for _, c, _ in store.get("a")] == ["m1", "m2"]  # per-session cap
+
+    store.append("b", "user", "hi")
+    store.get("a")  # touch a, so b is least recently used
+    store.append("c", "user", "hi")
+    assert store.get("b") == []
+    assert store.stats()["evicted"] == 1
+
+    now[0] += 61
+    store.append("d", "user", "hi")
+    assert store.get("a") == [] and store.get("c") == []
+    assert store.stats()["expired"] == 2
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    """Two store instances on one file behave like two uvicorn workers."""
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_1 = memory.SqliteSessionStore(path, max_messages=3, max_sessions=100, ttl_seconds=60)
+    worker_2 = memory.SqliteSessionStore(path, max_messages=3, max_sessions=100, ttl_seconds=60)
+
+    worker_1.append("s", "user", "hello")
+    worker_2.append("s", "assistant", "hi there")
+    for i in range(3):
+        worker_1.append("s", "user", f"again {i}")
+
+    history = memory._as_dicts(worker_2.get("s"))
+    assert [m["content"] for m in history] == ["again 0", "again 1", "again 2"]
+    assert worker_1.stats()["messages"] == 3
+
+    worker_2.reset("s")
+    assert worker_1.get("s") == []
+
+
+def test_compaction_after_trimming_keeps_newer_turns(tmp_path):
+    """Turns trimmed while the summary is generated must not shift what compaction deletes."""
+    stores = [
+        memory.InMemorySessionStore(max_messages=4, max_sessions=10, ttl_seconds=60),
+        memory.SqliteSessionStore(
+            str(tmp_path / "sessions.sqlite3"), max_messages=4, max_sessions=10, ttl_seconds=60
+        ),
+    ]
+    for store in stores:
+        for i in range(4):
+            store.append("s", "user", f"m{i}")
+        head, upto = store.oldest("s", 2)
+        assert [c for _, c, _ in head] == ["m0", "m1"]
+
+        # Two newer turns arrive meanwhile and trim m0 and m1 themselves
+        store.append("s", "assistant", "m4")
+        store.append("s", "user", "m5")
+        store.compact("s", upto, "summary of m0-m1")
+
+        assert [c for _, c, _ in store.get("s")] == ["m2", "m3", "m4", "m5"]
+        assert store.get_summary("s").text == "summary of m0-m1"
+
+
+def test_sqlite_calls_run_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+
+    class SpyStore(memory.SqliteSessionStore):
+        def append(self, session_id, role, content):
+            threads.append(threading.get_ident())
+            super().append(session_id, role, content)
+
+    store = SpyStore(str(tmp_path / "s.sqlite3"), max_messages=3, max_sessions=10, ttl_seconds=60)
+    monkeypatch.setattr(memory, "_store", store)
+
+    async def turn():
+        await memory.append_message("s", "user", "hello")
+        return await memory.get_history("s")
+
+    assert [m["content"] for m in asyncio.run(turn())] == ["hello"]
+    assert threads and threading.get_ident() not in threads
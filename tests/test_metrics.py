@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import llm_service, metrics
+
+client = TestClient(app)
+
+
+def fake_get_client():
+    async def create(model, messages, temperature):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message={"content": "hi"})],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3),
+        )
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_chat_reports_stages_and_metrics(monkeypatch):
+    """
+    /chat should carry a Server-Timing header with its stages, and
+    /metrics should expose stage histograms and token usage.
+    """
+    monkeypatch.setattr(llm_service, "get_client", fake_get_client)
+    tokens_before = metrics.LLM_TOKENS.value(model="test-model", kind="prompt")
+
+    resp = client.post("/chat", json={"message": "Hi", "use_rag": False, "model": "test-model"})
+    assert resp.status_code == 200
+    timing = resp.headers["server-timing"]
+    assert "prompt_assembly;dur=" in timing and "llm;dur=" in timing
+    assert timing.split(", ")[-1].startswith("total;dur=")
+
+    assert metrics.LLM_TOKENS.value(model="test-model", kind="prompt") == tokens_before + 12
+
+    text = client.get("/metrics").text
+    assert 'ai_agent_stage_seconds_count{stage="llm"}' in text
+    assert 'ai_agent_llm_tokens_total{kind="completion",model="test-model"}' in text
+    assert 'ai_agent_http_request_seconds_count{method="POST",route="/chat",status="200"}' in text
+    assert 'ai_agent_sessions{kind="sessions"}' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("h", "test", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 5.0):
+        h.observe(v, stage="x")
+    lines = h.render()
+    assert 'h_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'h_bucket{stage="x",le="1"} 3' in lines
+    assert 'h_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'h_count{stage="x"} 4' in lines
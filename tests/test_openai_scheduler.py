@@ -0,0 +1,106 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from app.core.settings import settings
+from app.services import metrics, openai_scheduler
+
+
+def _rate_limit_error(retry_after_ms: str = "10") -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after-ms": retry_after_ms})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_parse_reset():
+    assert openai_scheduler.parse_reset("1s") == 1.0
+    assert openai_scheduler.parse_reset("6m0s") == 360.0
+    assert openai_scheduler.parse_reset("20ms") == 0.02
+    assert openai_scheduler.parse_reset("") is None
+
+
+def test_bucket_follows_rate_limit_headers():
+    bucket = openai_scheduler.TokenBucket(0)
+    assert bucket.delay(10_000, now=0.0) == 0.0  # unknown limit: unlimited
+
+    # 600 rpm, none left, full again in 0.1s -> one request in 0.1s
+    bucket.observe(limit=600, remaining=0, reset=0.1, now=0.0)
+    assert bucket.delay(1, now=0.0) == pytest.approx(0.1)
+    assert bucket.delay(1, now=0.1) == 0.0
+
+
+def test_retries_rate_limited_calls(monkeypatch):
+    monkeypatch.setattr(settings, "openai_max_retries", 3)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _rate_limit_error()
+        return "ok"
+
+    async def main():
+        scheduler = openai_scheduler.Scheduler(rpm=0, tpm=0, max_concurrency=8)
+        result = await scheduler.run(flaky, tokens=10, priority=openai_scheduler.INTERACTIVE)
+        return result, scheduler
+
+    before = metrics.OPENAI_RETRIES.value(reason="rate_limited")
+    result, scheduler = asyncio.run(main())
+    assert result == "ok"
+    assert len(attempts) == 3
+    assert metrics.OPENAI_RETRIES.value(reason="rate_limited") == before + 2
+    assert scheduler.limit < 8  # backed off on the 429s
+    assert scheduler.in_flight == 0
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(settings, "openai_max_retries", 1)
+
+    async def always_limited():
+        raise _rate_limit_error("1")
+
+    async def main():
+        scheduler = openai_scheduler.Scheduler(rpm=0, tpm=0, max_concurrency=2)
+        with pytest.raises(openai.RateLimitError):
+            await scheduler.run(always_limited, tokens=1, priority=openai_scheduler.INTERACTIVE)
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_interactive_calls_jump_the_queue():
+    order = []
+
+    async def main():
+        scheduler = openai_scheduler.Scheduler(rpm=0, tpm=0, max_concurrency=1)
+        await scheduler.acquire(openai_scheduler.INTERACTIVE, 0, timeout=1)  # hold the only slot
+
+        async def call(name, priority):
+            await scheduler.acquire(priority, 0, timeout=1)
+            order.append(name)
+            scheduler.release("ok")
+
+        background = asyncio.create_task(call("background", openai_scheduler.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", openai_scheduler.INTERACTIVE))
+        await asyncio.sleep(0)
+        scheduler.release("ok")
+        await asyncio.gather(background, interactive)
+
+    asyncio.run(main())
+    assert order == ["interactive", "background"]
+
+
+def test_queue_timeout_when_out_of_requests():
+    async def main():
+        scheduler = openai_scheduler.Scheduler(rpm=1, tpm=0, max_concurrency=4)
+        await scheduler.acquire(openai_scheduler.INTERACTIVE, 0, timeout=1)
+        scheduler.release("ok")
+        # The single request per minute is used up
+        with pytest.raises(openai_scheduler.SchedulerTimeout):
+            await scheduler.acquire(openai_scheduler.INTERACTIVE, 0, timeout=0.05)
+        assert scheduler.stats()["queued"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+from app.models.schemas import RetrievedSource
+from app.services import memory, prompt_budget
+from app.services.tokens import count_message_tokens
+
+
+def _turns(n):
+    history = []
+    for i in range(n):
+        content = f"turn {i} " + "words " * 40
+        history.append({"role": "user", "content": content, "tokens": count_message_tokens(content)})
+    return history
+
+
+def test_history_is_trimmed_to_budget_newest_first():
+    history = _turns(30)
+    plan = prompt_budget.assemble("sys", [], history, None, "hello", budget=500)
+
+    assert plan.prompt_tokens <= 500
+    assert plan.overflow > 0
+    kept = [m["content"] for m in plan.messages[1:-1]]
+    assert kept == [m["content"] for m in history[plan.overflow:]]
+    assert plan.messages[-1] == {"role": "user", "content": "hello"}
+
+
+def test_context_share_drops_low_ranked_sources():
+    sources = [
+        RetrievedSource(doc_id=f"d{i}", title=f"T{i}", text="context " * 60, score=1 - i / 10)
+        for i in range(5)
+    ]
+    plan = prompt_budget.assemble("sys", sources, [], None, "q", budget=400)
+    assert 0 < len(plan.sources) < 5
+    assert [s.doc_id for s in plan.sources] == [f"d{i}" for i in range(len(plan.sources))]
+    assert plan.prompt_tokens <= 400
+
+
+def test_summary_is_included_before_history():
+    summary = memory.Summary("user likes cats", count_message_tokens("user likes cats"))
+    plan = prompt_budget.assemble("sys", [], _turns(2), summary, "q", budget=4000)
+    assert plan.messages[1]["content"].endswith("user likes cats")
+    assert plan.overflow == 0
+
+
+def test_compaction_replaces_oldest_turns():
+    store = memory.InMemorySessionStore(max_messages=10, max_sessions=10, ttl_seconds=60)
+    for i in range(4):
+        store.append("s", "user", f"m{i}")
+    store.compact("s", 3, "summary of m0-m2")
+    assert [c for _, c, _ in store.get("s")] == ["m3"]
+    assert store.get_summary("s").text == "summary of m0-m2"
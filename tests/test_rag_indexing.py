@@ -0,0 +1,172 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.settings import settings
+from app.services import doc_manifest, embedding_cache, rag_service
+from app.services.local_vector_store import LocalVectorStore
+
+
+class FakeEmbeddings:
+    """
+    Fake OpenAI embeddings endpoint.
+    Records every call so tests can count round-trips.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, model, input):
+        inputs = input if isinstance(input, list) else [input]
+        self.calls.append(inputs)
+        # Return items reversed to make sure callers sort by index
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(t)), 1.0])
+            for i, t in enumerate(inputs)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+class RecordingStore(LocalVectorStore):
+    """In-memory local store that remembers each upsert page."""
+
+    def __init__(self):
+        super().__init__("test", 2)
+        self.upserts = []
+
+    async def upsert(self, ids, vectors, payloads):
+        self.upserts.append(list(payloads))
+        await super().upsert(ids, vectors, payloads)
+
+
+def test_batch_chunks_respects_limits():
+    chunks = ["a" * 10] * 7
+    batches = list(rag_service._batch_chunks(chunks, max_items=3, max_chars=25))
+    # 25 chars fits only two 10-char chunks per batch
+    assert [len(b) for b in batches] == [2, 2, 2, 1]
+
+
+def test_index_document_batches_and_pages(monkeypatch):
+    """
+    index_document should make O(chunks/batch) embedding calls
+    and upsert in pages instead of one giant list.
+    """
+    embeddings = FakeEmbeddings()
+    store = RecordingStore()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(settings, "embed_batch_size", 4)
+    monkeypatch.setattr(settings, "upsert_page_size", 5)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+
+    # Distinct sentences: identical in-flight batches would be coalesced
+    text = "".join(f"Sentence {i} is about vectors. " for i in range(400))
+    result = asyncio.run(rag_service.index_document("doc-1", text, source="Doc One"))
+
+    n_chunks = len(list(rag_service._chunk_text(text)))
+    assert n_chunks > 8
+    assert result.chunks == result.embedded == n_chunks
+    assert len(embeddings.calls) == -(-n_chunks // 4)
+    assert all(len(page) <= 5 for page in store.upserts)
+    assert store.count() == n_chunks
+
+    payloads = [p for page in store.upserts for p in page]
+    assert [p["chunk_index"] for p in payloads] == list(range(n_chunks))
+    assert payloads[0]["source"] == "Doc One"
+
+
+def test_embed_texts_uses_cache(monkeypatch, tmp_path):
+    """
+    Repeated strings should only hit the embeddings API once,
+    and the SQLite tier should serve them after a restart.
+    """
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    path = str(tmp_path / "emb.sqlite3")
+    cache = embedding_cache.EmbeddingCache(max_items=10, path=path)
+    monkeypatch.setattr(embedding_cache, "get_cache", lambda: cache)
+
+    first = asyncio.run(rag_service.embed_texts(["faq", "faq", "other"]))
+    second = asyncio.run(rag_service.embed_texts(["faq"]))
+    assert embeddings.calls == [["faq", "other"]]
+    assert first[0] == first[1] == second[0]
+    assert cache.stats()["memory_hits"] == 1
+
+    # New process: empty LRU, same file
+    restarted = embedding_cache.EmbeddingCache(max_items=10, path=path)
+    monkeypatch.setattr(embedding_cache, "get_cache", lambda: restarted)
+    assert asyncio.run(rag_service.embed_texts(["other"])) == [first[2]]
+    assert len(embeddings.calls) == 1
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_reindex_only_embeds_changed_chunks(monkeypatch):
+    """
+    Re-indexing the same doc_id with deterministic ids should embed only
+    new chunks, delete stale ones, and never duplicate points.
+    """
+    embeddings = FakeEmbeddings()
+    store = RecordingStore()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "chunk_tokens", 20)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 0)
+    manifest = doc_manifest.DocManifest()
+
+    paras = [f"Paragraph {i} talks about topic number {i} in detail." for i in range(6)]
+    first = asyncio.run(rag_service.index_document("doc", "\n\n".join(paras)))
+    assert first.embedded == first.chunks == 6
+
+    # Same text again: nothing to embed
+    again = asyncio.run(rag_service.index_document("doc", "\n\n".join(paras)))
+    assert again.embedded == 0 and again.deleted == 0
+
+    # Edit one paragraph, drop the first one
+    paras[3] = "Paragraph 3 was rewritten completely."
+    changed = asyncio.run(rag_service.index_document("doc", "\n\n".join(paras[1:])))
+    assert changed.embedded == 1
+    assert changed.deleted == 2  # old paragraph 0 and old paragraph 3
+    assert changed.moved == 4    # the rest shifted one position
+    assert store.count() == 5
+
+    hits = asyncio.run(store.search([1.0, 1.0], limit=10))
+    assert sorted(h.payload["chunk_index"] for h in hits) == list(range(5))
+
+
+def test_failed_index_leaves_no_untracked_points(monkeypatch):
+    """Pages written before an upsert failure are in the manifest, so they can be deleted."""
+    embeddings = FakeEmbeddings()
+
+    class FailingStore(RecordingStore):
+        async def upsert(self, ids, vectors, payloads):
+            if len(self.upserts) == 2:
+                raise RuntimeError("vector store unavailable")
+            await super().upsert(ids, vectors, payloads)
+
+    store = FailingStore()
+    manifest = doc_manifest.DocManifest()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "upsert_page_size", 3)
+
+    text = "".join(f"Sentence {i} is about vectors. " for i in range(400))
+    try:
+        asyncio.run(rag_service.index_document("doc", text))
+        raise AssertionError("index_document should fail")
+    except RuntimeError:
+        pass
+    assert store.count() == 6 and len(manifest.load("doc")) == 6
+
+    assert asyncio.run(rag_service.delete_document("doc")) == 6
+    assert store.count() == 0
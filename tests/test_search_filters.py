@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from qdrant_client.http import models as qmodels
+
+from app.core.settings import settings
+from app.main import app
+from app.services import chunk_store, doc_manifest, lexical_index, rag_service, vector_store
+from app.services.local_vector_store import LocalVectorStore
+from tests.test_rag_indexing import FakeEmbeddings
+
+client = TestClient(app)
+
+DOCS = [
+    # (tenant, doc_id, tags, created_at, text)
+    ("acme", "faq", ["billing"], datetime(2024, 1, 10), "Refunds for ACME orders take five days."),
+    ("acme", "policy", ["legal"], datetime(2024, 6, 1), "Refunds require the original receipt."),
+    ("globex", "faq", ["billing"], datetime(2024, 3, 5), "Refunds for Globex orders take ten days."),
+]
+
+
+def _setup(monkeypatch, mode="hybrid"):
+    embeddings = FakeEmbeddings()
+    store = LocalVectorStore("test", 2)
+    index = lexical_index.LexicalIndex()
+    manifest = doc_manifest.DocManifest()
+    chunks = chunk_store.ChunkStore()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(rag_service, "get_store", lambda: store)
+    monkeypatch.setattr(lexical_index, "get_index", lambda: index)
+    monkeypatch.setattr(doc_manifest, "get_manifest", lambda: manifest)
+    monkeypatch.setattr(chunk_store, "get_chunk_store", lambda: chunks)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(settings, "retrieval_mode", mode)
+    monkeypatch.setattr(settings, "retrieval_diversify", False)
+    monkeypatch.setattr(settings, "retrieval_min_score", 0.0)
+    for tenant, doc_id, tags, created_at, text in DOCS:
+        asyncio.run(
+            rag_service.index_document(doc_id, text, tags=tags, tenant=tenant, created_at=created_at)
+        )
+    return store
+
+
+def _search(filter=None, query="refunds"):
+    resp = client.post("/docs/search", json={"query": query, "limit": 5, "filter": filter})
+    assert resp.status_code == 200, resp.text
+    return sorted(r["text"] for r in resp.json()["results"])
+
+
+def test_same_doc_id_is_separate_per_tenant(monkeypatch):
+    store = _setup(monkeypatch)
+    assert store.count() == 3
+
+    assert _search({"tenant": "globex"}) == ["Refunds for Globex orders take ten days."]
+    assert len(_search({"tenant": "acme"})) == 2
+
+    asyncio.run(rag_service.delete_document("faq", tenant="acme"))
+    assert _search({"tenant": "acme", "doc_ids": ["faq"]}) == []
+    assert len(_search({"tenant": "globex", "doc_ids": ["faq"]})) == 1
+
+
+def test_tag_and_date_filters(monkeypatch):
+    for mode in ("hybrid", "vector"):
+        _setup(monkeypatch, mode)
+        assert _search({"tags": ["legal"]}) == ["Refunds require the original receipt."]
+        assert _search({"tenant": "acme", "tags": ["billing", "legal"]}) == [
+            "Refunds for ACME orders take five days.",
+            "Refunds require the original receipt.",
+        ]
+        assert _search({"created_after": "2024-02-01", "created_before": "2024-05-01"}) == [
+            "Refunds for Globex orders take ten days."
+        ]
+
+
+def test_reindex_with_new_metadata_updates_payloads(monkeypatch):
+    store = _setup(monkeypatch)
+    result = asyncio.run(rag_service.index_document(
+        "policy", DOCS[1][4], source="Policy v2", tags=["archived"], tenant="acme",
+        created_at=DOCS[1][3],
+    ))
+    assert result.embedded == 0 and result.moved == 0
+
+    for mode in ("hybrid", "vector"):
+        monkeypatch.setattr(settings, "retrieval_mode", mode)
+        assert _search({"tenant": "acme", "tags": ["archived"]}) == ["Refunds require the original receipt."]
+        assert _search({"tenant": "acme", "tags": ["legal"]}) == []
+    hits = asyncio.run(store.search([1, 0], limit=5, payload_filter={"tags": "archived"}))
+    assert [h.payload["source"] for h in hits] == ["Policy v2"]
+
+
+def test_multitenant_requires_a_tenant(monkeypatch):
+    _setup(monkeypatch)
+    monkeypatch.setattr(settings, "multitenant", True)
+
+    assert client.post("/docs/search", json={"query": "refunds"}).status_code == 422
+    assert client.post("/docs/index", json={"doc_id": "a", "text": "x"}).status_code == 422
+    assert client.post("/chat", json={"message": "hi", "filter": {"tags": ["x"]}}).status_code == 422
+    assert len(_search({"tenant": "acme"})) == 2
+
+
+def test_local_value_index_follows_updates():
+    store = LocalVectorStore("test", 2)
+    asyncio.run(store.upsert(
+        ["a", "b"], [[1, 0], [0, 1]], [{"tenant": "t1", "tags": ["x"]}, {"tenant": "t2"}]
+    ))
+    asyncio.run(store.update_payloads(["a"], [{"tenant": "t2", "tags": ["y"]}]))
+
+    hits = asyncio.run(store.search([1, 0], limit=5, payload_filter={"tenant": "t2"}))
+    assert [h.id for h in hits] == ["a", "b"]
+    assert asyncio.run(store.search([1, 0], payload_filter={"tags": ["x"]})) == []
+
+    asyncio.run(store.delete(["a"]))
+    hits = asyncio.run(store.search([1, 0], payload_filter={"tenant": "t2", "tags": "y"}))
+    assert hits == []
+
+
+def test_qdrant_collection_gets_payload_indexes(monkeypatch):
+    calls = []
+
+    class FakeQdrant:
+        async def collection_exists(self, name):
+            return False
+
+        async def create_collection(self, **kwargs):
+            calls.append(("create", kwargs["hnsw_config"]))
+
+        async def create_payload_index(self, collection_name, field_name, field_schema):
+            calls.append((field_name, field_schema))
+
+    monkeypatch.setattr(vector_store, "get_qdrant", lambda: FakeQdrant())
+    monkeypatch.setattr(settings, "multitenant", True)
+    asyncio.run(vector_store.QdrantVectorStore("docs", 2).ensure_collection())
+
+    created = dict(calls)
+    assert created["create"].m == 0 and created["create"].payload_m == 16
+    assert created["tenant"].is_tenant
+    assert created["created_at"] == qmodels.PayloadSchemaType.FLOAT
+    assert {"doc_id", "tags"} <= set(created)
+
+    qfilter = vector_store._to_qdrant_filter({"tags": ["a"], "created_at": {"gte": 1.0, "lt": None}})
+    assert qfilter.must[1].range.gte == 1.0
@@ -0,0 +1,25 @@
+from app.services import semantic_cache
+
+
+def test_entries_are_written_in_place_and_slots_reused(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    cache = semantic_cache.SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=2)
+
+    cache.store("s", [1, 0], "a", "reply a", [])
+    matrix = cache._vectors
+    now[0] += 1
+    cache.store("s", [0, 1], "b", "reply b", [])
+    now[0] += 1
+    assert cache.lookup("s", [1, 0.01]).reply == "reply a"
+    assert cache.lookup("other", [1, 0]) is None
+
+    # Full: the least recently used entry (b) makes room
+    cache.store("s", [1, 1], "c", "reply c", [])
+    assert cache.lookup("s", [0, 1]) is None
+    assert cache.lookup("s", [1, 1]).reply == "reply c"
+    assert cache._vectors is matrix and matrix.shape == (2, 2)
+
+    now[0] += 61
+    assert cache.lookup("s", [1, 0]) is None
+    assert cache.stats() == {"entries": 0, "hits": 2, "misses": 3, "evictions": 3}
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.core.settings import settings
+from app.services import llm_service, rag_service
+from app.services.single_flight import SingleFlight
+
+
+class SlowEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, model, input):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=[1.0, 0.0]) for i in range(len(input))]
+        )
+
+
+def test_concurrent_identical_embeddings_share_one_call(monkeypatch):
+    embeddings = SlowEmbeddings()
+    monkeypatch.setattr(
+        rag_service, "get_embeddings_client", lambda: SimpleNamespace(embeddings=embeddings)
+    )
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+
+    async def burst():
+        return await asyncio.gather(*(rag_service.embed_text("popular question") for _ in range(20)))
+
+    vectors = asyncio.run(burst())
+    assert embeddings.calls == 1
+    assert all(v == [1.0, 0.0] for v in vectors)
+
+    # Settled calls are not cached: a later call goes upstream again
+    asyncio.run(rag_service.embed_text("popular question"))
+    assert embeddings.calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+    started = []
+
+    async def upstream():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "result"
+    assert started == [1]
+    assert flight.stats()["shared"] == 1
+
+
+def test_completion_coalescing_is_opt_in_and_deterministic_only(monkeypatch):
+    calls = []
+
+    async def create(model, messages, temperature):
+        calls.append(temperature)
+        await asyncio.sleep(0.02)
+        return SimpleNamespace(choices=[SimpleNamespace(message={"content": "hi"})])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    messages = [{"role": "user", "content": "hello"}]
+
+    async def burst(temperature):
+        await asyncio.gather(*(
+            llm_service._create_completion(client, "m", messages, temperature) for _ in range(5)
+        ))
+
+    asyncio.run(burst(0))
+    assert len(calls) == 5  # off by default
+
+    monkeypatch.setattr(settings, "single_flight_completions", True)
+    calls.clear()
+    asyncio.run(burst(0))
+    assert len(calls) == 1
+    calls.clear()
+    asyncio.run(burst(0.7))
+    assert len(calls) == 5
@@ -0,0 +1,213 @@
+import asyncio
+import ipaddress
+
+import httpx
+
+from app.core.settings import settings
+from app.services import tools
+
+
+def _use_transport(monkeypatch, handler):
+    requests = []
+
+    def recording(request):
+        requests.append(request)
+        return handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(recording), follow_redirects=True)
+    monkeypatch.setattr(tools, "_http", client)
+    monkeypatch.setattr(tools, "_cache", type(tools._cache)())
+    monkeypatch.setattr(tools, "_resolve", _fake_resolve)
+    return requests
+
+
+async def _fake_resolve(host, port):
+    # IP literals resolve to themselves; *.internal names to the private network
+    try:
+        return [str(ipaddress.ip_address(host))]
+    except ValueError:
+        return ["10.0.0.5"] if host.endswith(".internal") else ["93.184.216.34"]
+
+
+def test_fetch_streams_and_stops_at_byte_cap(monkeypatch):
+    monkeypatch.setattr(settings, "fetch_max_bytes", 1000)
+    monkeypatch.setattr(settings, "fetch_snippet_chars", 50)
+
+    async def endless():
+        for _ in range(10_000):
+            yield b"x" * 100
+
+    _use_transport(monkeypatch, lambda r: httpx.Response(200, content=endless()))
+    data = asyncio.run(tools.fetch_url("https://example.test/big"))
+    assert data["truncated"] is True
+    assert data["snippet"] == "x" * 50
+
+
+def test_fetch_cache_fresh_then_revalidated(monkeypatch):
+    """max-age serves from cache; once stale, a 304 reuses the cached body."""
+    def handler(request):
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"cache-control": "max-age=0"})
+        return httpx.Response(
+            200,
+            text="hello",
+            headers={"etag": '"v1"', "cache-control": "max-age=60"},
+        )
+
+    requests = _use_transport(monkeypatch, handler)
+    first = asyncio.run(tools.fetch_url("https://example.test/page"))
+    second = asyncio.run(tools.fetch_url("https://example.test/page"))
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert len(requests) == 1
+
+    # Expire the entry: next call revalidates with the ETag
+    url = "https://example.test/page"
+    tools._cache[url] = tools._cache[url]._replace(fresh_until=0.0)
+    third = asyncio.run(tools.fetch_url(url))
+    assert len(requests) == 2 and requests[1].headers["if-none-match"] == '"v1"'
+    assert third["cached"] is True and third["snippet"] == "hello"
+
+
+def test_fetch_no_store_is_not_cached(monkeypatch):
+    requests = _use_transport(
+        monkeypatch,
+        lambda r: httpx.Response(200, text="x", headers={"cache-control": "no-store", "etag": "a"}),
+    )
+    for _ in range(2):
+        asyncio.run(tools.fetch_url("https://example.test/private"))
+    assert len(requests) == 2
+
+
+def test_fetch_refuses_non_public_targets(monkeypatch):
+    requests = _use_transport(monkeypatch, lambda r: httpx.Response(200, text="secret"))
+    for url in (
+        "file:///etc/passwd",
+        "http://127.0.0.1:8000/ready",
+        "http://[::ffff:169.254.169.254]/latest/meta-data",
+        "https://db.internal/",
+    ):
+        assert "error" in asyncio.run(tools.fetch_url(url)), url
+    assert requests == []
+
+
+def test_fetch_checks_every_redirect_hop(monkeypatch):
+    def handler(request):
+        if request.url.path == "/hop":
+            return httpx.Response(302, headers={"location": "https://example.test/final"})
+        if request.url.path == "/final":
+            return httpx.Response(200, text="ok")
+        return httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data"})
+
+    requests = _use_transport(monkeypatch, handler)
+    assert asyncio.run(tools.fetch_url("https://example.test/hop"))["snippet"] == "ok"
+
+    blocked = asyncio.run(tools.fetch_url("https://example.test/evil"))
+    assert "non-public" in blocked["error"]
+    assert [r.url.host for r in requests] == ["example.test"] * 3
+
+
+def test_fetch_allowed_hosts(monkeypatch):
+    monkeypatch.setattr(settings, "fetch_allowed_hosts", ("example.test",))
+    _use_transport(monkeypatch, lambda r: httpx.Response(200, text="ok"))
+    assert asyncio.run(tools.fetch_url("https://docs.example.test/a"))["snippet"] == "ok"
+    assert "FETCH_ALLOWED_HOSTS" in asyncio.run(tools.fetch_url("https://other.test/"))["error"]
+
+
+def test_fetch_returns_live_headers_and_skips_cookies(monkeypatch):
+    requests = _use_transport(
+        monkeypatch,
+        lambda r: httpx.Response(
+            200,
+            text="x",
+            headers={"cache-control": "max-age=60", "set-cookie": "sid=1", "x-internal": "y"},
+        ),
+    )
+    for _ in range(2):
+        data = asyncio.run(tools.fetch_url("https://example.test/login"))
+    assert data["headers"]["set-cookie"] == "sid=1" and data["headers"]["x-internal"] == "y"
+    assert data["cached"] is False and len(requests) == 2
+
+
+def test_cache_stores_only_validator_headers(monkeypatch):
+    _use_transport(
+        monkeypatch,
+        lambda r: httpx.Response(200, text="x", headers={"cache-control": "max-age=60", "x-trace": "1"}),
+    )
+    live = asyncio.run(tools.fetch_url("https://example.test/a"))
+    cached = asyncio.run(tools.fetch_url("https://example.test/a"))
+    assert live["headers"]["x-trace"] == "1"
+    assert cached["cached"] is True
+    assert set(cached["headers"]) == {"cache-control", "content-type"}
+
+
+def test_validators_are_not_sent_to_other_redirect_targets(monkeypatch):
+    moved = []
+
+    def handler(request):
+        if request.url.path == "/old":
+            location = "/elsewhere" if moved else "/page"
+            return httpx.Response(302, headers={"location": f"https://example.test{location}"})
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=request.url.path, headers={"etag": '"v1"'})
+
+    requests = _use_transport(monkeypatch, handler)
+    asyncio.run(tools.fetch_url("https://example.test/old"))
+    # Same target: only the hop to /page (where the ETag came from) revalidates
+    assert asyncio.run(tools.fetch_url("https://example.test/old"))["cached"] is True
+    moved.append(True)
+    data = asyncio.run(tools.fetch_url("https://example.test/old"))
+
+    assert data["snippet"] == "/elsewhere" and data["cached"] is False
+    sent = [(r.url.path, "if-none-match" in r.headers) for r in requests]
+    assert sent == [
+        ("/old", False), ("/page", False),
+        ("/old", False), ("/page", True),
+        ("/old", False), ("/elsewhere", False),
+    ]
+
+
+def test_connections_go_to_the_checked_addresses(monkeypatch):
+    connected = []
+
+    class FakeBackend:
+        async def connect_tcp(self, host, port, **kwargs):
+            connected.append((host, port))
+            return "stream"
+
+    answers = iter([["93.184.216.34"], ["127.0.0.1"]])
+
+    async def resolve(host, port):
+        return next(answers)
+
+    monkeypatch.setattr(tools, "_resolve", resolve)
+    backend = tools._PublicOnlyBackend(FakeBackend())
+    assert asyncio.run(backend.connect_tcp("example.test", 443)) == "stream"
+    assert connected == [("93.184.216.34", 443)]
+
+    try:
+        asyncio.run(backend.connect_tcp("example.test", 443))
+        raise AssertionError("rebound host was connected to")
+    except tools.BlockedURL:
+        pass
+    assert len(connected) == 1
+
+
+def test_dns_rebinding_after_the_check_is_refused(monkeypatch):
+    """The name passes _check_url, then re-resolves to loopback for the connection."""
+    answers = iter([["93.184.216.34"], ["127.0.0.1"]])
+
+    async def resolve(host, port):
+        return next(answers)
+
+    monkeypatch.setattr(tools, "_resolve", resolve)
+    monkeypatch.setattr(tools, "_http", None)
+    monkeypatch.setattr(tools, "_cache", type(tools._cache)())
+
+    async def fetch():
+        try:
+            return await tools.fetch_url("http://rebind.example.test/")
+        finally:
+            await tools.aclose()
+
+    assert "non-public address 127.0.0.1" in asyncio.run(fetch())["error"]